@@ -0,0 +1,60 @@
+import json
+from datetime import date
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.async_services import aconvert_amount, aget_exchange_rate_data
+from .serializers import ConvertAmountSerializer, ExchangeRateLookupSerializer
+
+def _json_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+@csrf_exempt
+@require_POST
+async def convert(request):
+    """Async counterpart of ``rates/convert`` for ASGI deployments."""
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return _json_response({"error": "Invalid JSON body"}, status=400)
+
+    serializer = ConvertAmountSerializer(data=payload)
+    if not serializer.is_valid():
+        return _json_response(serializer.errors, status=400)
+
+    data = serializer.validated_data
+    result = await aconvert_amount(
+        source_currency=data['source_currency'],
+        amount=data['amount'],
+        exchanged_currency=data['exchanged_currency'],
+        valuation_date=data.get('valuation_date'),
+        allow_derived=data.get('allow_derived')
+    )
+
+    if not result.get('success'):
+        return _json_response({"error": result.get('error', 'Conversion failed')}, status=400)
+
+    return _json_response(result)
+
+@require_GET
+async def rate(request):
+    serializer = ExchangeRateLookupSerializer(data=request.GET)
+    if not serializer.is_valid():
+        return _json_response(serializer.errors, status=400)
+
+    data = serializer.validated_data
+    result = await aget_exchange_rate_data(
+        source_currency=data['source_currency'],
+        exchanged_currency=data['exchanged_currency'],
+        valuation_date=data.get('valuation_date') or date.today(),
+        provider=data.get('provider') or None,
+        allow_derived=data.get('allow_derived')
+    )
+
+    if not result.get('success'):
+        return _json_response({"error": result.get('error', 'Rate not found')}, status=404)
+
+    return _json_response(result)
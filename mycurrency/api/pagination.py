@@ -0,0 +1,22 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """Cursor pagination on a unique, indexed ordering, so every page is a
+    single index range scan regardless of how deep the client pages."""
+    page_size_query_param = 'page_size'
+
+    def __init__(self):
+        self.page_size = settings.API_PAGE_SIZE
+        self.max_page_size = settings.API_MAX_PAGE_SIZE
+
+
+class CurrencyPagination(KeysetPagination):
+    ordering = 'code'
+
+
+class CurrencyExchangeRatePagination(KeysetPagination):
+    # The primary key keeps the cursor exact; valuation_date is not unique
+    # and would make DRF fall back to offsets within a date.
+    ordering = '-id'
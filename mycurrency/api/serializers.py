@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from django.conf import settings
 from core.models import Currency, CurrencyExchangeRate
 from datetime import date
 
@@ -19,6 +20,21 @@ class CurrencyExchangeRateSerializer(serializers.ModelSerializer):
             'valuation_date', 'rate_value', 'provider'
         ]
 
+class CurrencyExchangeRateFilterSerializer(serializers.Serializer):
+    source_currency = serializers.CharField(max_length=3, required=False)
+    exchanged_currency = serializers.CharField(max_length=3, required=False)
+    provider = serializers.CharField(max_length=50, required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    
+    def validate(self, data):
+        if data.get('date_from') and data.get('date_to') and data['date_from'] > data['date_to']:
+            raise serializers.ValidationError("date_from must be before date_to")
+        return data
+
+class CurrencyExchangeRateExportSerializer(CurrencyExchangeRateFilterSerializer):
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+
 class CurrencyRatesListSerializer(serializers.Serializer):
     source_currency = serializers.CharField(max_length=3)
     date_from = serializers.DateField()
@@ -28,4 +44,37 @@ class ConvertAmountSerializer(serializers.Serializer):
     source_currency = serializers.CharField(max_length=3)
     amount = serializers.DecimalField(max_digits=18, decimal_places=2)
     exchanged_currency = serializers.CharField(max_length=3)
-    valuation_date = serializers.DateField(required=False, default=date.today)
\ No newline at end of file
+    valuation_date = serializers.DateField(required=False, default=date.today)
+    allow_derived = serializers.BooleanField(required=False, allow_null=True, default=None)
+
+class ExchangeRateLookupSerializer(serializers.Serializer):
+    source_currency = serializers.CharField(max_length=3)
+    exchanged_currency = serializers.CharField(max_length=3)
+    valuation_date = serializers.DateField(required=False, default=date.today)
+    provider = serializers.CharField(required=False, allow_blank=True)
+    allow_derived = serializers.BooleanField(required=False, allow_null=True, default=None)
+
+class ConvertTimeseriesSerializer(serializers.Serializer):
+    source_currency = serializers.CharField(max_length=3)
+    amount = serializers.DecimalField(max_digits=18, decimal_places=2)
+    exchanged_currency = serializers.CharField(max_length=3)
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    fill = serializers.ChoiceField(choices=['previous', 'interpolate', 'none'], default='previous')
+
+    def validate(self, data):
+        if data['date_from'] > data['date_to']:
+            raise serializers.ValidationError("date_from must not be after date_to.")
+        max_days = settings.TIMESERIES['max_days']
+        if (data['date_to'] - data['date_from']).days + 1 > max_days:
+            raise serializers.ValidationError(f"A time series can span at most {max_days} days.")
+        return data
+
+class ConvertBatchSerializer(serializers.Serializer):
+    items = ConvertAmountSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, value):
+        max_items = settings.CONVERT_BATCH_MAX_ITEMS
+        if len(value) > max_items:
+            raise serializers.ValidationError(f"A batch can contain at most {max_items} items.")
+        return value
\ No newline at end of file
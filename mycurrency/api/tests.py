@@ -1 +1,406 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+import json
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from core.cache import currency_codes, rate_cache
+from core.models import Currency, CurrencyExchangeRate
+from core.services import _save_exchange_rates
+from core.snapshots import refresh_rate_snapshots
+
+
+class RatesListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.eur = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        cls.usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        cls.gbp = Currency.objects.create(code='GBP', name='British Pound', symbol='£')
+        cls.start = date(2024, 1, 1)
+
+        rates = []
+        for offset in range(30):
+            valuation_date = cls.start + timedelta(days=offset)
+            rates.append(CurrencyExchangeRate(
+                source_currency=cls.eur,
+                exchanged_currency=cls.usd,
+                valuation_date=valuation_date,
+                rate_value=Decimal('1.08'),
+                provider='mock'
+            ))
+            if offset % 2 == 0:
+                rates.append(CurrencyExchangeRate(
+                    source_currency=cls.eur,
+                    exchanged_currency=cls.gbp,
+                    valuation_date=valuation_date,
+                    rate_value=Decimal('0.85'),
+                    provider='mock'
+                ))
+        CurrencyExchangeRate.objects.bulk_create(rates)
+        refresh_rate_snapshots({('EUR', rate.valuation_date) for rate in rates})
+
+    def setUp(self):
+        self.client = APIClient()
+        currency_codes.invalidate()
+
+    def _rates_list(self, days):
+        response = self.client.post('/api/rates/rates_list/', {
+            'source_currency': 'EUR',
+            'date_from': self.start.isoformat(),
+            'date_to': (self.start + timedelta(days=days - 1)).isoformat(),
+        }, format='json')
+        if response.streaming:
+            return response.status_code, json.loads(b''.join(response.streaming_content))
+        return response.status_code, response.json()
+
+    def test_pivots_rates_per_date(self):
+        status_code, data = self._rates_list(2)
+
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data, [
+            {'date': '2024-01-01', 'USD': 1.08, 'GBP': 0.85},
+            {'date': '2024-01-02', 'USD': 1.08},
+        ])
+
+    def test_uses_provider_priority(self):
+        _save_exchange_rates([{
+            'source_currency': 'EUR',
+            'exchanged_currency': 'USD',
+            'valuation_date': self.start,
+            'rate_value': Decimal('1.10'),
+            'provider': 'currencybeacon',
+        }])
+
+        _, data = self._rates_list(1)
+
+        self.assertEqual(data, [{'date': '2024-01-01', 'USD': 1.1, 'GBP': 0.85}])
+
+    def test_query_count_is_constant(self):
+        # The first request also loads the currency code map.
+        with self.assertNumQueries(2):
+            self._rates_list(2)
+        with self.assertNumQueries(1):
+            self._rates_list(2)
+        with self.assertNumQueries(1):
+            self._rates_list(30)
+
+    def test_streamed_output_matches_buffered_output(self):
+        _, buffered = self._rates_list(30)
+        with override_settings(RATES_LIST_STREAM_THRESHOLD_DAYS=1):
+            _, streamed = self._rates_list(30)
+
+        self.assertEqual(streamed, buffered)
+
+    def test_empty_window_returns_not_found(self):
+        response = self.client.post('/api/rates/rates_list/', {
+            'source_currency': 'EUR',
+            'date_from': '2023-01-01',
+            'date_to': '2023-01-31',
+        }, format='json')
+
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(RATE_SNAPSHOTS={'enabled': False})
+class RatesListRowScanTests(RatesListTests):
+    """The same requests answered from the rates table (_pivot_rates)."""
+
+    def test_zero_rates_lose_to_lower_priorities(self):
+        CurrencyExchangeRate.objects.create(
+            source_currency=self.eur,
+            exchanged_currency=self.usd,
+            valuation_date=self.start,
+            rate_value=Decimal('0'),
+            provider='currencybeacon'
+        )
+        CurrencyExchangeRate.objects.create(
+            source_currency=self.eur,
+            exchanged_currency=self.gbp,
+            valuation_date=self.start,
+            rate_value=Decimal('0.9'),
+            provider='currencybeacon'
+        )
+
+        _, data = self._rates_list(1)
+
+        self.assertEqual(data, [{'date': '2024-01-01', 'USD': 1.08, 'GBP': 0.9}])
+
+
+class RateListEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.eur = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        cls.usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        cls.gbp = Currency.objects.create(code='GBP', name='British Pound', symbol='£')
+        cls.start = date(2024, 1, 1)
+
+        rates = []
+        for offset in range(10):
+            valuation_date = cls.start + timedelta(days=offset)
+            for target, provider in ((cls.usd, 'mock'), (cls.gbp, 'mock'), (cls.usd, 'exchangerate')):
+                rates.append(CurrencyExchangeRate(
+                    source_currency=cls.eur,
+                    exchanged_currency=target,
+                    valuation_date=valuation_date,
+                    rate_value=Decimal('1.08'),
+                    provider=provider
+                ))
+        CurrencyExchangeRate.objects.bulk_create(rates)
+
+    def setUp(self):
+        self.client = APIClient()
+        currency_codes.invalidate()
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/rates/', {'page_size': 5})
+        self.assertEqual(len(response.json()['results']), 5)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/rates/', {'page_size': 30})
+        self.assertEqual(len(response.json()['results']), 30)
+        self.assertEqual(response.json()['results'][0]['source_currency_code'], 'EUR')
+
+    def test_cursor_walks_every_row_once(self):
+        seen = []
+        response = self.client.get('/api/rates/', {'page_size': 7})
+        while True:
+            data = response.json()
+            seen.extend(row['id'] for row in data['results'])
+            if not data['next']:
+                break
+            response = self.client.get(data['next'])
+
+        self.assertEqual(len(seen), 30)
+        self.assertEqual(seen, sorted(set(seen), reverse=True))
+
+    @override_settings(API_MAX_PAGE_SIZE=10)
+    def test_page_size_is_capped(self):
+        response = self.client.get('/api/rates/', {'page_size': 1000})
+
+        self.assertEqual(len(response.json()['results']), 10)
+
+    def test_filters(self):
+        response = self.client.get('/api/rates/', {
+            'source_currency': 'EUR',
+            'exchanged_currency': 'USD',
+            'provider': 'mock',
+            'date_from': '2024-01-03',
+            'date_to': '2024-01-05',
+        })
+        results = response.json()['results']
+
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(row['exchanged_currency_code'] == 'USD' for row in results))
+        self.assertTrue(all(row['provider'] == 'mock' for row in results))
+
+    def test_unknown_currency_returns_empty_page(self):
+        response = self.client.get('/api/rates/', {'source_currency': 'XXX'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_invalid_date_range_is_rejected(self):
+        response = self.client.get('/api/rates/', {'date_from': '2024-01-05', 'date_to': '2024-01-01'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class ConvertTimeseriesTests(TestCase):
+    def setUp(self):
+        currency_codes.invalidate()
+        eur = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        CurrencyExchangeRate.objects.create(
+            source_currency=eur,
+            exchanged_currency=usd,
+            valuation_date=date(2024, 1, 1),
+            rate_value=Decimal('1.123456'),
+            provider='mock'
+        )
+        self.client = APIClient()
+
+    def _post(self, **body):
+        return self.client.post('/api/rates/convert_timeseries/', {
+            'source_currency': 'EUR',
+            'exchanged_currency': 'USD',
+            'amount': '10.00',
+            'date_from': '2024-01-01',
+            'date_to': '2024-01-02',
+            **body
+        }, format='json')
+
+    def test_decimals_are_sent_as_strings(self):
+        response = self._post(fill='none')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['amount'], '10.00')
+        self.assertEqual(data['rates'], ['1.123456', None])
+        self.assertEqual(data['converted_amounts'], ['11.23', None])
+        self.assertEqual(data['dates'], ['2024-01-01', '2024-01-02'])
+
+    def test_missing_rates_return_not_found(self):
+        response = self._post(date_from='2023-01-01', date_to='2023-01-02')
+
+        self.assertEqual(response.status_code, 404)
+
+
+class ConvertBatchTests(TestCase):
+    def setUp(self):
+        rate_cache.clear()
+        currency_codes.invalidate()
+        for code in ('EUR', 'USD', 'GBP'):
+            Currency.objects.create(code=code, name=code, symbol=code)
+        _save_exchange_rates([
+            {
+                'source_currency': 'EUR',
+                'exchanged_currency': target,
+                'valuation_date': date(2024, 1, 1),
+                'rate_value': Decimal(rate_value),
+                'provider': 'mock',
+            }
+            for target, rate_value in [('USD', '1.10'), ('GBP', '0.85')]
+        ])
+        currency_codes.get_ids(['EUR', 'USD', 'GBP'])
+        rate_cache.clear()
+        self.client = APIClient()
+
+    def test_stored_rates_are_read_in_one_query(self):
+        items = [
+            {'source_currency': 'EUR', 'exchanged_currency': target, 'amount': '10.00', 'valuation_date': '2024-01-01'}
+            for target in ('USD', 'GBP', 'EUR')
+        ]
+
+        with mock.patch('core.services.request_traffic'), self.assertNumQueries(1):
+            response = self.client.post('/api/rates/convert_batch/', {'items': items}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['converted_amount'] for result in response.json()['results']],
+            [11.0, 8.5, 10.0]
+        )
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        rate_cache.clear()
+        currency_codes.invalidate()
+        eur = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        CurrencyExchangeRate.objects.create(
+            source_currency=eur,
+            exchanged_currency=usd,
+            valuation_date=date(2024, 1, 1),
+            rate_value=Decimal('1.10'),
+            provider='mock'
+        )
+
+    async def test_convert(self):
+        response = await self.async_client.post('/api/async/rates/convert/', {
+            'source_currency': 'EUR',
+            'exchanged_currency': 'USD',
+            'amount': '10.00',
+            'valuation_date': '2024-01-01',
+        }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['converted_amount'], 11.0)
+
+    async def test_convert_rejects_invalid_json(self):
+        response = await self.async_client.post('/api/async/rates/convert/', 'not json', content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+
+    async def test_rate(self):
+        response = await self.async_client.get(
+            '/api/async/rates/rate/', {'source_currency': 'EUR', 'exchanged_currency': 'USD', 'valuation_date': '2024-01-01'}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual((data['rate_value'], data['provider']), (1.1, 'mock'))
+
+    async def test_rate_not_found(self):
+        with mock.patch('core.async_services._afetch_from_providers', mock.AsyncMock(return_value={'success': False})):
+            response = await self.async_client.get(
+                '/api/async/rates/rate/',
+                {'source_currency': 'EUR', 'exchanged_currency': 'USD', 'valuation_date': '2023-01-01', 'allow_derived': False}
+            )
+
+        self.assertEqual(response.status_code, 404)
+
+
+class RateExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        eur = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        gbp = Currency.objects.create(code='GBP', name='British Pound', symbol='£')
+        for target, valuation_date, rate_value, provider in [
+            (usd, date(2024, 1, 1), '1.08', 'mock'),
+            (gbp, date(2024, 1, 1), '0.86', 'mock'),
+            (usd, date(2024, 1, 2), '1.09', 'exchangerate'),
+        ]:
+            CurrencyExchangeRate.objects.create(
+                source_currency=eur,
+                exchanged_currency=target,
+                valuation_date=valuation_date,
+                rate_value=Decimal(rate_value),
+                provider=provider
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        currency_codes.invalidate()
+
+    def _export(self, **params):
+        response = self.client.get('/api/rates/export/', params)
+        body = b''.join(response.streaming_content).decode() if response.status_code == 200 else None
+        return response, body
+
+    def test_csv(self):
+        response, body = self._export()
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="exchange_rates.csv"')
+        self.assertEqual(body.splitlines(), [
+            'source_currency,exchanged_currency,valuation_date,rate_value,provider',
+            'EUR,USD,2024-01-01,1.080000,mock',
+            'EUR,USD,2024-01-02,1.090000,exchangerate',
+            'EUR,GBP,2024-01-01,0.860000,mock',
+        ])
+
+    def test_ndjson(self):
+        response, body = self._export(output='ndjson')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="exchange_rates.ndjson"')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0], {
+            'source_currency': 'EUR',
+            'exchanged_currency': 'USD',
+            'valuation_date': '2024-01-01',
+            'rate_value': '1.080000',
+            'provider': 'mock',
+        })
+
+    def test_filters_are_passed_through(self):
+        _, by_provider = self._export(output='ndjson', exchanged_currency='USD', provider='exchangerate')
+        _, by_date = self._export(output='ndjson', source_currency='EUR', date_from='2024-01-01', date_to='2024-01-01')
+        _, unknown = self._export(source_currency='XYZ')
+
+        self.assertEqual([json.loads(line)['valuation_date'] for line in by_provider.splitlines()], ['2024-01-02'])
+        self.assertEqual(
+            [json.loads(line)['exchanged_currency'] for line in by_date.splitlines()], ['USD', 'GBP']
+        )
+        self.assertEqual(len(unknown.splitlines()), 1)
+
+    def test_unknown_output_is_rejected(self):
+        response, _ = self._export(output='xml')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('output', response.json())
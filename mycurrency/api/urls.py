@@ -2,11 +2,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import CurrencyViewSet, CurrencyExchangeRateViewSet
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'currencies', CurrencyViewSet)
 router.register(r'rates', CurrencyExchangeRateViewSet)
 
 urlpatterns = [
+    path('async/rates/convert/', async_views.convert, name='async-convert'),
+    path('async/rates/rate/', async_views.rate, name='async-rate'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
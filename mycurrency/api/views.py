@@ -2,24 +2,95 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from datetime import date
+from itertools import chain, groupby
 
-from core.models import Currency, CurrencyExchangeRate
-from core.services import get_exchange_rate_data, convert_amount
+from core.cache import currency_codes
+from core.exports import EXPORT_FORMATS, filter_exchange_rates, stream_export
+from core.models import Currency, CurrencyExchangeRate, DailyRateSnapshot
+from core.snapshots import pick_rate, snapshots_enabled
+from core.services import get_exchange_rate_data, convert_amount, convert_amounts, convert_amount_timeseries
+from providers.factory import ProviderFactory
 from .serializers import (
     CurrencySerializer, 
     CurrencyExchangeRateSerializer,
+    CurrencyExchangeRateFilterSerializer,
+    CurrencyExchangeRateExportSerializer,
     CurrencyRatesListSerializer,
-    ConvertAmountSerializer
+    ConvertAmountSerializer,
+    ConvertBatchSerializer,
+    ConvertTimeseriesSerializer
 )
+from .pagination import CurrencyPagination, CurrencyExchangeRatePagination
+
+RATES_LIST_CHUNK_SIZE = 2000
+
+def _pivot_rates(rows, codes, priorities=None):
+    """Pivot (date, currency id, rate, provider) rows, ordered by date and
+    currency and newest first, into one dict per date keyed by currency code,
+    picking each currency's rate as the snapshots do."""
+    for rate_date, date_rows in groupby(rows, key=lambda row: row[0]):
+        date_rates = {'date': rate_date}
+        for currency_id, currency_rows in groupby(date_rows, key=lambda row: row[1]):
+            stored = pick_rate(((row[2], row[3]) for row in currency_rows), priorities)
+            if stored is not None:
+                date_rates[codes[currency_id]] = float(stored[0])
+        yield date_rates
+
+def _snapshot_rates(rows, source_currency):
+    """One dict per date from (date, snapshot rates) rows, already resolved
+    by provider priority."""
+    for rate_date, rates in rows:
+        date_rates = {'date': rate_date}
+        for code, (rate_value, _) in rates.items():
+            if code != source_currency:
+                date_rates[code] = float(rate_value)
+        yield date_rates
+
+def _stream_json_list(items):
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    yield '['
+    for index, item in enumerate(items):
+        yield (',' if index else '') + encoder.encode(item)
+    yield ']'
 
 class CurrencyViewSet(viewsets.ModelViewSet):
     queryset = Currency.objects.all()
     serializer_class = CurrencySerializer
+    pagination_class = CurrencyPagination
 
 class CurrencyExchangeRateViewSet(viewsets.ModelViewSet):
-    queryset = CurrencyExchangeRate.objects.all()
+    queryset = CurrencyExchangeRate.objects.select_related('source_currency', 'exchanged_currency')
     serializer_class = CurrencyExchangeRateSerializer
+    pagination_class = CurrencyExchangeRatePagination
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+        
+        serializer = CurrencyExchangeRateFilterSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        
+        return filter_exchange_rates(queryset, **serializer.validated_data)
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        serializer = CurrencyExchangeRateExportSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        filters = dict(serializer.validated_data)
+        output = filters.pop('output')
+        response = StreamingHttpResponse(
+            stream_export(output, **filters),
+            content_type=EXPORT_FORMATS[output]
+        )
+        response['Content-Disposition'] = f'attachment; filename="exchange_rates.{output}"'
+        return response
     
     @action(detail=False, methods=['post'])
     def rates_list(self, request):
@@ -32,45 +103,59 @@ class CurrencyExchangeRateViewSet(viewsets.ModelViewSet):
         date_from = data['date_from']
         date_to = data['date_to']
         
+        source_id = currency_codes.get_id(source_currency)
+        if source_id is None:
+            return Response(
+                {"error": f"Currency {source_currency} not found"}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
         try:
-            source = Currency.objects.get(code=source_currency)
-            rates = CurrencyExchangeRate.objects.filter(
-                source_currency=source,
-                valuation_date__gte=date_from,
-                valuation_date__lte=date_to
-            ).order_by('valuation_date', 'exchanged_currency')
+            if snapshots_enabled():
+                rows = DailyRateSnapshot.objects.filter(
+                    source_currency=source_currency,
+                    valuation_date__gte=date_from,
+                    valuation_date__lte=date_to
+                ).order_by(
+                    'valuation_date'
+                ).values_list(
+                    'valuation_date', 'rates'
+                ).iterator(chunk_size=RATES_LIST_CHUNK_SIZE)
+            else:
+                rows = CurrencyExchangeRate.objects.filter(
+                    source_currency_id=source_id,
+                    valuation_date__gte=date_from,
+                    valuation_date__lte=date_to
+                ).exclude(
+                    exchanged_currency_id=source_id
+                ).order_by(
+                    'valuation_date', 'exchanged_currency', '-created_at'
+                ).values_list(
+                    'valuation_date', 'exchanged_currency_id', 'rate_value', 'provider'
+                ).iterator(chunk_size=RATES_LIST_CHUNK_SIZE)
             
-            if not rates.exists():
+            first_row = next(rows, None)
+            if first_row is None:
                 return Response(
                     {"error": "No rates found for the specified period"}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            currencies = Currency.objects.exclude(code=source_currency)
-            result = []
+            if snapshots_enabled():
+                result = _snapshot_rates(chain([first_row], rows), source_currency)
+            else:
+                result = _pivot_rates(
+                    chain([first_row], rows), currency_codes.codes(), ProviderFactory.get_provider_priorities()
+                )
             
-            for rate_date in rates.values_list('valuation_date', flat=True).distinct():
-                date_rates = {}
-                date_rates['date'] = rate_date
-                
-                for currency in currencies:
-                    rate = rates.filter(
-                        exchanged_currency=currency,
-                        valuation_date=rate_date
-                    ).first()
-                    
-                    if rate:
-                        date_rates[currency.code] = float(rate.rate_value)
-                    
-                result.append(date_rates)
+            if (date_to - date_from).days + 1 > settings.RATES_LIST_STREAM_THRESHOLD_DAYS:
+                return StreamingHttpResponse(
+                    _stream_json_list(result),
+                    content_type='application/json'
+                )
             
-            return Response(result)
+            return Response(list(result))
             
-        except Currency.DoesNotExist:
-            return Response(
-                {"error": f"Currency {source_currency} not found"}, 
-                status=status.HTTP_404_NOT_FOUND
-            )
         except Exception as e:
             return Response(
                 {"error": str(e)}, 
@@ -88,7 +173,8 @@ class CurrencyExchangeRateViewSet(viewsets.ModelViewSet):
             source_currency=data['source_currency'],
             amount=data['amount'],
             exchanged_currency=data['exchanged_currency'],
-            valuation_date=data.get('valuation_date')
+            valuation_date=data.get('valuation_date'),
+            allow_derived=data.get('allow_derived')
         )
         
         if not result.get('success'):
@@ -97,4 +183,43 @@ class CurrencyExchangeRateViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        return Response(result)
+    
+    @action(detail=False, methods=['post'])
+    def convert_batch(self, request):
+        serializer = ConvertBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        results = convert_amounts(serializer.validated_data['items'])
+        
+        return Response({'results': results})
+    
+    @action(detail=False, methods=['post'])
+    def convert_timeseries(self, request):
+        serializer = ConvertTimeseriesSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        data = serializer.validated_data
+        result = convert_amount_timeseries(
+            source_currency=data['source_currency'],
+            amount=data['amount'],
+            exchanged_currency=data['exchanged_currency'],
+            date_from=data['date_from'],
+            date_to=data['date_to'],
+            fill=data['fill']
+        )
+        
+        if not result.get('success'):
+            return Response(
+                {"error": result.get('error', 'Conversion failed')}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        # Decimals are sent as strings so no precision is lost in the payload.
+        for key in ('rates', 'converted_amounts'):
+            result[key] = [str(value) if value is not None else None for value in result[key]]
+        result['amount'] = str(result['amount'])
+        
         return Response(result)
\ No newline at end of file
@@ -1,6 +1,43 @@
 import os
 from celery import Celery
+from celery.schedules import crontab
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mycurrency.settings')
 app = Celery('mycurrency')
 app.config_from_object('django.conf:settings', namespace='CELERY')
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+def prefetch_schedule():
+    """One prefetch entry per active provider, PREFETCH['delay_minutes'] after
+    its publish_time (HH:MM in CELERY_TIMEZONE)."""
+    from django.conf import settings
+
+    schedule = {}
+    delay = settings.PREFETCH.get('delay_minutes', 5)
+    for name, config in settings.CURRENCY_PROVIDERS.items():
+        if not config.get('active', False) or not config.get('publish_time'):
+            continue
+        hour, minute = (int(part) for part in config['publish_time'].split(':'))
+        minutes = (hour * 60 + minute + delay) % (24 * 60)
+        schedule[f'prefetch-todays-rates-{name}'] = {
+            'task': 'core.tasks.prefetch_todays_rates',
+            'schedule': crontab(hour=minutes // 60, minute=minutes % 60),
+            'kwargs': {'provider': name},
+        }
+    return schedule
+
+def partition_maintenance_schedule():
+    """Daily partition creation and retention at RATE_PARTITIONS['maintenance_time']."""
+    from django.conf import settings
+
+    hour, minute = (int(part) for part in settings.RATE_PARTITIONS['maintenance_time'].split(':'))
+    return {
+        'maintain-rate-partitions': {
+            'task': 'core.tasks.maintain_rate_partitions',
+            'schedule': crontab(hour=hour, minute=minute),
+        },
+    }
+
+@app.on_after_configure.connect
+def register_beat_schedule(sender, **kwargs):
+    sender.conf.beat_schedule.update(prefetch_schedule())
+    sender.conf.beat_schedule.update(partition_maintenance_schedule())
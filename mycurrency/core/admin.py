@@ -1,14 +1,19 @@
 from django.contrib import admin
 from django import forms
-from django.shortcuts import render
+from django.conf import settings
+from django.shortcuts import redirect, render
 from django.urls import path
 from django.http import JsonResponse
 from decimal import Decimal
-from datetime import date
+from datetime import date, datetime, timezone
 
+from .cache import currency_codes
 from .models import Currency, CurrencyExchangeRate
-from .services import convert_amount
-from .tasks import load_historical_exchange_rates
+from .services import convert_amounts
+from .tasks import load_historical_exchange_rates, get_backfill_group_id, get_historical_load_progress
+from providers.factory import ProviderFactory
+from providers.health import provider_health
+from providers.limits import rate_limiter
 class CurrencyAdminSite(admin.AdminSite):
     site_header = "MyCurrency Administration"
     site_title = "MyCurrency Admin Portal"
@@ -19,7 +24,10 @@ class CurrencyAdminSite(admin.AdminSite):
         custom_urls = [
             path('currency-converter/', self.admin_view(self.currency_converter_view), name='currency-converter'),
             path('load-historical-data/', self.admin_view(self.load_historical_data_view), name='load-historical-data'),
+            path('load-historical-data/<str:task_id>/progress/', self.admin_view(self.historical_load_progress_view),
+                 name='load-historical-data-progress'),
             path('api/convert/', self.admin_view(self.convert_api), name='convert-api'),
+            path('provider-health/', self.admin_view(self.provider_health_view), name='provider-health'),
         ]
         return custom_urls + urls
     
@@ -67,6 +75,34 @@ class CurrencyAdminSite(admin.AdminSite):
         }
         return render(request, 'admin/load_historical_data.html', context)
 
+    def historical_load_progress_view(self, request, task_id):
+        group_id = get_backfill_group_id(task_id)
+        if group_id is None:
+            # The scheduling task has not run yet.
+            return JsonResponse({'state': 'PENDING'})
+        return JsonResponse(get_historical_load_progress(group_id))
+
+    def provider_health_view(self, request):
+        provider_names = list(settings.CURRENCY_PROVIDERS)
+        if request.method == 'POST' and request.POST.get('reset') in provider_names:
+            provider_health.reset(request.POST['reset'])
+            return redirect('admin:provider-health')
+        
+        providers = provider_health.snapshot(provider_names)
+        order = [provider['name'] for provider in ProviderFactory.get_active_providers()]
+        for provider in providers:
+            provider['chain_position'] = order.index(provider['provider']) + 1 if provider['provider'] in order else None
+            provider['limits'] = rate_limiter.stats().get(provider['provider'], {})
+            if provider['opened_at']:
+                provider['opened_at'] = datetime.fromtimestamp(provider['opened_at'], tz=timezone.utc)
+        
+        context = {
+            'title': 'Provider Health',
+            'providers': providers,
+            **self.each_context(request),
+        }
+        return render(request, 'admin/provider_health.html', context)
+
     def convert_api(self, request):
         if request.method == 'POST':
             source_id = request.POST.get('source_currency')
@@ -74,36 +110,40 @@ class CurrencyAdminSite(admin.AdminSite):
             target_ids = request.POST.getlist('target_currencies')
             
             try:
-                source_currency = Currency.objects.get(id=source_id)
+                source_code = currency_codes.get_code(int(source_id))
+                if source_code is None:
+                    return JsonResponse({'error': 'Source currency not found'}, status=400)
                 amount = Decimal(amount_str)
-                target_currencies = Currency.objects.filter(id__in=target_ids)
+                target_codes = [currency_codes.get_code(int(target_id)) for target_id in target_ids]
+                target_codes = [code for code in target_codes if code is not None]
+                
+                conversions = convert_amounts([
+                    {
+                        'source_currency': source_code,
+                        'amount': amount,
+                        'exchanged_currency': target_code
+                    }
+                    for target_code in target_codes
+                ])
                 
                 results = []
-                for target in target_currencies:
-                    if target.id == source_currency.id:
+                for target_code, result in zip(target_codes, conversions):
+                    if target_code == source_code:
                         results.append({
-                            'currency': target.code,
+                            'currency': target_code,
                             'amount': float(amount),
                             'success': True
                         })
-                        continue
-                    
-                    result = convert_amount(
-                        source_currency=source_currency.code,
-                        amount=amount,
-                        exchanged_currency=target.code
-                    )
-                    
-                    if result.get('success'):
+                    elif result.get('success'):
                         results.append({
-                            'currency': target.code,
+                            'currency': target_code,
                             'amount': float(result['converted_amount']),
                             'rate': float(result['rate']),
                             'success': True
                         })
                     else:
                         results.append({
-                            'currency': target.code,
+                            'currency': target_code,
                             'error': result.get('error', 'Conversion failed'),
                             'success': False
                         })
@@ -0,0 +1,265 @@
+"""Async counterparts of the rate lookup and conversion services.
+
+They follow the same order as ``core.services`` (cache, database, cross
+rates, providers) but use Django's async ORM and the providers' async HTTP
+clients, so one ASGI worker can keep many provider calls in flight. Writes
+and the cross-rate graph reuse the sync implementations in a thread.
+"""
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Any, Optional, List, Tuple, Callable, Awaitable
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from providers.factory import ProviderFactory
+from providers.limits import ProviderThrottled
+from core.cache import rate_cache, currency_codes
+from core.metrics import metrics
+from core.models import CurrencyExchangeRate
+from core.singleflight import single_flight
+from core.traffic import request_traffic
+from core.services import (
+    _build_conversion,
+    _derivation_enabled,
+    _get_derived_rate,
+    _save_exchange_rate,
+    _stored_rate_result,
+)
+
+logger = logging.getLogger(__name__)
+
+async def aget_exchange_rate_data(
+    source_currency: str,
+    exchanged_currency: str,
+    valuation_date: date,
+    provider: Optional[str] = None,
+    allow_derived: Optional[bool] = None
+) -> Dict[str, Any]:
+    await request_traffic.arecord(source_currency, exchanged_currency)
+
+    with metrics.timer('rate_lookup_seconds') as labels:
+        outcome, result = await _alookup_exchange_rate(
+            source_currency, exchanged_currency, valuation_date, provider, allow_derived
+        )
+        labels['outcome'] = outcome
+    metrics.inc('rate_lookups_total', outcome=outcome)
+    return result
+
+async def _alookup_exchange_rate(
+    source_currency: str,
+    exchanged_currency: str,
+    valuation_date: date,
+    provider: Optional[str],
+    allow_derived: Optional[bool]
+) -> Tuple[str, Dict[str, Any]]:
+    cached = await rate_cache.aget(source_currency, exchanged_currency, valuation_date, provider)
+    if cached is not None:
+        return 'cache', cached
+
+    if not provider:
+        stored = await _aget_stored_rate(source_currency, exchanged_currency, valuation_date)
+        if stored is not None:
+            return 'database', stored
+
+        if _derivation_enabled(allow_derived):
+            derived = await sync_to_async(_get_derived_rate)(source_currency, exchanged_currency, valuation_date)
+            if derived.get('success'):
+                return 'derived', derived
+
+    if provider:
+        result = await single_flight.ado(
+            rate_cache.make_key(source_currency, exchanged_currency, valuation_date, provider),
+            lambda: _afetch_from_provider(provider, source_currency, exchanged_currency, valuation_date),
+            lambda: rate_cache.aget(source_currency, exchanged_currency, valuation_date, provider)
+        )
+        if result is not None:
+            return ('provider' if result.get('success') else 'miss'), result
+
+    result = await _afetch_from_providers(source_currency, exchanged_currency, valuation_date)
+    return ('provider' if result.get('success') else 'miss'), result
+
+async def _aget_stored_rate(
+    source_currency: str,
+    exchanged_currency: str,
+    valuation_date: date
+) -> Optional[Dict[str, Any]]:
+    currency_ids = await currency_codes.aget_ids([source_currency, exchanged_currency])
+    if source_currency not in currency_ids or exchanged_currency not in currency_ids:
+        return None
+
+    rows = [
+        row async for row in CurrencyExchangeRate.objects.filter(
+            source_currency_id=currency_ids[source_currency],
+            exchanged_currency_id=currency_ids[exchanged_currency],
+            valuation_date=valuation_date
+        ).order_by('-created_at').values_list('rate_value', 'provider')
+    ]
+    result = _stored_rate_result(source_currency, exchanged_currency, valuation_date, rows)
+    if result:
+        await rate_cache.aset(source_currency, exchanged_currency, valuation_date, result)
+    return result
+
+async def _afetch_from_provider(
+    provider: str,
+    source_currency: str,
+    exchanged_currency: str,
+    valuation_date: date
+) -> Optional[Dict[str, Any]]:
+    try:
+        adapter = ProviderFactory.get_provider(provider)
+        result = await adapter.aget_exchange_rate(source_currency, exchanged_currency, valuation_date)
+        if not result.get('success'):
+            return None
+        await sync_to_async(_save_exchange_rate)(result)
+        await rate_cache.aset(source_currency, exchanged_currency, valuation_date, result, provider)
+        return result
+    except Exception as e:
+        logger.error(f"Error with provider {provider}: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+async def _afetch_from_providers(
+    source_currency: str,
+    exchanged_currency: str,
+    valuation_date: date
+) -> Dict[str, Any]:
+    async def recheck():
+        cached = await rate_cache.aget(source_currency, exchanged_currency, valuation_date)
+        if cached is not None:
+            return cached
+        return await _aget_stored_rate(source_currency, exchanged_currency, valuation_date)
+
+    return await single_flight.ado(
+        rate_cache.make_key(source_currency, exchanged_currency, valuation_date),
+        lambda: _afetch_from_provider_chain(source_currency, exchanged_currency, valuation_date),
+        recheck
+    )
+
+async def _afetch_from_provider_chain(
+    source_currency: str,
+    exchanged_currency: str,
+    valuation_date: date
+) -> Dict[str, Any]:
+    # The active providers are ordered by provider_health, which reads the
+    # shared cache, so they are listed in a thread.
+    active_providers = await sync_to_async(ProviderFactory.get_active_providers)()
+    provider_names = [config['name'] for config in active_providers]
+
+    async def fetch(provider_name: str) -> Dict[str, Any]:
+        adapter = ProviderFactory.get_provider(provider_name)
+        return await adapter.aget_exchange_rate(source_currency, exchanged_currency, valuation_date)
+
+    fallback = getattr(settings, 'PROVIDER_FALLBACK', {})
+    if fallback.get('mode') == 'hedged' and len(provider_names) > 1:
+        result = await _arun_hedged_chain(
+            provider_names,
+            fetch,
+            hedge_delay=fallback.get('hedge_delay', 0.25),
+            max_concurrency=fallback.get('max_concurrency', 2)
+        )
+    else:
+        result = await _arun_provider_chain(provider_names, fetch)
+
+    if result is None:
+        return {'success': False, 'error': 'No provider could fetch the exchange rate'}
+
+    await sync_to_async(_save_exchange_rate)(result)
+    await rate_cache.aset(source_currency, exchanged_currency, valuation_date, result)
+    return result
+
+async def _acall_provider(
+    provider_name: str,
+    fetch: Callable[[str], Awaitable[Dict[str, Any]]]
+) -> Dict[str, Any]:
+    try:
+        result = await fetch(provider_name)
+    except ProviderThrottled as e:
+        logger.info(str(e))
+        result = {'success': False, 'error': str(e)}
+    except Exception as e:
+        logger.error(f"Error with provider {provider_name}: {str(e)}")
+        result = {'success': False, 'error': str(e)}
+    if not result.get('success'):
+        metrics.inc('provider_fallbacks_total', provider=provider_name)
+    return result
+
+async def _arun_provider_chain(
+    provider_names: List[str],
+    fetch: Callable[[str], Awaitable[Dict[str, Any]]]
+) -> Optional[Dict[str, Any]]:
+    for provider_name in provider_names:
+        result = await _acall_provider(provider_name, fetch)
+        if result.get('success'):
+            return result
+    return None
+
+async def _arun_hedged_chain(
+    provider_names: List[str],
+    fetch: Callable[[str], Awaitable[Dict[str, Any]]],
+    hedge_delay: float,
+    max_concurrency: int
+) -> Optional[Dict[str, Any]]:
+    """asyncio version of core.services._run_hedged_chain; losing calls are
+    cancelled rather than left to finish."""
+    pending = {}
+    results = {}
+    next_index = 0
+
+    def launch():
+        nonlocal next_index
+        task = asyncio.ensure_future(_acall_provider(provider_names[next_index], fetch))
+        pending[task] = next_index
+        next_index += 1
+
+    try:
+        while pending or next_index < len(provider_names):
+            if not pending:
+                launch()
+                continue
+
+            can_hedge = next_index < len(provider_names) and len(pending) < max_concurrency
+            done, _ = await asyncio.wait(
+                pending,
+                timeout=hedge_delay if can_hedge else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                launch()
+                continue
+
+            for task in done:
+                results[pending.pop(task)] = task.result()
+
+            for index in sorted(results):
+                if results[index].get('success'):
+                    return results[index]
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def aconvert_amount(
+    source_currency: str,
+    amount: Decimal,
+    exchanged_currency: str,
+    valuation_date: Optional[date] = None,
+    allow_derived: Optional[bool] = None
+) -> Dict[str, Any]:
+    if valuation_date is None:
+        valuation_date = date.today()
+
+    with metrics.timer('conversion_seconds') as labels:
+        rate_data = await aget_exchange_rate_data(
+            source_currency=source_currency,
+            exchanged_currency=exchanged_currency,
+            valuation_date=valuation_date,
+            allow_derived=allow_derived
+        )
+        labels['outcome'] = 'success' if rate_data.get('success') else 'error'
+
+        if not rate_data.get('success'):
+            return rate_data
+
+        return _build_conversion(source_currency, amount, exchanged_currency, valuation_date, rate_data)
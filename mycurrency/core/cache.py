@@ -0,0 +1,344 @@
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Any, Optional
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+ANY_PROVIDER = '*'
+# Provider slot of derived cross rates, cached under their own keys.
+DERIVED_PROVIDER = 'derived'
+
+
+class RateCache:
+    """Two-tier exchange rate cache: a bounded in-process LRU with TTL in
+    front of an optional shared tier backed by Django's cache framework.
+
+    ``invalidate`` reaches the local tier of the calling process and the
+    shared tier only, so local entries live at most ``local_ttl`` seconds:
+    that bounds how long another process can serve a rate that was since
+    corrected."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'local_hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'invalidations': 0,
+            'evictions': 0,
+        }
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return getattr(settings, 'RATE_CACHE', {})
+
+    @staticmethod
+    def make_key(
+        source_currency: str,
+        exchanged_currency: str,
+        valuation_date: date,
+        provider: Optional[str] = None
+    ) -> str:
+        return f"rate:{provider or ANY_PROVIDER}:{source_currency}:{exchanged_currency}:{valuation_date.isoformat()}"
+
+    def ttl_for(self, valuation_date: date, provider: Optional[str] = None) -> int:
+        # Derived rates are not invalidated when the rates they come from
+        # change, so they only live briefly.
+        if provider == DERIVED_PROVIDER:
+            return self.config.get('derived_ttl', 60)
+        if valuation_date < date.today():
+            return self.config.get('historical_ttl', 60 * 60 * 24 * 30)
+        return self.config.get('today_ttl', 60)
+
+    def local_ttl_for(self, valuation_date: date, provider: Optional[str] = None) -> int:
+        return min(self.ttl_for(valuation_date, provider), self.config.get('local_ttl', 300))
+
+    def _shared(self):
+        if not self.config.get('shared', False):
+            return None
+        return caches[self.config.get('cache_alias', 'default')]
+
+    def get(
+        self,
+        source_currency: str,
+        exchanged_currency: str,
+        valuation_date: date,
+        provider: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        if not self.config.get('enabled', True):
+            return None
+
+        key = self.make_key(source_currency, exchanged_currency, valuation_date, provider)
+        value = self._get_local(key)
+        if value is not None:
+            return value
+
+        shared = self._shared()
+        if shared is not None:
+            try:
+                value = shared.get(key)
+            except Exception as e:
+                logger.warning(f"Shared rate cache unavailable: {str(e)}")
+                value = None
+            if value is not None:
+                return self._promote(key, value, valuation_date, provider)
+
+        self._count('misses')
+        return None
+
+    async def aget(
+        self,
+        source_currency: str,
+        exchanged_currency: str,
+        valuation_date: date,
+        provider: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Async variant of get; only the shared tier does I/O."""
+        if not self.config.get('enabled', True):
+            return None
+
+        key = self.make_key(source_currency, exchanged_currency, valuation_date, provider)
+        value = self._get_local(key)
+        if value is not None:
+            return value
+
+        shared = self._shared()
+        if shared is not None:
+            try:
+                value = await shared.aget(key)
+            except Exception as e:
+                logger.warning(f"Shared rate cache unavailable: {str(e)}")
+                value = None
+            if value is not None:
+                return self._promote(key, value, valuation_date, provider)
+
+        self._count('misses')
+        return None
+
+    def _get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats['local_hits'] += 1
+                    return dict(value)
+                del self._entries[key]
+        return None
+
+    def _promote(
+        self,
+        key: str,
+        value: Dict[str, Any],
+        valuation_date: date,
+        provider: Optional[str]
+    ) -> Dict[str, Any]:
+        self._set_local(key, value, self.local_ttl_for(valuation_date, provider))
+        self._count('shared_hits')
+        return dict(value)
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def set(
+        self,
+        source_currency: str,
+        exchanged_currency: str,
+        valuation_date: date,
+        value: Dict[str, Any],
+        provider: Optional[str] = None
+    ):
+        if not self.config.get('enabled', True):
+            return
+
+        key = self.make_key(source_currency, exchanged_currency, valuation_date, provider)
+        ttl = self.ttl_for(valuation_date, provider)
+        value = dict(value)
+
+        self._set_local(key, value, self.local_ttl_for(valuation_date, provider))
+        self._count('sets')
+
+        shared = self._shared()
+        if shared is not None:
+            try:
+                shared.set(key, value, ttl)
+            except Exception as e:
+                logger.warning(f"Shared rate cache unavailable: {str(e)}")
+
+    async def aset(
+        self,
+        source_currency: str,
+        exchanged_currency: str,
+        valuation_date: date,
+        value: Dict[str, Any],
+        provider: Optional[str] = None
+    ):
+        """Async variant of set."""
+        if not self.config.get('enabled', True):
+            return
+
+        key = self.make_key(source_currency, exchanged_currency, valuation_date, provider)
+        ttl = self.ttl_for(valuation_date, provider)
+        value = dict(value)
+
+        self._set_local(key, value, self.local_ttl_for(valuation_date, provider))
+        self._count('sets')
+
+        shared = self._shared()
+        if shared is not None:
+            try:
+                await shared.aset(key, value, ttl)
+            except Exception as e:
+                logger.warning(f"Shared rate cache unavailable: {str(e)}")
+
+    def _set_local(self, key: str, value: Dict[str, Any], ttl: int):
+        max_entries = self.config.get('max_entries', 10000)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(
+        self,
+        source_currency: str,
+        exchanged_currency: str,
+        valuation_date: date,
+        provider: Optional[str] = None
+    ):
+        """Drop the entry for the given provider and the provider-agnostic entry
+        for the same pair and date."""
+        keys = {
+            self.make_key(source_currency, exchanged_currency, valuation_date, provider),
+            self.make_key(source_currency, exchanged_currency, valuation_date),
+        }
+
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+            self._stats['invalidations'] += 1
+
+        shared = self._shared()
+        if shared is not None:
+            try:
+                shared.delete_many(list(keys))
+            except Exception as e:
+                logger.warning(f"Shared rate cache unavailable: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['local_hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+rate_cache = RateCache()
+
+
+class CurrencyCodeCache:
+    """Process-wide map between currency codes and ids.
+
+    The currency table is tiny and rarely changes, so it is loaded lazily in
+    one query and dropped by the ``post_save``/``post_delete`` signals on
+    ``Currency``. Unknown codes trigger a reload, at most once per
+    ``miss_reload_interval`` seconds, to pick up currencies created by other
+    processes.
+    """
+
+    max_age = 300
+    miss_reload_interval = 1
+
+    def __init__(self):
+        self._by_code = None
+        self._by_id = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        from core.models import Currency
+
+        rows = list(Currency.objects.values_list('id', 'code'))
+        self._by_id = dict(rows)
+        self._by_code = {code: currency_id for currency_id, code in rows}
+        self._loaded_at = time.monotonic()
+
+    def _maps(self):
+        with self._lock:
+            if self._by_code is None or time.monotonic() - self._loaded_at > self.max_age:
+                self._load()
+            return self._by_code, self._by_id
+
+    def _reload_on_miss(self):
+        with self._lock:
+            if self._by_code is not None and time.monotonic() - self._loaded_at < self.miss_reload_interval:
+                return None
+            self._load()
+            return self._by_code, self._by_id
+
+    def is_loaded(self) -> bool:
+        return self._by_code is not None and time.monotonic() - self._loaded_at <= self.max_age
+
+    async def aget_ids(self, codes) -> Dict[str, int]:
+        """Async variant of get_ids; only hits the database when the map has
+        to be (re)loaded."""
+        by_code = self._by_code
+        codes = set(codes)
+        if self.is_loaded() and by_code is not None and codes.issubset(by_code):
+            return {code: by_code[code] for code in codes}
+        return await sync_to_async(self.get_ids, thread_sensitive=True)(codes)
+
+    def get_id(self, code: str) -> Optional[int]:
+        by_code, _ = self._maps()
+        if code not in by_code:
+            reloaded = self._reload_on_miss()
+            if reloaded is not None:
+                by_code = reloaded[0]
+        return by_code.get(code)
+
+    def get_ids(self, codes) -> Dict[str, int]:
+        by_code, _ = self._maps()
+        codes = set(codes)
+        if not codes.issubset(by_code):
+            reloaded = self._reload_on_miss()
+            if reloaded is not None:
+                by_code = reloaded[0]
+        return {code: by_code[code] for code in codes if code in by_code}
+
+    def get_code(self, currency_id: int) -> Optional[str]:
+        _, by_id = self._maps()
+        if currency_id not in by_id:
+            reloaded = self._reload_on_miss()
+            if reloaded is not None:
+                by_id = reloaded[1]
+        return by_id.get(currency_id)
+
+    def codes(self) -> Dict[int, str]:
+        _, by_id = self._maps()
+        return dict(by_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._by_code = None
+            self._by_id = None
+            self._loaded_at = 0.0
+
+
+currency_codes = CurrencyCodeCache()
@@ -0,0 +1,83 @@
+from datetime import date
+from typing import Iterator, Optional, Tuple
+import csv
+import json
+
+from core.cache import currency_codes
+from core.models import CurrencyExchangeRate
+
+EXPORT_COLUMNS = ['source_currency', 'exchanged_currency', 'valuation_date', 'rate_value', 'provider']
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+def filter_exchange_rates(
+    queryset,
+    source_currency: Optional[str] = None,
+    exchanged_currency: Optional[str] = None,
+    provider: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+):
+    """Apply the pair, provider and date range filters shared by the rate list
+    and export endpoints. Currency codes are resolved to ids up front so the
+    pair and date filters hit the composite indexes without joining Currency;
+    ``provider`` has no index of its own and only narrows the rows they find."""
+    for field, code in (('source_currency', source_currency), ('exchanged_currency', exchanged_currency)):
+        if code:
+            currency_id = currency_codes.get_id(code)
+            if currency_id is None:
+                return queryset.none()
+            queryset = queryset.filter(**{f'{field}_id': currency_id})
+
+    if provider:
+        queryset = queryset.filter(provider=provider)
+    if date_from:
+        queryset = queryset.filter(valuation_date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(valuation_date__lte=date_to)
+
+    return queryset
+
+def iter_exchange_rates(chunk_size: int = EXPORT_CHUNK_SIZE, **filters) -> Iterator[Tuple]:
+    """Yield (source, target, date, rate, provider) rows through a server-side
+    cursor, in the order of the unique index so no sort is needed."""
+    rows = filter_exchange_rates(CurrencyExchangeRate.objects.all(), **filters).order_by(
+        'source_currency_id', 'exchanged_currency_id', 'valuation_date', 'provider'
+    ).values_list(
+        'source_currency_id', 'exchanged_currency_id', 'valuation_date', 'rate_value', 'provider'
+    ).iterator(chunk_size=chunk_size)
+
+    codes = currency_codes.codes()
+    for source_id, target_id, valuation_date, rate_value, provider in rows:
+        source = codes.get(source_id) or currency_codes.get_code(source_id)
+        target = codes.get(target_id) or currency_codes.get_code(target_id)
+        yield source, target, valuation_date, rate_value, provider
+
+class _Echo:
+    def write(self, value):
+        return value
+
+def stream_csv(rows) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for source, target, valuation_date, rate_value, provider in rows:
+        yield writer.writerow([source, target, valuation_date.isoformat(), str(rate_value), provider])
+
+def stream_ndjson(rows) -> Iterator[str]:
+    for source, target, valuation_date, rate_value, provider in rows:
+        yield json.dumps({
+            'source_currency': source,
+            'exchanged_currency': target,
+            'valuation_date': valuation_date.isoformat(),
+            'rate_value': str(rate_value),
+            'provider': provider,
+        }, separators=(',', ':')) + '\n'
+
+def stream_export(output: str, chunk_size: int = EXPORT_CHUNK_SIZE, **filters) -> Iterator[str]:
+    rows = iter_exchange_rates(chunk_size=chunk_size, **filters)
+    if output == 'ndjson':
+        return stream_ndjson(rows)
+    return stream_csv(rows)
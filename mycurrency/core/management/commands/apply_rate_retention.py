@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.partitions import partitioning_enabled, apply_retention
+
+class Command(BaseCommand):
+    help = (
+        'Applies the CurrencyExchangeRate retention policy: partitions older than the compaction '
+        'horizon keep only the winning provider per pair and date, and partitions older than the '
+        'retention horizon are detached (or dropped). Defaults come from RATE_PARTITIONS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compact-after-months', type=int, help='Compact months older than this (0: never)')
+        parser.add_argument('--retention-months', type=int, help='Expire months older than this (0: never)')
+        expire = parser.add_mutually_exclusive_group()
+        expire.add_argument('--drop', action='store_true', default=None, help='Drop expired partitions')
+        expire.add_argument('--detach', dest='drop', action='store_false', help='Detach expired partitions and keep them as archive tables')
+        parser.add_argument('--recompact', action='store_true', help='Compact partitions already marked as compacted again')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the partitions that would change')
+
+    def handle(self, *args, **options):
+        if not partitioning_enabled():
+            raise CommandError('The exchange rate table is not partitioned; this needs PostgreSQL and migration 0005.')
+        for option in ('compact_after_months', 'retention_months'):
+            if options[option] is not None and options[option] < 0:
+                raise CommandError(f"--{option.replace('_', '-')} cannot be negative")
+
+        summary = apply_retention(
+            compact_after_months=options['compact_after_months'],
+            retention_months=options['retention_months'],
+            drop=options['drop'],
+            recompact=options['recompact'],
+            dry_run=options['dry_run']
+        )
+
+        expire, expired = ('drop', 'Dropped') if summary['dropped'] else ('detach', 'Detached')
+        for name in summary['compacted']:
+            self.stdout.write(f'Would compact {name}' if options['dry_run'] else f'Compacted {name}')
+        for name in summary['expired']:
+            self.stdout.write(f'Would {expire} {name}' if options['dry_run'] else f'{expired} {name}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(summary['compacted'])} partitions compacted, {len(summary['expired'])} expired, "
+            f"{summary['rows_deleted']} rows deleted" + (' (dry run)' if options['dry_run'] else '')
+        ))
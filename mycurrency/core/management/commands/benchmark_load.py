@@ -0,0 +1,386 @@
+import itertools
+import json
+import platform
+import statistics
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+import django
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Q
+from django.test import Client, override_settings
+from core.cache import currency_codes, rate_cache
+from core.models import CurrencyExchangeRate
+from core.services import ensure_currencies
+from core.tasks import load_exchange_rate_chunk
+from providers.fake_server import FakeProviderServer, FAKE_PROVIDERS
+from providers.health import provider_health
+from providers.limits import rate_limiter
+from providers.sessions import close_sessions
+
+SCENARIOS = ['backfill', 'convert', 'rates_list']
+DEFAULT_CURRENCIES = ['EUR', 'USD', 'GBP', 'CHF', 'JPY', 'CAD']
+
+class Command(BaseCommand):
+    help = (
+        'Load-tests the convert and rates_list endpoints and the historical backfill task at a fixed '
+        'concurrency against the local fake provider server, and reports p50/p95/p99 latency and '
+        'throughput. Results can be saved as JSON and compared with an earlier run. In-process runs use '
+        'a throwaway database and their own cache keys, both removed afterwards, so runs do not skew '
+        'each other.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', nargs='*', choices=SCENARIOS, default=SCENARIOS,
+                            help='Scenarios to run, in order (default: all)')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per HTTP scenario')
+        parser.add_argument('--concurrency', type=int, default=10, help='Concurrent workers')
+        parser.add_argument('--warmup', type=int, default=20, help='Untimed requests before each HTTP scenario')
+        parser.add_argument('--currencies', nargs='*', default=DEFAULT_CURRENCIES)
+        parser.add_argument('--days', type=int, default=30, help='Distinct valuation dates used by convert')
+        parser.add_argument('--range-days', type=int, default=30, help='Window of each rates_list request')
+        parser.add_argument('--backfill-days', type=int, default=90, help='Dates loaded by the backfill scenario')
+        parser.add_argument('--backfill-end', type=date.fromisoformat,
+                            help='Last backfill date (default: one year ago)')
+        parser.add_argument('--latency', type=float, default=0.05, help='Fake provider latency in seconds')
+        parser.add_argument('--jitter', type=float, default=0.02, help='Fake provider random extra latency')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of fake provider HTTP 500s')
+        parser.add_argument('--down', nargs='*', default=[], choices=sorted(FAKE_PROVIDERS),
+                            help='Fake providers that always answer HTTP 503')
+        parser.add_argument('--fake-url', help='Use a fake provider server started with run_fake_providers')
+        parser.add_argument('--target-url', help='Send the HTTP scenarios to a running server instead of in-process')
+        parser.add_argument('--keep-limits', action='store_true', help='Keep the provider rate limits')
+        parser.add_argument('--use-default-db', action='store_true',
+                            help='Run against the configured database instead of a throwaway one; refused '
+                                 'when it already holds rates in the benchmark window. Implied by --target-url')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        if len(options['currencies']) < 2:
+            raise CommandError('At least two --currencies are needed')
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as source:
+                baseline = json.load(source)
+
+        isolated = not (options['use_default_db'] or options['target_url'])
+        if not isolated:
+            self._check_database(options)
+
+        server = None
+        if options['fake_url']:
+            base_urls = {name: options['fake_url'].rstrip('/') + prefix for name, prefix in FAKE_PROVIDERS.items()}
+        else:
+            server = FakeProviderServer(
+                latency=options['latency'],
+                jitter=options['jitter'],
+                error_rate=options['error_rate'],
+                down=options['down']
+            ).start()
+            base_urls = server.base_urls()
+
+        providers = {}
+        for name, config in settings.CURRENCY_PROVIDERS.items():
+            config = dict(config)
+            if name in base_urls:
+                config['base_url'] = base_urls[name]
+                config['api_key'] = config.get('api_key') or 'benchmark'
+            if not options['keep_limits']:
+                config.pop('limits', None)
+            providers[name] = config
+
+        backfill = {
+            **settings.HISTORICAL_BACKFILL,
+            'max_concurrency': max(options['concurrency'], settings.HISTORICAL_BACKFILL['max_concurrency']),
+        }
+
+        results = {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connections['default'].vendor,
+            'isolated': isolated,
+            'options': {
+                key: value.isoformat() if isinstance(value, date) else value
+                for key, value in options.items()
+                if key in (
+                    'requests', 'concurrency', 'warmup', 'currencies', 'days', 'range_days',
+                    'backfill_days', 'backfill_end', 'latency', 'jitter', 'error_rate', 'down',
+                    'keep_limits', 'target_url'
+                )
+            },
+            'scenarios': {},
+        }
+
+        old_database = None
+        cache_prefix = f'benchmark-{uuid.uuid4().hex[:12]}'
+        try:
+            if isolated:
+                old_database = self._create_database()
+            with override_settings(
+                CURRENCY_PROVIDERS=providers,
+                HISTORICAL_BACKFILL=backfill,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                CACHES={**settings.CACHES, 'default': {**settings.CACHES['default'], 'KEY_PREFIX': cache_prefix}}
+            ):
+                self._reset_providers()
+                try:
+                    ensure_currencies(options['currencies'])
+                    for scenario in options['scenario']:
+                        self.stdout.write(f'Running {scenario}...')
+                        provider_calls = dict(server.requests) if server else {}
+                        result = getattr(self, f'_scenario_{scenario}')(options)
+                        if server:
+                            result['provider_requests'] = {
+                                name: count - provider_calls.get(name, 0) for name, count in server.requests.items()
+                            }
+                        results['scenarios'][scenario] = result
+                        self._report(scenario, result, (baseline or {}).get('scenarios', {}).get(scenario))
+                finally:
+                    self._clear_cache(cache_prefix)
+        finally:
+            if server:
+                server.stop()
+            close_sessions()
+            if old_database is not None:
+                self._destroy_database(*old_database)
+            # Nothing read from the throwaway database may outlive it.
+            rate_cache.clear()
+            currency_codes.invalidate()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def _reset_providers(self):
+        close_sessions()
+        rate_limiter.reset()
+        rate_cache.clear()
+        currency_codes.invalidate()
+        for name in settings.CURRENCY_PROVIDERS:
+            provider_health.reset(name)
+
+    def _check_database(self, options):
+        """Refuse to benchmark a database that already holds rates the
+        scenarios would read or write, as they would skew the results."""
+        dates = self._backfill_dates(options)
+        today = date.today()
+        windows = [
+            (dates[0] - timedelta(days=options['range_days'] - 1), dates[-1]),
+            (today - timedelta(days=options['days'] - 1), today),
+        ]
+        query = Q()
+        for start, end in windows:
+            query |= Q(valuation_date__range=(start, end))
+        count = CurrencyExchangeRate.objects.filter(query).count()
+        if count:
+            spans = ' or '.join(f'{start} to {end}' for start, end in windows)
+            raise CommandError(
+                f'The database already holds {count} rates dated {spans}. Delete them, choose another '
+                f'--backfill-end, or run in-process without --use-default-db to use a throwaway database.'
+            )
+
+    def _create_database(self):
+        """Create and migrate a throwaway database, as the test runner does,
+        and point the default connection at it. SQLite gets a temporary file
+        rather than the shared in-memory database, which the concurrent
+        writers of the backfill would lock."""
+        connection = connections['default']
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        old_test_name = test_settings.get('NAME')
+        if connection.vendor == 'sqlite' and not old_test_name:
+            handle, test_settings['NAME'] = tempfile.mkstemp(prefix='benchmark-', suffix='.sqlite3')
+            os.close(handle)
+        self.stdout.write('Creating a throwaway database...')
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        return old_name, old_test_name
+
+    def _destroy_database(self, old_name, old_test_name):
+        connection = connections['default']
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+
+    def _clear_cache(self, prefix):
+        """Delete the keys the run stored under its own prefix."""
+        cache = caches['default']
+        if isinstance(cache, RedisCache):
+            client = cache._cache.get_client(write=True)
+            keys = list(client.scan_iter(match=f'{prefix}:*', count=1000))
+            for start in range(0, len(keys), 1000):
+                client.delete(*keys[start:start + 1000])
+        elif isinstance(cache, LocMemCache):
+            cache.clear()
+
+    def _backfill_dates(self, options):
+        end = options['backfill_end'] or date.today() - timedelta(days=365)
+        return [end - timedelta(days=offset) for offset in reversed(range(options['backfill_days']))]
+
+    def _scenario_backfill(self, options):
+        chunk_days = settings.HISTORICAL_BACKFILL['chunk_days']
+        dates = [day.isoformat() for day in self._backfill_dates(options)]
+        chunks = [dates[i:i + chunk_days] for i in range(0, len(dates), chunk_days)]
+        currencies = options['currencies']
+        totals = {'success_count': 0, 'error_count': 0, 'skipped_count': 0}
+        lock = threading.Lock()
+
+        def load_chunk(index):
+            summary = load_exchange_rate_chunk.apply(args=[chunks[index], currencies, currencies, None]).get()
+            with lock:
+                for key in totals:
+                    totals[key] += summary[key]
+            return summary['error_count'] == 0
+
+        result = _run(load_chunk, len(chunks), options['concurrency'])
+        result.update(totals)
+        result['rates_per_second'] = round(totals['success_count'] / result['elapsed_seconds'], 1)
+        return result
+
+    def _scenario_convert(self, options):
+        currencies = options['currencies']
+        pairs = [(source, target) for source in currencies for target in currencies if source != target]
+        today = date.today()
+        post = self._poster(options)
+
+        def convert(index):
+            source, target = pairs[index % len(pairs)]
+            valuation_date = today - timedelta(days=(index // len(pairs)) % options['days'])
+            return post('/api/rates/convert/', {
+                'source_currency': source,
+                'exchanged_currency': target,
+                'amount': '100.00',
+                'valuation_date': valuation_date.isoformat(),
+            })
+
+        _run(convert, options['warmup'], options['concurrency'])
+        return _run(convert, options['requests'], options['concurrency'])
+
+    def _scenario_rates_list(self, options):
+        currencies = options['currencies']
+        dates = self._backfill_dates(options)
+        post = self._poster(options)
+
+        def rates_list(index):
+            date_to = dates[-1 - index % len(dates)]
+            return post('/api/rates/rates_list/', {
+                'source_currency': currencies[index % len(currencies)],
+                'date_from': (date_to - timedelta(days=options['range_days'] - 1)).isoformat(),
+                'date_to': date_to.isoformat(),
+            })
+
+        _run(rates_list, options['warmup'], options['concurrency'])
+        return _run(rates_list, options['requests'], options['concurrency'])
+
+    def _poster(self, options):
+        """POST a JSON body and tell whether the answer was a 2xx, through one
+        client per worker thread."""
+        local = threading.local()
+        target_url = options['target_url']
+
+        def post(path, body):
+            if target_url:
+                session = getattr(local, 'session', None) or requests.Session()
+                local.session = session
+                response = session.post(target_url.rstrip('/') + path, json=body, timeout=30)
+                return response.ok
+            client = getattr(local, 'client', None) or Client()
+            local.client = client
+            response = client.post(path, body, content_type='application/json')
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+            return 200 <= response.status_code < 300
+
+        return post
+
+    def _report(self, scenario, result, baseline=None):
+        self.stdout.write(self.style.SUCCESS(
+            f"{scenario}: {result['requests']} requests, {result['errors']} errors, "
+            f"{result['requests_per_second']} req/s"
+        ))
+        line = '  ' + ', '.join(f"{key} {result[key + '_ms']} ms" for key in ('p50', 'p95', 'p99', 'max'))
+        self.stdout.write(line)
+        if baseline:
+            changes = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'requests_per_second'):
+                if baseline.get(key):
+                    change = (result[key] - baseline[key]) / baseline[key] * 100
+                    changes.append(f'{key} {change:+.1f}%')
+            self.stdout.write('  vs baseline: ' + ', '.join(changes))
+
+
+def _run(operation, total, concurrency):
+    """Call ``operation(index)`` ``total`` times from ``concurrency`` threads
+    and summarise the latencies."""
+    counter = itertools.count()
+
+    def worker():
+        samples = []
+        try:
+            while True:
+                index = next(counter)
+                if index >= total:
+                    return samples
+                started = time.perf_counter()
+                try:
+                    ok = operation(index)
+                except Exception:
+                    ok = False
+                samples.append((time.perf_counter() - started, ok))
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='benchmark') as executor:
+        futures = [executor.submit(worker) for _ in range(min(concurrency, max(total, 1)))]
+        samples = [sample for future in futures for sample in future.result()]
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, ok in samples if not ok),
+        'concurrency': concurrency,
+        'elapsed_seconds': round(elapsed, 3),
+        'requests_per_second': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(statistics.mean(latencies), 3) if latencies else 0.0,
+        'p50_ms': _percentile(latencies, 50),
+        'p95_ms': _percentile(latencies, 95),
+        'p99_ms': _percentile(latencies, 99),
+        'max_ms': round(latencies[-1], 3) if latencies else 0.0,
+    }
+
+
+def _percentile(values, percent):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * percent // 100))
+    return round(values[int(rank) - 1], 3)
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
@@ -0,0 +1,159 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from core.models import Currency, CurrencyExchangeRate
+
+LOOKUP_INDEXES = ['rate_latest_lookup_idx', 'rate_source_date_idx']
+# Single-column indexes of 0001_initial that 0002_rate_lookup_indexes removed,
+# recreated for the "before" run: index name -> column.
+INITIAL_INDEXES = {
+    'benchmark_rate_source_idx': 'source_currency_id',
+    'benchmark_rate_value_idx': 'rate_value',
+    'benchmark_rate_provider_idx': 'provider',
+}
+PROVIDERS = ['currencybeacon', 'exchangerate', 'openexchangerates', 'mock']
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the latest-rate lookup and the rates_list range scan on a synthetic '
+        'CurrencyExchangeRate table, with the composite lookup indexes and with the '
+        'single-column indexes of the initial migration'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000, help='Synthetic rows to generate')
+        parser.add_argument('--currencies', type=int, default=30, help='Synthetic currencies to generate')
+        parser.add_argument('--providers', type=int, default=2, help='Providers per pair and date')
+        parser.add_argument('--iterations', type=int, default=1000, help='Lookups to time per run')
+        parser.add_argument('--range-days', type=int, default=30, help='Window of the range scan')
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic rows instead of rolling back')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('The benchmark needs PostgreSQL.')
+
+        providers = PROVIDERS[:max(1, min(options['providers'], len(PROVIDERS)))]
+
+        with transaction.atomic():
+            currency_ids, start_date, days = self._generate(options['rows'], options['currencies'], providers)
+            samples = self._samples(currency_ids, start_date, days, options['iterations'], options['range_days'])
+
+            after = self._measure(samples)
+            after_plan = self._plan(samples[0])
+
+            savepoint = transaction.savepoint()
+            table = connection.ops.quote_name(CurrencyExchangeRate._meta.db_table)
+            with connection.cursor() as cursor:
+                for index_name in LOOKUP_INDEXES:
+                    cursor.execute(f'DROP INDEX IF EXISTS {connection.ops.quote_name(index_name)}')
+                for index_name, column in INITIAL_INDEXES.items():
+                    cursor.execute(
+                        f'CREATE INDEX {connection.ops.quote_name(index_name)} '
+                        f'ON {table} ({connection.ops.quote_name(column)})'
+                    )
+            before = self._measure(samples)
+            before_plan = self._plan(samples[0])
+            transaction.savepoint_rollback(savepoint)
+
+            self._report('With the initial single-column indexes', before, before_plan)
+            self._report('With composite indexes', after, after_plan)
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+                self.stdout.write('Synthetic data rolled back')
+
+    def _generate(self, rows, currency_count, providers):
+        codes = [f'Z{chr(65 + i // 26)}{chr(65 + i % 26)}' for i in range(currency_count)]
+        Currency.objects.bulk_create(
+            [Currency(code=code, name=code, symbol=code) for code in codes],
+            ignore_conflicts=True
+        )
+        currency_ids = list(Currency.objects.filter(code__in=codes).values_list('id', flat=True))
+
+        rows_per_day = len(currency_ids) * (len(currency_ids) - 1) * len(providers)
+        days = max(1, -(-rows // rows_per_day))
+        start_date = date(2000, 1, 1)
+
+        self.stdout.write(f'Generating {days * rows_per_day} rows ({days} days x {rows_per_day} rows per day)...')
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                INSERT INTO {CurrencyExchangeRate._meta.db_table}
+                    (source_currency_id, exchanged_currency_id, valuation_date, rate_value, provider, created_at)
+                SELECT s.id, t.id, %s::date + d, round((0.5 + random())::numeric, 6), p.name, now()
+                FROM generate_series(0, %s - 1) AS d
+                CROSS JOIN unnest(%s::bigint[]) AS s(id)
+                CROSS JOIN unnest(%s::bigint[]) AS t(id)
+                CROSS JOIN unnest(%s::text[]) AS p(name)
+                WHERE s.id <> t.id
+                ''',
+                [start_date, days, currency_ids, currency_ids, providers]
+            )
+            # Check the deferred foreign keys now: pending trigger events would
+            # stop the "before" run from creating indexes on the table.
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            cursor.execute(f'ANALYZE {CurrencyExchangeRate._meta.db_table}')
+        self.stdout.write(f'Generated in {time.perf_counter() - started:.1f}s')
+
+        return currency_ids, start_date, days
+
+    def _samples(self, currency_ids, start_date, days, iterations, range_days):
+        rng = random.Random(42)
+        samples = []
+        for _ in range(iterations):
+            source_id, target_id = rng.sample(currency_ids, 2)
+            valuation_date = start_date + timedelta(days=rng.randrange(days))
+            samples.append((source_id, target_id, valuation_date, valuation_date + timedelta(days=range_days - 1)))
+        return samples
+
+    def _lookup(self, source_id, target_id, valuation_date):
+        return CurrencyExchangeRate.objects.filter(
+            source_currency_id=source_id,
+            exchanged_currency_id=target_id,
+            valuation_date=valuation_date
+        ).order_by('-created_at')
+
+    def _range_scan(self, source_id, date_from, date_to):
+        return CurrencyExchangeRate.objects.filter(
+            source_currency_id=source_id,
+            valuation_date__gte=date_from,
+            valuation_date__lte=date_to
+        ).order_by('valuation_date', 'exchanged_currency')
+
+    def _measure(self, samples):
+        lookups = []
+        scans = []
+        for source_id, target_id, valuation_date, date_to in samples:
+            started = time.perf_counter()
+            self._lookup(source_id, target_id, valuation_date).values_list('rate_value', 'provider').first()
+            lookups.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            list(self._range_scan(source_id, valuation_date, date_to).values_list(
+                'valuation_date', 'exchanged_currency', 'rate_value'
+            ))
+            scans.append((time.perf_counter() - started) * 1000)
+        return {'lookup': lookups, 'range_scan': scans}
+
+    def _plan(self, sample):
+        source_id, target_id, valuation_date, date_to = sample
+        return {
+            'lookup': self._lookup(source_id, target_id, valuation_date)[:1].explain(),
+            'range_scan': self._range_scan(source_id, valuation_date, date_to).explain(),
+        }
+
+    def _report(self, title, timings, plans):
+        self.stdout.write(self.style.SUCCESS(title))
+        for name, values in timings.items():
+            values = sorted(values)
+            p95 = values[int(len(values) * 0.95) - 1] if len(values) > 1 else values[0]
+            self.stdout.write(
+                f'  {name}: mean {statistics.mean(values):.3f} ms, '
+                f'p50 {statistics.median(values):.3f} ms, p95 {p95:.3f} ms'
+            )
+            self.stdout.write(f'  plan: {plans[name]}')
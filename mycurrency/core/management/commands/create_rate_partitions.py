@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.partitions import partitioning_enabled, ensure_partitions, list_partitions
+
+class Command(BaseCommand):
+    help = (
+        'Creates the monthly CurrencyExchangeRate partitions of the coming months, and partitions '
+        'for any month whose rates landed in the DEFAULT partition. Needs PostgreSQL and migration 0005.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int,
+                            help="Months after the current one to create (default: RATE_PARTITIONS['months_ahead'])")
+        parser.add_argument('--list', action='store_true', help='List the attached partitions afterwards')
+
+    def handle(self, *args, **options):
+        if not partitioning_enabled():
+            raise CommandError('The exchange rate table is not partitioned; this needs PostgreSQL and migration 0005.')
+        if options['months_ahead'] is not None and options['months_ahead'] < 0:
+            raise CommandError('--months-ahead cannot be negative')
+
+        created = ensure_partitions(months_ahead=options['months_ahead'])
+        for name in created:
+            self.stdout.write(f'Created {name}')
+
+        if options['list']:
+            for month, name, compacted in list_partitions():
+                self.stdout.write(f"{month:%Y-%m}  {name}{'  (compacted)' if compacted else ''}")
+
+        self.stdout.write(self.style.SUCCESS(f'Created {len(created)} partitions'))
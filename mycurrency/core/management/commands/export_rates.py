@@ -0,0 +1,45 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from core.exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, stream_export
+
+class Command(BaseCommand):
+    help = 'Streams exchange rates to a CSV or NDJSON file (or stdout) with constant memory use'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', help='Source currency code')
+        parser.add_argument('--target', help='Exchanged currency code')
+        parser.add_argument('--provider', help='Only export rates from this provider')
+        parser.add_argument('--date-from', type=date.fromisoformat, help='First valuation date (YYYY-MM-DD)')
+        parser.add_argument('--date-to', type=date.fromisoformat, help='Last valuation date (YYYY-MM-DD)')
+        parser.add_argument('--output-format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', help='File to write to; defaults to stdout')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Rows fetched per round trip')
+
+    def handle(self, *args, **options):
+        if options['date_from'] and options['date_to'] and options['date_from'] > options['date_to']:
+            raise CommandError('--date-from must be before --date-to')
+
+        chunks = stream_export(
+            options['output_format'],
+            chunk_size=options['chunk_size'],
+            source_currency=options['source'],
+            exchanged_currency=options['target'],
+            provider=options['provider'],
+            date_from=options['date_from'],
+            date_to=options['date_to']
+        )
+
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        lines = 0
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for chunk in chunks:
+                output.write(chunk)
+                lines += 1
+
+        rows = lines - 1 if options['output_format'] == 'csv' else lines
+        self.stdout.write(self.style.SUCCESS(f"Exported {rows} rates to {options['output']}"))
@@ -0,0 +1,225 @@
+import csv
+import io
+import re
+import time
+import xml.etree.ElementTree as ElementTree
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from core.cache import rate_cache, currency_codes
+from core.exports import EXPORT_COLUMNS
+from core.models import CurrencyExchangeRate
+from core.services import ensure_currencies, _save_exchange_rates
+from core.snapshots import refresh_rate_snapshots
+
+CODE_PATTERN = re.compile(r'^[A-Z]{3}$')
+RATE_QUANTUM = Decimal('0.000001')
+MAX_RATE = Decimal('1e12')
+STAGING_TABLE = 'rate_import_staging'
+
+class Command(BaseCommand):
+    help = (
+        'Loads exchange rates from a CSV file (export_rates layout) or an ECB XML history file. '
+        'On PostgreSQL rows are COPYed into a staging table and merged with ON CONFLICT.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or ECB XML file to load')
+        parser.add_argument('--input-format', choices=['csv', 'ecb'], help='Defaults to the file extension')
+        parser.add_argument('--provider', help="Provider for rows without one (default 'ecb' for ECB files)")
+        parser.add_argument('--batch-size', type=int, default=50_000, help='Rows per COPY batch')
+        parser.add_argument('--dry-run', action='store_true', help='Parse and validate only')
+        parser.add_argument('--max-errors', type=int, default=20, help='Invalid rows to print')
+
+    def handle(self, *args, **options):
+        input_format = options['input_format'] or ('ecb' if options['path'].lower().endswith('.xml') else 'csv')
+        provider = options['provider'] or ('ecb' if input_format == 'ecb' else None)
+        reader = self._read_ecb if input_format == 'ecb' else self._read_csv
+
+        self.invalid = 0
+        self.max_errors = options['max_errors']
+        started = time.perf_counter()
+
+        try:
+            rows = self._validate(reader(options['path'], provider))
+            if options['dry_run']:
+                loaded = sum(1 for _ in rows)
+            elif connection.vendor == 'postgresql':
+                loaded = self._copy_load(rows, options['batch_size'])
+            else:
+                loaded = self._bulk_load(rows, options['batch_size'])
+        except (OSError, ElementTree.ParseError, csv.Error) as e:
+            raise CommandError(f"Could not read {options['path']}: {e}")
+
+        elapsed = time.perf_counter() - started
+        rate = loaded / elapsed if elapsed else 0
+        verb = 'Validated' if options['dry_run'] else 'Loaded'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {loaded} rates ({self.invalid} invalid) in {elapsed:.2f}s, {rate:,.0f} rows/s'
+        ))
+
+    def _read_csv(self, path, provider):
+        with open(path, newline='', encoding='utf-8') as source:
+            reader = csv.DictReader(source)
+            missing = set(EXPORT_COLUMNS) - {'provider'} - set(reader.fieldnames or [])
+            if missing:
+                raise CommandError(f"Missing CSV columns: {', '.join(sorted(missing))}")
+            if 'provider' not in reader.fieldnames and not provider:
+                raise CommandError('The file has no provider column; pass --provider')
+
+            for line, row in enumerate(reader, start=2):
+                yield line, (
+                    row['source_currency'],
+                    row['exchanged_currency'],
+                    row['valuation_date'],
+                    row['rate_value'],
+                    row.get('provider') or provider,
+                )
+
+    def _read_ecb(self, path, provider):
+        """Stream an ECB eurofxref XML file: <Cube time="..."> blocks of
+        <Cube currency="..." rate="..."/> quoted against EUR."""
+        valuation_date = None
+        line = 0
+        for event, element in ElementTree.iterparse(path, events=('start', 'end')):
+            if not element.tag.endswith('Cube'):
+                continue
+            if event == 'start' and 'time' in element.attrib:
+                valuation_date = element.attrib['time']
+            elif event == 'end' and 'currency' in element.attrib:
+                line += 1
+                yield line, ('EUR', element.attrib['currency'], valuation_date, element.attrib.get('rate'), provider)
+            elif event == 'end' and 'time' in element.attrib:
+                element.clear()
+
+    def _validate(self, rows):
+        for line, (source, target, valuation_date, rate_value, provider) in rows:
+            try:
+                yield self._clean(source, target, valuation_date, rate_value, provider)
+            except ValueError as e:
+                self.invalid += 1
+                if self.invalid <= self.max_errors:
+                    self.stderr.write(f'Row {line}: {e}')
+
+    def _clean(self, source, target, valuation_date, rate_value, provider):
+        source = (source or '').strip().upper()
+        target = (target or '').strip().upper()
+        if not CODE_PATTERN.match(source) or not CODE_PATTERN.match(target):
+            raise ValueError(f'invalid currency pair {source!r}/{target!r}')
+        if source == target:
+            raise ValueError(f'source and target are both {source}')
+        if not provider or len(provider) > 50:
+            raise ValueError(f'invalid provider {provider!r}')
+
+        valuation_date = date.fromisoformat((valuation_date or '').strip())
+        try:
+            rate_value = Decimal(rate_value.strip()).quantize(RATE_QUANTUM)
+        except (InvalidOperation, AttributeError):
+            raise ValueError(f'invalid rate {rate_value!r}')
+        if not 0 < rate_value < MAX_RATE:
+            raise ValueError(f'rate {rate_value} out of range')
+
+        return source, target, valuation_date, rate_value, provider
+
+    def _batches(self, rows, batch_size):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _bulk_load(self, rows, batch_size):
+        loaded = 0
+        for batch in self._batches(rows, batch_size):
+            loaded += _save_exchange_rates([
+                {
+                    'source_currency': source,
+                    'exchanged_currency': target,
+                    'valuation_date': valuation_date,
+                    'rate_value': rate_value,
+                    'provider': provider,
+                }
+                for source, target, valuation_date, rate_value, provider in batch
+            ])
+        return loaded
+
+    def _copy_load(self, rows, batch_size):
+        table = connection.ops.quote_name(CurrencyExchangeRate._meta.db_table)
+        staged = 0
+
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f'''
+                    CREATE TEMP TABLE {STAGING_TABLE} (
+                        seq bigserial,
+                        source_currency_id bigint NOT NULL,
+                        exchanged_currency_id bigint NOT NULL,
+                        valuation_date date NOT NULL,
+                        rate_value numeric(18, 6) NOT NULL,
+                        provider varchar(50) NOT NULL
+                    ) ON COMMIT DROP
+                ''')
+
+                for batch in self._batches(rows, batch_size):
+                    currency_ids = ensure_currencies({row[0] for row in batch} | {row[1] for row in batch})
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    for source, target, valuation_date, rate_value, provider in batch:
+                        writer.writerow([currency_ids[source], currency_ids[target], valuation_date, rate_value, provider])
+                    buffer.seek(0)
+                    cursor.copy_expert(
+                        f'COPY {STAGING_TABLE} (source_currency_id, exchanged_currency_id, valuation_date, '
+                        f'rate_value, provider) FROM STDIN WITH (FORMAT csv)',
+                        buffer
+                    )
+                    staged += len(batch)
+
+                # Rows whose stored value changes are the only ones that can be
+                # cached with a stale value.
+                cursor.execute(f'''
+                    SELECT DISTINCT s.source_currency_id, s.exchanged_currency_id, s.valuation_date, s.provider
+                    FROM {STAGING_TABLE} s
+                    JOIN {table} r USING (source_currency_id, exchanged_currency_id, valuation_date, provider)
+                    WHERE r.rate_value <> s.rate_value
+                ''')
+                changed = cursor.fetchall()
+
+                cursor.execute(f'SELECT DISTINCT source_currency_id, valuation_date FROM {STAGING_TABLE}')
+                touched = cursor.fetchall()
+
+                # The last occurrence of a key in the file wins.
+                cursor.execute(f'''
+                    INSERT INTO {table}
+                        (source_currency_id, exchanged_currency_id, valuation_date, rate_value, provider, created_at)
+                    SELECT DISTINCT ON (source_currency_id, exchanged_currency_id, valuation_date, provider)
+                        source_currency_id, exchanged_currency_id, valuation_date, rate_value, provider, now()
+                    FROM {STAGING_TABLE}
+                    ORDER BY source_currency_id, exchanged_currency_id, valuation_date, provider, seq DESC
+                    ON CONFLICT (source_currency_id, exchanged_currency_id, valuation_date, provider)
+                    DO UPDATE SET rate_value = EXCLUDED.rate_value
+                ''')
+                loaded = cursor.rowcount
+        except Exception:
+            # Currencies created inside the rolled back transaction are gone.
+            currency_codes.invalidate()
+            raise
+
+        for source_id, target_id, valuation_date, provider in changed:
+            rate_cache.invalidate(
+                currency_codes.get_code(source_id),
+                currency_codes.get_code(target_id),
+                valuation_date,
+                provider
+            )
+
+        refresh_rate_snapshots(
+            (currency_codes.get_code(source_id), valuation_date) for source_id, valuation_date in touched
+        )
+
+        self.stdout.write(f'Staged {staged} rows, merged {loaded} distinct rates')
+        return loaded
@@ -0,0 +1,42 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from core.models import CurrencyExchangeRate
+from core.snapshots import rebuild_rate_snapshots
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the DailyRateSnapshot rows from the stored exchange rates. Run it once after '
+        'the snapshot migration, or after changing provider priorities.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', help='Only rebuild the snapshots of this base currency')
+        parser.add_argument('--date-from', type=date.fromisoformat, help='First valuation date (default: oldest rate)')
+        parser.add_argument('--date-to', type=date.fromisoformat, help='Last valuation date (default: newest rate)')
+        parser.add_argument('--days-per-batch', type=int, default=7, help='Dates rebuilt per query')
+
+    def handle(self, *args, **options):
+        bounds = CurrencyExchangeRate.objects.aggregate(first=Min('valuation_date'), last=Max('valuation_date'))
+        date_from = options['date_from'] or bounds['first']
+        date_to = options['date_to'] or bounds['last']
+        if date_from is None or date_to is None:
+            self.stdout.write('No exchange rates stored, nothing to rebuild')
+            return
+        if date_from > date_to:
+            raise CommandError('--date-from must be before --date-to')
+        if options['days_per_batch'] < 1:
+            raise CommandError('--days-per-batch must be positive')
+
+        total = 0
+        for last, written in rebuild_rate_snapshots(
+            date_from,
+            date_to,
+            source_currency=options['source'],
+            days_per_batch=options['days_per_batch']
+        ):
+            total += written
+            self.stdout.write(f'Rebuilt up to {last}: {total} snapshots')
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} snapshots from {date_from} to {date_to}'))
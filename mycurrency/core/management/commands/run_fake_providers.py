@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from providers.fake_server import FakeProviderServer
+
+class Command(BaseCommand):
+    help = (
+        'Runs the local fake provider server. Point each provider base_url '
+        '(CURRENCYBEACON_BASE_URL, EXCHANGERATE_BASE_URL, OPENEXCHANGERATES_BASE_URL) at it '
+        'to benchmark a running deployment without calling the real providers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8100)
+        parser.add_argument('--latency', type=float, default=0.05, help='Seconds added to every response')
+        parser.add_argument('--jitter', type=float, default=0.02, help='Random extra seconds, up to this much')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of responses turned into HTTP 500')
+        parser.add_argument('--down', nargs='*', default=[], help='Providers that always answer HTTP 503')
+
+    def handle(self, *args, **options):
+        server = FakeProviderServer(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            down=options['down']
+        )
+        for name, url in server.base_urls().items():
+            self.stdout.write(f'{name}: {url}')
+        self.stdout.write(self.style.SUCCESS(f'Serving fake providers on {server.url} (Ctrl+C to stop)'))
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
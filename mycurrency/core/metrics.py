@@ -0,0 +1,237 @@
+"""In-process metrics registry rendered in the Prometheus text format.
+
+Counters and histograms are recorded by the hot paths (rate lookups, provider
+HTTP calls, conversions, rate writes, backfill chunks and requests) and the
+existing ``stats()`` helpers are exported as gauges when ``/metrics`` is
+scraped. Every recording call returns immediately when ``METRICS['enabled']``
+is off. Each worker process keeps its own registry, so scrape every worker
+or run a single one per target.
+"""
+from bisect import bisect_left
+from typing import Any, Iterable, List, Tuple
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+PREFIX = 'mycurrency_'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+METRICS = {
+    'rate_lookup_seconds': ('histogram', 'Time to resolve an exchange rate, by where it was found'),
+    'rate_lookups_total': ('counter', 'Exchange rate lookups, by where the rate was found'),
+    'provider_request_seconds': ('histogram', 'Provider HTTP request latency, by provider and outcome'),
+    'provider_skips_total': ('counter', 'Provider calls skipped by the rate limiter or circuit breaker'),
+    'provider_retries_total': ('counter', 'Provider HTTP retries, by provider'),
+    'provider_fallbacks_total': ('counter', 'Times the fallback chain moved past a provider'),
+    'conversion_seconds': ('histogram', 'Time to convert an amount, by outcome'),
+    'rate_save_seconds': ('histogram', 'Time to upsert a batch of exchange rates'),
+    'rates_saved_total': ('counter', 'Exchange rates upserted'),
+    'backfill_chunk_seconds': ('histogram', 'Time to load one historical backfill chunk'),
+    'backfill_rates_total': ('counter', 'Rates handled by historical backfill chunks, by outcome'),
+    'http_request_seconds': ('histogram', 'Request latency, by view, method and status'),
+    'db_queries_per_request': ('histogram', 'Database queries issued while handling a request, by view'),
+}
+
+BUCKETS = {
+    'db_queries_per_request': QUERY_BUCKETS,
+}
+
+_enabled = None
+
+
+def metrics_enabled() -> bool:
+    global _enabled
+    if _enabled is None:
+        _enabled = bool(getattr(settings, 'METRICS', {}).get('enabled', False))
+    return _enabled
+
+
+@receiver(setting_changed)
+def _reset_enabled(setting, **kwargs):
+    global _enabled
+    if setting == 'METRICS':
+        _enabled = None
+
+
+class _Timer:
+    __slots__ = ('registry', 'name', 'labels', 'started')
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self.labels
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.labels.setdefault('outcome', 'exception')
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        if not metrics_enabled():
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        if not metrics_enabled():
+            return
+        buckets = BUCKETS.get(name, DEFAULT_BUCKETS)
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            histogram[0][bisect_left(buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def timer(self, name: str, **labels):
+        """Time a block into a histogram. The yielded dict holds the labels, so
+        the block can add an outcome once it is known."""
+        if not metrics_enabled():
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: ([*value[0]], value[1], value[2]) for key, value in self._histograms.items()}
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            if metric_type == 'counter':
+                samples = [(labels, value) for (metric, labels), value in counters.items() if metric == name]
+                lines.extend(_family(name, 'counter', help_text, samples))
+                continue
+
+            series = [(labels, value) for (metric, labels), value in histograms.items() if metric == name]
+            if not series:
+                continue
+            buckets = BUCKETS.get(name, DEFAULT_BUCKETS)
+            lines.append(f'# HELP {PREFIX}{name} {help_text}')
+            lines.append(f'# TYPE {PREFIX}{name} histogram')
+            for labels, (counts, total, count) in sorted(series):
+                cumulative = 0
+                for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    bucket_labels = labels + (('le', _format_value(bound)),)
+                    lines.append(f'{PREFIX}{name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+                lines.append(f'{PREFIX}{name}_sum{_format_labels(labels)} {_format_value(total)}')
+                lines.append(f'{PREFIX}{name}_count{_format_labels(labels)} {count}')
+
+        for name, metric_type, help_text, samples in _collect_gauges():
+            lines.extend(_family(name, metric_type, help_text, samples))
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_value(value) -> str:
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Iterable[Tuple[str, Any]]) -> str:
+    labels = list(labels)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _family(name: str, metric_type: str, help_text: str, samples) -> List[str]:
+    if not samples:
+        return []
+    lines = [f'# HELP {PREFIX}{name} {help_text}', f'# TYPE {PREFIX}{name} {metric_type}']
+    for labels, value in sorted(samples, key=lambda sample: tuple(sample[0])):
+        lines.append(f'{PREFIX}{name}{_format_labels(labels)} {_format_value(value)}')
+    return lines
+
+
+def _collect_gauges():
+    """Export the stats the caches, single-flight, connection pools, rate
+    limiter and circuit breakers already keep."""
+    from core.cache import rate_cache
+    from core.singleflight import single_flight
+    from providers.health import provider_health
+    from providers.limits import rate_limiter
+    from providers.sessions import get_pool_stats
+
+    cache_stats = rate_cache.stats()
+    yield 'rate_cache_events_total', 'counter', 'Rate cache events by kind', [
+        ((('event', event),), cache_stats[event])
+        for event in ('local_hits', 'shared_hits', 'misses', 'sets', 'invalidations', 'evictions')
+    ]
+    yield 'rate_cache_entries', 'gauge', 'Entries in the in-process rate cache', [((), cache_stats['size'])]
+
+    flight_stats = single_flight.stats()
+    yield 'single_flight_total', 'counter', 'Single-flight fetches by role', [
+        ((('role', role),), flight_stats[role])
+        for role in ('leaders', 'coalesced', 'remote_waits', 'remote_hits', 'timeouts')
+    ]
+    yield 'single_flight_in_flight', 'gauge', 'Fetches currently in flight', [((), flight_stats['in_flight'])]
+
+    pool_samples = []
+    for pool in get_pool_stats():
+        labels = (('provider', pool['provider']), ('host', pool['host']))
+        pool_samples.append((labels + (('kind', 'idle'),), pool['idle_connections']))
+        pool_samples.append((labels + (('kind', 'opened'),), pool['connections_opened']))
+    yield 'provider_pool_connections', 'gauge', 'Provider HTTP connection pool usage', pool_samples
+
+    yield 'provider_rate_limit_total', 'counter', 'Rate limiter decisions by provider, class and outcome', [
+        ((('provider', provider), ('class', traffic_class), ('outcome', outcome)), count)
+        for provider, classes in rate_limiter.stats().items()
+        for traffic_class, outcomes in classes.items()
+        for outcome, count in outcomes.items()
+    ]
+
+    health = provider_health.snapshot(list(settings.CURRENCY_PROVIDERS))
+    yield 'provider_circuit_open', 'gauge', '1 when the provider circuit is open or half-open', [
+        ((('provider', entry['provider']),), 0 if entry['state'] == 'closed' else 1) for entry in health
+    ]
+    yield 'provider_latency_ewma_seconds', 'gauge', 'Smoothed provider latency', [
+        ((('provider', entry['provider']),), entry['latency_ms'] / 1000)
+        for entry in health if entry['latency_ms'] is not None
+    ]
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,59 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+
+from core.metrics import metrics, metrics_enabled
+
+
+class MetricsMiddleware:
+    """Record the latency of every request, and on the sync path the number
+    of database queries it issued, labelled by URL route. Requests pass
+    straight through when metrics are disabled."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not metrics_enabled():
+            return self.get_response(request)
+
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        if not metrics_enabled():
+            return await self.get_response(request)
+
+        # Async views run their queries on other threads' connections, so
+        # only latency is recorded here.
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, time.perf_counter() - started, None)
+        return response
+
+    def _record(self, request, response, elapsed, queries):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match.route) if match is not None else 'unmatched'
+        metrics.observe('http_request_seconds', elapsed, view=view, method=request.method,
+                        status=str(response.status_code))
+        if queries is not None:
+            metrics.observe('db_queries_per_request', queries, view=view)
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.2 on 2026-10-17 23:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='currencyexchangerate',
+            name='provider',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='currencyexchangerate',
+            name='rate_value',
+            field=models.DecimalField(decimal_places=6, max_digits=18),
+        ),
+        migrations.AlterField(
+            model_name='currencyexchangerate',
+            name='source_currency',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='exchanges', to='core.currency'),
+        ),
+        migrations.AddIndex(
+            model_name='currencyexchangerate',
+            index=models.Index(fields=['source_currency', 'exchanged_currency', 'valuation_date', '-created_at'], include=('rate_value', 'provider'), name='rate_latest_lookup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='currencyexchangerate',
+            index=models.Index(fields=['source_currency', 'valuation_date'], include=('exchanged_currency', 'rate_value'), name='rate_source_date_idx'),
+        ),
+    ]
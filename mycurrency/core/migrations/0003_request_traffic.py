@@ -0,0 +1,27 @@
+# Generated by Django 5.0.2 on 2026-10-17 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_rate_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateRequestStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_currency', models.CharField(max_length=3)),
+                ('exchanged_currency', models.CharField(max_length=3)),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='rate_request_stat_day_idx')],
+                'unique_together': {('source_currency', 'exchanged_currency', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.0.2 on 2026-10-17 23:58
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+BATCH_DAYS = 7
+
+
+def fill_snapshots(apps, schema_editor):
+    """Build the snapshots of the rates already stored, a week of dates per
+    query, by the rule of core.snapshots.resolve_rates: zero rates never win,
+    then the best provider priority, then the most recently stored."""
+    CurrencyExchangeRate = apps.get_model('core', 'CurrencyExchangeRate')
+    DailyRateSnapshot = apps.get_model('core', 'DailyRateSnapshot')
+    database = schema_editor.connection.alias
+    rates = CurrencyExchangeRate.objects.using(database)
+
+    bounds = rates.aggregate(first=Min('valuation_date'), last=Max('valuation_date'))
+    if bounds['first'] is None:
+        return
+    priorities = {name: config.get('priority', 999) for name, config in settings.CURRENCY_PROVIDERS.items()}
+
+    day = bounds['first']
+    while day <= bounds['last']:
+        last = day + timedelta(days=BATCH_DAYS - 1)
+        rows = rates.filter(valuation_date__range=(day, last)).order_by('-created_at').values_list(
+            'source_currency__code', 'exchanged_currency__code', 'valuation_date', 'rate_value', 'provider'
+        )
+        best = {}
+        for source, target, valuation_date, rate_value, provider in rows.iterator(chunk_size=5000):
+            if not rate_value:
+                continue
+            table = best.setdefault((source, valuation_date), {})
+            rank = priorities.get(provider, 999)
+            if target not in table or rank < table[target][2]:
+                table[target] = (rate_value, provider, rank)
+
+        DailyRateSnapshot.objects.using(database).bulk_create(
+            [
+                DailyRateSnapshot(
+                    source_currency=source,
+                    valuation_date=valuation_date,
+                    rates={code: [str(rate_value), provider] for code, (rate_value, provider, _) in sorted(table.items())}
+                )
+                for (source, valuation_date), table in best.items()
+            ],
+            batch_size=1000
+        )
+        day = last + timedelta(days=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_request_traffic'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRateSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_currency', models.CharField(max_length=3)),
+                ('valuation_date', models.DateField()),
+                ('rates', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('source_currency', 'valuation_date')},
+            },
+        ),
+        migrations.RunPython(fill_snapshots, migrations.RunPython.noop),
+    ]
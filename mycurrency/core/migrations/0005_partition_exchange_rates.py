@@ -0,0 +1,136 @@
+"""Partition core_currencyexchangerate by month of valuation_date.
+
+PostgreSQL only: on other databases the migration does nothing. The existing
+table is renamed, a table partitioned by RANGE (valuation_date) is created in
+its place with the same columns, constraints and indexes, one partition is
+created per month from the oldest stored rate to MONTHS_AHEAD months from now
+plus a DEFAULT partition for anything outside them, and the rows are copied
+over. The copy runs in the migration's transaction, so expect it to take as
+long as a full rewrite of the table.
+
+The primary key becomes (id, valuation_date), because a unique constraint on
+a partitioned table must include the partition key; ids still come from a
+single sequence. Later partitions are created by the create_rate_partitions
+command (see core.partitions).
+"""
+from datetime import date
+
+from django.db import migrations
+
+TABLE = 'core_currencyexchangerate'
+SEQUENCE = f'{TABLE}_id_seq'
+COLUMNS = 'id, valuation_date, rate_value, provider, created_at, exchanged_currency_id, source_currency_id'
+MONTHS_AHEAD = 3
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _drop_keys_and_indexes(schema_editor, cursor, table):
+    """Drop the keys and indexes of a table, so the names are free for the
+    table that replaces it."""
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+    for name, info in connection.introspection.get_constraints(cursor, table).items():
+        if info['index']:
+            cursor.execute(f'DROP INDEX {quote(name)}')
+        elif info['primary_key'] or info['unique'] or info['foreign_key']:
+            cursor.execute(f'ALTER TABLE {quote(table)} DROP CONSTRAINT {quote(name)}')
+
+
+def _create_keys_and_indexes(schema_editor, model):
+    """The unique constraint, foreign keys and indexes the model state
+    describes, as create_model would add them."""
+    schema_editor.alter_unique_together(model, [], model._meta.unique_together)
+    for field in model._meta.local_fields:
+        if field.remote_field and field.db_constraint:
+            schema_editor.execute(schema_editor._create_fk_sql(model, field, '_fk_%(to_table)s_%(to_column)s'))
+        for statement in schema_editor._field_indexes_sql(model, field):
+            schema_editor.execute(statement)
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
+
+
+def _is_partitioned(cursor) -> bool:
+    cursor.execute('SELECT relkind FROM pg_class WHERE oid = %s::regclass', [TABLE])
+    return cursor.fetchone()[0] == 'p'
+
+
+def partition_rates(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    model = apps.get_model('core', 'CurrencyExchangeRate')
+    legacy = f'{TABLE}_unpartitioned'
+    with schema_editor.connection.cursor() as cursor:
+        if _is_partitioned(cursor):
+            return
+
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {legacy}')
+        _drop_keys_and_indexes(schema_editor, cursor, legacy)
+        cursor.execute(f'ALTER TABLE {legacy} ALTER COLUMN id DROP IDENTITY IF EXISTS')
+        cursor.execute(f'ALTER TABLE {legacy} ALTER COLUMN id DROP DEFAULT')
+        cursor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE}')
+
+        cursor.execute(
+            f'CREATE TABLE {TABLE} (LIKE {legacy}, PRIMARY KEY (id, valuation_date)) '
+            f'PARTITION BY RANGE (valuation_date)'
+        )
+        cursor.execute(f'CREATE SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}')")
+        _create_keys_and_indexes(schema_editor, model)
+
+        cursor.execute(f'SELECT MIN(valuation_date) FROM {legacy}')
+        first = cursor.fetchone()[0] or date.today()
+        month = first.replace(day=1)
+        last = date.today().replace(day=1)
+        for _ in range(MONTHS_AHEAD):
+            last = _next_month(last)
+        while month <= last:
+            cursor.execute(
+                f"CREATE TABLE {TABLE}_p{month:%Y_%m} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+            )
+            month = _next_month(month)
+        cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+        cursor.execute(f'INSERT INTO {TABLE} ({COLUMNS}) SELECT {COLUMNS} FROM {legacy}')
+        cursor.execute(f"SELECT setval('{SEQUENCE}', COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}")
+        cursor.execute(f'DROP TABLE {legacy}')
+
+
+def unpartition_rates(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    model = apps.get_model('core', 'CurrencyExchangeRate')
+    partitioned = f'{TABLE}_partitioned'
+    with schema_editor.connection.cursor() as cursor:
+        if not _is_partitioned(cursor):
+            return
+
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {partitioned}')
+        _drop_keys_and_indexes(schema_editor, cursor, partitioned)
+        cursor.execute(f'ALTER TABLE {partitioned} ALTER COLUMN id DROP DEFAULT')
+        cursor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE}')
+
+        schema_editor.create_model(model)
+        cursor.execute(f'INSERT INTO {TABLE} ({COLUMNS}) SELECT {COLUMNS} FROM {partitioned}')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}"
+        )
+        # Partitions detached by the retention policy are not attached any
+        # more and are left alone.
+        cursor.execute(f'DROP TABLE {partitioned}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_daily_rate_snapshots'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_rates, unpartition_rates),
+    ]
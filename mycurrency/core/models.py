@@ -16,15 +16,67 @@ class Currency(ProtectedModel):
         verbose_name_plural = "Currencies"
 
 class CurrencyExchangeRate(models.Model):
-    source_currency = models.ForeignKey(Currency, related_name='exchanges', on_delete=models.CASCADE)
+    # source_currency is the leading column of the unique and composite
+    # indexes below, so it needs no index of its own.
+    source_currency = models.ForeignKey(Currency, related_name='exchanges', on_delete=models.CASCADE, db_index=False)
     exchanged_currency = models.ForeignKey(Currency, on_delete=models.CASCADE)
     valuation_date = models.DateField(db_index=True)
-    rate_value = models.DecimalField(db_index=True, decimal_places=6, max_digits=18)
-    provider = models.CharField(max_length=50, db_index=True)
+    rate_value = models.DecimalField(decimal_places=6, max_digits=18)
+    provider = models.CharField(max_length=50)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         return f"{self.source_currency.code}/{self.exchanged_currency.code}: {self.rate_value} ({self.valuation_date})"
     
     class Meta:
-        unique_together = ('source_currency', 'exchanged_currency', 'valuation_date', 'provider')
\ No newline at end of file
+        unique_together = ('source_currency', 'exchanged_currency', 'valuation_date', 'provider')
+        indexes = [
+            # Latest rate for a pair and date (core.services.get_exchange_rate_data).
+            models.Index(
+                fields=['source_currency', 'exchanged_currency', 'valuation_date', '-created_at'],
+                include=['rate_value', 'provider'],
+                name='rate_latest_lookup_idx'
+            ),
+            # All rates from one currency over a date range (rates_list).
+            models.Index(
+                fields=['source_currency', 'valuation_date'],
+                include=['exchanged_currency', 'rate_value'],
+                name='rate_source_date_idx'
+            ),
+        ]
+
+
+class RateRequestStat(models.Model):
+    """Daily request counts per currency pair, used to pick the pairs that
+    are prefetched ahead of the first request of the day."""
+    source_currency = models.CharField(max_length=3)
+    exchanged_currency = models.CharField(max_length=3)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.source_currency}/{self.exchanged_currency} on {self.day}: {self.count}"
+    
+    class Meta:
+        unique_together = ('source_currency', 'exchanged_currency', 'day')
+        indexes = [
+            models.Index(fields=['day'], name='rate_request_stat_day_idx'),
+        ]
+
+
+class DailyRateSnapshot(models.Model):
+    """All resolved rates from one base currency on one date, one row per
+    (base, date). ``rates`` maps each exchanged currency code to
+    ``[rate, provider]`` with the rate as a decimal string, taking the
+    provider with the best priority when several stored a rate. Kept up to
+    date by ``core.snapshots`` whenever rates are written."""
+    source_currency = models.CharField(max_length=3)
+    valuation_date = models.DateField()
+    rates = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.source_currency} on {self.valuation_date}: {len(self.rates)} rates"
+    
+    class Meta:
+        unique_together = ('source_currency', 'valuation_date')
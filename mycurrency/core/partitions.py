@@ -0,0 +1,230 @@
+"""Monthly partitions of ``CurrencyExchangeRate`` and its retention policy.
+
+On PostgreSQL, migration 0005 partitions the rates table by RANGE of
+``valuation_date``: one ``core_currencyexchangerate_pYYYY_MM`` partition per
+month plus a DEFAULT partition catching dates no partition covers. Lookups
+filter on ``valuation_date``, so the planner prunes them to the partitions of
+the dates asked for and recent lookups never read old months.
+
+``ensure_partitions`` creates the partitions of the coming months and moves
+rows that landed in the DEFAULT partition into partitions of their own.
+``apply_retention`` compacts months older than ``compact_after_months`` down
+to the winning provider per (pair, date), by the same rule as the snapshots,
+and detaches (or drops) the months older than ``retention_months``.
+"""
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from core.models import CurrencyExchangeRate, DailyRateSnapshot
+from providers.factory import ProviderFactory
+
+TABLE = CurrencyExchangeRate._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+COMPACTED = 'compacted'
+
+_PARTITION_NAME = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def archive_name(month: date) -> str:
+    """Name a partition is renamed to once detached."""
+    return f'{TABLE}_archive_{month:%Y_%m}'
+
+
+def partitioning_enabled() -> bool:
+    """Whether the rates table is a partitioned PostgreSQL table."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = %s::regclass', [TABLE])
+        return cursor.fetchone()[0] == 'p'
+
+
+def list_partitions() -> List[Tuple[date, str, bool]]:
+    """Attached monthly partitions, oldest first, as (month, table name,
+    compacted)."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, obj_description(child.oid, 'pg_class')
+            FROM pg_inherits
+            JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            """,
+            [TABLE]
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, comment in rows:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            partitions.append((month, name, comment == COMPACTED))
+    return sorted(partitions)
+
+
+def _horizon(months: int, today: Optional[date] = None) -> Optional[date]:
+    """First month kept by a policy of ``months`` months; None when 0."""
+    if not months:
+        return None
+    return add_months(month_start(today or date.today()), -months)
+
+
+def create_partition(month: date) -> str:
+    """Create the partition of one month. Rows of that month already in the
+    DEFAULT partition are moved into it, since PostgreSQL refuses to create a
+    partition whose rows sit in the DEFAULT one."""
+    name = partition_name(month)
+    bounds = (month.isoformat(), add_months(month, 1).isoformat())
+    in_month = 'valuation_date >= %s AND valuation_date < %s'
+    create = f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM ('{bounds[0]}') TO ('{bounds[1]}')"
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_month})', bounds)
+        if not cursor.fetchone()[0]:
+            cursor.execute(create)
+            return name
+
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}')
+        cursor.execute(create)
+        cursor.execute(f'INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_month}', bounds)
+        cursor.execute(f'DELETE FROM {DEFAULT_PARTITION} WHERE {in_month}', bounds)
+        cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT')
+    return name
+
+
+def ensure_partitions(months_ahead: Optional[int] = None, today: Optional[date] = None) -> List[str]:
+    """Create the missing partitions from this month to ``months_ahead``
+    months from now, and for every month with rows in the DEFAULT partition
+    that the retention policy still keeps. Returns the partitions created."""
+    config = settings.RATE_PARTITIONS
+    if months_ahead is None:
+        months_ahead = config.get('months_ahead', 3)
+    current = month_start(today or date.today())
+    horizon = _horizon(config.get('retention_months', 0), today)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT DISTINCT date_trunc('month', valuation_date)::date FROM {DEFAULT_PARTITION}")
+        months = {month for month, in cursor.fetchall() if horizon is None or month >= horizon}
+    months.update(add_months(current, offset) for offset in range(months_ahead + 1))
+
+    existing = {month for month, _, _ in list_partitions()}
+    return [create_partition(month) for month in sorted(months - existing)]
+
+
+def _priority_sql(priorities: Dict[str, int]) -> Tuple[str, list]:
+    if not priorities:
+        return '0', []
+    whens = ' '.join('WHEN %s THEN %s' for _ in priorities)
+    params = [value for item in priorities.items() for value in item]
+    return f'CASE provider {whens} ELSE 999 END', params
+
+
+def compact_partition(name: str, priorities: Optional[Dict[str, int]] = None) -> int:
+    """Delete every rate of a partition but the winning one per (pair, date):
+    a non-zero rate first, then the best provider priority, then the most
+    recently stored, as ``core.snapshots`` resolves them, so the snapshots
+    stay valid. Returns the rows deleted."""
+    if priorities is None:
+        priorities = ProviderFactory.get_provider_priorities()
+    priority, params = _priority_sql(priorities)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            DELETE FROM {name} AS rate
+            USING (
+                SELECT id, row_number() OVER (
+                    PARTITION BY source_currency_id, exchanged_currency_id, valuation_date
+                    ORDER BY rate_value = 0, {priority}, created_at DESC, id DESC
+                ) AS position
+                FROM {name}
+            ) AS ranked
+            WHERE rate.id = ranked.id AND ranked.position > 1
+            """,
+            params
+        )
+        deleted = cursor.rowcount
+        cursor.execute(f"COMMENT ON TABLE {name} IS '{COMPACTED}'")
+    return deleted
+
+
+def expire_partition(month: date, name: str, drop: bool = False) -> Optional[str]:
+    """Detach a partition and rename it to its archive name, or drop it.
+    The snapshots of its dates go with it. Returns the archive name, or
+    None once dropped."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+        if drop:
+            cursor.execute(f'DROP TABLE {name}')
+            archived = None
+        else:
+            archived = archive_name(month)
+            cursor.execute(f'ALTER TABLE {name} RENAME TO {archived}')
+        DailyRateSnapshot.objects.filter(
+            valuation_date__gte=month, valuation_date__lt=add_months(month, 1)
+        ).delete()
+    return archived
+
+
+def apply_retention(
+    compact_after_months: Optional[int] = None,
+    retention_months: Optional[int] = None,
+    drop: Optional[bool] = None,
+    recompact: bool = False,
+    dry_run: bool = False,
+    today: Optional[date] = None
+) -> dict:
+    """Compact the partitions older than ``compact_after_months`` months and
+    expire the ones older than ``retention_months`` months; 0 turns either
+    step off. Arguments left as None come from ``settings.RATE_PARTITIONS``.
+    Compacted partitions are marked and skipped on later runs unless
+    ``recompact`` is set."""
+    config = settings.RATE_PARTITIONS
+    if compact_after_months is None:
+        compact_after_months = config.get('compact_after_months', 0)
+    if retention_months is None:
+        retention_months = config.get('retention_months', 0)
+    if drop is None:
+        drop = config.get('drop_expired', False)
+
+    compact_before = _horizon(compact_after_months, today)
+    expire_before = _horizon(retention_months, today)
+    priorities = ProviderFactory.get_provider_priorities()
+    summary = {'compacted': [], 'rows_deleted': 0, 'expired': [], 'dropped': drop, 'dry_run': dry_run}
+
+    for month, name, compacted in list_partitions():
+        if expire_before is not None and month < expire_before:
+            summary['expired'].append(name)
+            if not dry_run:
+                expire_partition(month, name, drop=drop)
+        elif compact_before is not None and month < compact_before and (recompact or not compacted):
+            summary['compacted'].append(name)
+            if not dry_run:
+                summary['rows_deleted'] += compact_partition(name, priorities)
+
+    if expire_before is not None and not dry_run:
+        # Rates outside every partition (the DEFAULT one) follow the same horizon.
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {DEFAULT_PARTITION} WHERE valuation_date < %s', [expire_before])
+            summary['rows_deleted'] += cursor.rowcount
+        DailyRateSnapshot.objects.filter(valuation_date__lt=expire_before).delete()
+
+    return summary
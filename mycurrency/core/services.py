@@ -1,115 +1,752 @@
-from datetime import date
+from datetime import date, timedelta
 from decimal import Decimal
-from typing import Dict, Any, Optional, List
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import nullcontext
+from typing import Dict, Any, Optional, List, Tuple, Callable, ContextManager
+import contextvars
 import logging
+import threading
+
+from django.conf import settings
 
 from providers.factory import ProviderFactory
+from providers.limits import ProviderThrottled
+from core.cache import DERIVED_PROVIDER, rate_cache, currency_codes
+from core.metrics import metrics
+from core.singleflight import single_flight
+from core.snapshots import get_rate_snapshots, refresh_rate_snapshots, pick_rate, resolve_rates, snapshots_enabled
+from core.traffic import request_traffic
 from core.models import Currency, CurrencyExchangeRate
 
 logger = logging.getLogger(__name__)
 
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
 def get_exchange_rate_data(
     source_currency: str,
     exchanged_currency: str,
     valuation_date: date,
-    provider: Optional[str] = None
+    provider: Optional[str] = None,
+    allow_derived: Optional[bool] = None
 ) -> Dict[str, Any]:
-    db_rate = None
+    request_traffic.record(source_currency, exchanged_currency)
+    
+    with metrics.timer('rate_lookup_seconds') as labels:
+        outcome, result = _lookup_exchange_rate(
+            source_currency, exchanged_currency, valuation_date, provider, allow_derived
+        )
+        labels['outcome'] = outcome
+    metrics.inc('rate_lookups_total', outcome=outcome)
+    return result
+
+def _lookup_exchange_rate(
+    source_currency: str,
+    exchanged_currency: str,
+    valuation_date: date,
+    provider: Optional[str],
+    allow_derived: Optional[bool]
+) -> Tuple[str, Dict[str, Any]]:
+    """Resolve a rate and report where it came from: the cache, the database,
+    a derived cross rate or a provider (``miss`` when nothing had it)."""
+    cached = rate_cache.get(source_currency, exchanged_currency, valuation_date, provider)
+    if cached is not None:
+        return 'cache', cached
+
     if not provider:
-        try:
-            source = Currency.objects.get(code=source_currency)
-            target = Currency.objects.get(code=exchanged_currency)
-            db_rate = CurrencyExchangeRate.objects.filter(
-                source_currency=source,
-                exchanged_currency=target,
-                valuation_date=valuation_date
-            ).order_by('-created_at').first()
-        except (Currency.DoesNotExist, CurrencyExchangeRate.DoesNotExist):
-            pass
-    
-    if db_rate:
-        return {
-            'source_currency': source_currency,
-            'exchanged_currency': exchanged_currency,
+        stored = _get_stored_rate(source_currency, exchanged_currency, valuation_date)
+        if stored is not None:
+            return 'database', stored
+
+    if not provider and _derivation_enabled(allow_derived):
+        derived = _get_derived_rate(source_currency, exchanged_currency, valuation_date)
+        if derived.get('success'):
+            return 'derived', derived
+
+    if provider:
+        result = single_flight.do(
+            rate_cache.make_key(source_currency, exchanged_currency, valuation_date, provider),
+            lambda: _fetch_from_provider(provider, source_currency, exchanged_currency, valuation_date),
+            lambda: rate_cache.get(source_currency, exchanged_currency, valuation_date, provider)
+        )
+        if result is not None:
+            return ('provider' if result.get('success') else 'miss'), result
+
+    result = _fetch_from_providers(source_currency, exchanged_currency, valuation_date)
+    return ('provider' if result.get('success') else 'miss'), result
+
+def _get_stored_rate(
+    source_currency: str,
+    exchanged_currency: str,
+    valuation_date: date
+) -> Optional[Dict[str, Any]]:
+    source_id = currency_codes.get_id(source_currency)
+    target_id = currency_codes.get_id(exchanged_currency)
+    if not (source_id and target_id):
+        return None
+    
+    rows = CurrencyExchangeRate.objects.filter(
+        source_currency_id=source_id,
+        exchanged_currency_id=target_id,
+        valuation_date=valuation_date
+    ).order_by('-created_at').values_list('rate_value', 'provider')
+    result = _stored_rate_result(source_currency, exchanged_currency, valuation_date, rows)
+    if result:
+        rate_cache.set(source_currency, exchanged_currency, valuation_date, result)
+    return result
+
+def _stored_rate_result(
+    source_currency: str,
+    exchanged_currency: str,
+    valuation_date: date,
+    rows
+) -> Optional[Dict[str, Any]]:
+    """The stored rate of one pair and date from its (rate, provider) rows,
+    newest first, picked as the snapshots pick it."""
+    stored = pick_rate(rows)
+    if stored is None:
+        return None
+    return {
+        'source_currency': source_currency,
+        'exchanged_currency': exchanged_currency,
+        'valuation_date': valuation_date,
+        'rate_value': stored[0],
+        'provider': stored[1],
+        'success': True,
+        'from_database': True
+    }
+
+def _fetch_from_provider(
+    provider: str,
+    source_currency: str,
+    exchanged_currency: str,
+    valuation_date: date
+) -> Optional[Dict[str, Any]]:
+    """Fetch a rate from one provider; None means the provider had no rate
+    and the caller should fall back to the chain."""
+    try:
+        adapter = ProviderFactory.get_provider(provider)
+        result = adapter.get_exchange_rate(source_currency, exchanged_currency, valuation_date)
+        if not result.get('success'):
+            return None
+        _save_exchange_rate(result)
+        rate_cache.set(source_currency, exchanged_currency, valuation_date, result, provider)
+        return result
+    except Exception as e:
+        logger.error(f"Error with provider {provider}: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+def _fetch_from_providers(
+    source_currency: str,
+    exchanged_currency: str,
+    valuation_date: date
+) -> Dict[str, Any]:
+    """Fetch a rate through the provider chain. Concurrent fetches of the same
+    pair and date are coalesced so only one of them calls the providers."""
+    return single_flight.do(
+        rate_cache.make_key(source_currency, exchanged_currency, valuation_date),
+        lambda: _fetch_from_provider_chain(source_currency, exchanged_currency, valuation_date),
+        lambda: (
+            rate_cache.get(source_currency, exchanged_currency, valuation_date)
+            or _get_stored_rate(source_currency, exchanged_currency, valuation_date)
+        )
+    )
+
+def _fetch_from_provider_chain(
+    source_currency: str,
+    exchanged_currency: str,
+    valuation_date: date
+) -> Dict[str, Any]:
+    provider_names = [config['name'] for config in ProviderFactory.get_active_providers()]
+    
+    def fetch(provider_name: str) -> Dict[str, Any]:
+        adapter = ProviderFactory.get_provider(provider_name)
+        return adapter.get_exchange_rate(source_currency, exchanged_currency, valuation_date)
+    
+    fallback = getattr(settings, 'PROVIDER_FALLBACK', {})
+    if fallback.get('mode') == 'hedged' and len(provider_names) > 1:
+        result = _run_hedged_chain(
+            provider_names,
+            fetch,
+            hedge_delay=fallback.get('hedge_delay', 0.25),
+            max_concurrency=fallback.get('max_concurrency', 2)
+        )
+    else:
+        result = _run_provider_chain(provider_names, fetch)
+    
+    if result is None:
+        return {'success': False, 'error': 'No provider could fetch the exchange rate'}
+    
+    _save_exchange_rate(result)
+    rate_cache.set(source_currency, exchanged_currency, valuation_date, result)
+    return result
+
+def _call_provider(provider_name: str, fetch: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+    try:
+        result = fetch(provider_name)
+    except ProviderThrottled as e:
+        logger.info(str(e))
+        result = {'success': False, 'error': str(e)}
+    except Exception as e:
+        logger.error(f"Error with provider {provider_name}: {str(e)}")
+        result = {'success': False, 'error': str(e)}
+    if not result.get('success'):
+        metrics.inc('provider_fallbacks_total', provider=provider_name)
+    return result
+
+def _run_provider_chain(
+    provider_names: List[str],
+    fetch: Callable[[str], Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """Try providers one after another and return the first successful result."""
+    for provider_name in provider_names:
+        result = _call_provider(provider_name, fetch)
+        if result.get('success'):
+            return result
+    return None
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    """Thread pool shared by every hedged chain, created on first use so
+    conversions do not pay for starting threads."""
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                workers = getattr(settings, 'PROVIDER_FALLBACK', {}).get('executor_workers', 32)
+                _hedge_executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='provider-hedge')
+    return _hedge_executor
+
+def _run_hedged_chain(
+    provider_names: List[str],
+    fetch: Callable[[str], Dict[str, Any]],
+    hedge_delay: float,
+    max_concurrency: int
+) -> Optional[Dict[str, Any]]:
+    """Start the top-priority provider and launch the next one whenever no
+    answer has arrived within ``hedge_delay`` seconds (or as soon as a call
+    fails), keeping at most ``max_concurrency`` calls in flight. The first
+    successful result wins, ties going to the higher-priority provider; calls
+    still queued are cancelled and late answers are discarded."""
+    executor = _get_hedge_executor()
+    pending = {}
+    results = {}
+    next_index = 0
+    
+    def launch():
+        nonlocal next_index
+        context = contextvars.copy_context()
+        future = executor.submit(context.run, _call_provider, provider_names[next_index], fetch)
+        pending[future] = next_index
+        next_index += 1
+    
+    try:
+        while pending or next_index < len(provider_names):
+            if not pending:
+                launch()
+                continue
+            
+            can_hedge = next_index < len(provider_names) and len(pending) < max_concurrency
+            done, _ = wait(
+                pending,
+                timeout=hedge_delay if can_hedge else None,
+                return_when=FIRST_COMPLETED
+            )
+            if not done:
+                launch()
+                continue
+            
+            for future in done:
+                results[pending.pop(future)] = future.result()
+            
+            for index in sorted(results):
+                if results[index].get('success'):
+                    return results[index]
+        return None
+    finally:
+        for future in pending:
+            future.cancel()
+
+def get_exchange_rates_data(
+    pairs: List[Tuple[str, str, date]],
+    derivable_pairs: Optional[set] = None
+) -> Dict[Tuple[str, str, date], Dict[str, Any]]:
+    """Resolve many (source, target, date) rates at once: cache first, then a
+    single database query, then cross rates for pairs in ``derivable_pairs``
+    and finally one provider table per base currency and date for whatever
+    is still missing."""
+    derivable_pairs = derivable_pairs or set()
+    resolved = {}
+    pending = set()
+    
+    for key in set(pairs):
+        request_traffic.record(key[0], key[1])
+        cached = rate_cache.get(*key)
+        if cached is not None:
+            resolved[key] = cached
+        else:
+            pending.add(key)
+    
+    for source_code, target_code, valuation_date, rate_value, provider in _stored_rates(pending):
+        key = (source_code, target_code, valuation_date)
+        if key not in pending or key in resolved:
+            continue
+        resolved[key] = {
+            'source_currency': source_code,
+            'exchanged_currency': target_code,
             'valuation_date': valuation_date,
-            'rate_value': db_rate.rate_value,
-            'provider': db_rate.provider,
+            'rate_value': rate_value,
+            'provider': provider,
             'success': True,
             'from_database': True
         }
+        rate_cache.set(source_code, target_code, valuation_date, resolved[key])
+    
+    graphs = {}
+    for key in pending:
+        if key in resolved or key not in derivable_pairs:
+            continue
+        derived = _get_derived_rate(*key, graphs=graphs)
+        if derived.get('success'):
+            resolved[key] = derived
+    
+    groups = {}
+    for source_code, target_code, valuation_date in pending:
+        if (source_code, target_code, valuation_date) not in resolved:
+            groups.setdefault((source_code, valuation_date), []).append(target_code)
+    
+    for (source_code, valuation_date), target_codes in groups.items():
+        resolved.update(_fetch_table_from_providers(source_code, target_codes, valuation_date))
+    
+    return resolved
+
+def _fetch_table_from_providers(
+    source_currency: str,
+    exchanged_currencies: List[str],
+    valuation_date: date
+) -> Dict[Tuple[str, str, date], Dict[str, Any]]:
+    """Fetch the rates of one base currency and date through
+    ``get_exchange_rate_table``, keyed like ``get_exchange_rates_data``."""
+    table = get_exchange_rate_table(source_currency, exchanged_currencies, valuation_date)
+    rates = table.get('rates', {})
+    
+    resolved = {}
+    for code in exchanged_currencies:
+        key = (source_currency, code, valuation_date)
+        if code not in rates:
+            resolved[key] = {'success': False, 'error': 'No provider could fetch the exchange rate'}
+            continue
+        resolved[key] = {
+            'source_currency': source_currency,
+            'exchanged_currency': code,
+            'valuation_date': valuation_date,
+            'rate_value': rates[code],
+            'provider': table['providers'][code],
+            'success': True
+        }
+        rate_cache.set(source_currency, code, valuation_date, resolved[key])
+    return resolved
+
+def _stored_rates(keys: set):
+    """Stored (source, target, date, rate, provider) of each key that has a
+    rate, resolved by ``core.snapshots.resolve_rates``. With snapshots
+    enabled this reads one snapshot row per base currency and date instead
+    of the individual rates."""
+    if not keys:
+        return
+    
+    if snapshots_enabled():
+        snapshots = get_rate_snapshots({(source, valuation_date) for source, _, valuation_date in keys})
+    else:
+        snapshots = {
+            key: {code: (Decimal(rate_value), provider) for code, (rate_value, provider) in rates.items()}
+            for key, rates in resolve_rates(_stored_rate_rows(keys)).items()
+        }
+    for source, target, valuation_date in keys:
+        stored = snapshots.get((source, valuation_date), {}).get(target)
+        if stored is not None:
+            yield source, target, valuation_date, stored[0], stored[1]
+
+def _stored_rate_rows(keys: set):
+    """Stored (source id, target id, date, rate, provider) rows covering the
+    keys, newest first."""
+    currency_ids = currency_codes.get_ids({key[0] for key in keys} | {key[1] for key in keys})
+    if not currency_ids:
+        return []
+    return CurrencyExchangeRate.objects.filter(
+        source_currency_id__in={currency_ids[key[0]] for key in keys if key[0] in currency_ids},
+        exchanged_currency_id__in={currency_ids[key[1]] for key in keys if key[1] in currency_ids},
+        valuation_date__in={key[2] for key in keys}
+    ).order_by('-created_at').values_list(
+        'source_currency_id', 'exchanged_currency_id',
+        'valuation_date', 'rate_value', 'provider'
+    )
 
+def get_exchange_rate_table(
+    source_currency: str,
+    exchanged_currencies: List[str],
+    valuation_date: date,
+    provider: Optional[str] = None,
+    provider_slot: Optional[Callable[[str], ContextManager]] = None
+) -> Dict[str, Any]:
+    """Fetch the rates from one base currency to many currencies with one call
+    per provider, walking the fallback chain only for currencies still missing.
+    Every rate returned is persisted. Each provider call is made inside
+    ``provider_slot(provider_name)`` when given; exceptions raised on entering
+    it propagate."""
+    missing = [code for code in dict.fromkeys(exchanged_currencies) if code != source_currency]
+    rates = {}
+    providers = {}
+    
     if provider:
-        try:
-            adapter = ProviderFactory.get_provider(provider)
-            result = adapter.get_exchange_rate(source_currency, exchanged_currency, valuation_date)
-            if result.get('success'):
-                _save_exchange_rate(result)
-                return result
-        except Exception as e:
-            logger.error(f"Error with provider {provider}: {str(e)}")
-            return {'success': False, 'error': str(e)}
-
-    providers = ProviderFactory.get_active_providers()
-    
-    for provider_config in providers:
-        provider_name = provider_config['name']
-        try:
-            adapter = ProviderFactory.get_provider(provider_name)
-            result = adapter.get_exchange_rate(source_currency, exchanged_currency, valuation_date)
-            if result.get('success'):
-                _save_exchange_rate(result)
-                return result
-        except Exception as e:
-            logger.error(f"Error with provider {provider_name}: {str(e)}")
+        provider_names = [provider]
+    else:
+        provider_names = [config['name'] for config in ProviderFactory.get_active_providers()]
+    
+    for provider_name in provider_names:
+        if not missing:
+            break
+        with provider_slot(provider_name) if provider_slot else nullcontext():
+            try:
+                adapter = ProviderFactory.get_provider(provider_name)
+                table = adapter.get_rates(source_currency, missing, valuation_date)
+            except ProviderThrottled as e:
+                logger.info(str(e))
+                continue
+            except Exception as e:
+                logger.error(f"Error with provider {provider_name}: {str(e)}")
+                continue
+        
+        if not table.get('success'):
+            logger.error(f"Error with provider {provider_name}: {table.get('error')}")
             continue
+        
+        _save_exchange_rates([
+            {
+                'source_currency': source_currency,
+                'exchanged_currency': code,
+                'valuation_date': valuation_date,
+                'rate_value': rate_value,
+                'provider': table['provider'],
+                'success': True
+            }
+            for code, rate_value in table['rates'].items()
+        ])
+        for code, rate_value in table['rates'].items():
+            rates[code] = rate_value
+            providers[code] = table['provider']
+        missing = [code for code in missing if code not in rates]
+    
+    if not rates:
+        return {'success': False, 'error': 'No provider could fetch the exchange rates'}
     
-    return {'success': False, 'error': 'No provider could fetch the exchange rate'}
+    return {
+        'source_currency': source_currency,
+        'valuation_date': valuation_date,
+        'rates': rates,
+        'providers': providers,
+        'missing': missing,
+        'success': True
+    }
 
-def _save_exchange_rate(data: Dict[str, Any]):
-    if not data.get('success'):
-        return
+def _derivation_enabled(allow_derived: Optional[bool] = None) -> bool:
+    if allow_derived is None:
+        return getattr(settings, 'CROSS_RATES', {}).get('enabled', False)
+    return allow_derived
+
+def build_rate_graph(valuation_date: date) -> Dict[str, Dict[str, Tuple[Decimal, str]]]:
+    """Build the rate graph for one date from the stored rates.
     
-    try:
-        source, _ = Currency.objects.get_or_create(
-            code=data['source_currency'],
-            defaults={'name': data['source_currency'], 'symbol': data['source_currency']}
+    Each edge maps ``graph[source][target]`` to ``(rate, provider)``. When a pair
+    is stored by several providers ``core.snapshots.resolve_rates`` picks the
+    winner. Inverse edges are added for pairs that are not stored in the
+    opposite direction.
+    """
+    rows = CurrencyExchangeRate.objects.filter(
+        valuation_date=valuation_date
+    ).order_by('-created_at').values_list(
+        'source_currency_id', 'exchanged_currency_id', 'valuation_date', 'rate_value', 'provider'
+    )
+    best = {
+        (source_code, target_code): (Decimal(rate_value), provider)
+        for (source_code, _), rates in resolve_rates(rows).items()
+        for target_code, (rate_value, provider) in rates.items()
+    }
+    
+    graph = {}
+    for (source_code, target_code), (rate_value, provider) in best.items():
+        graph.setdefault(source_code, {})[target_code] = (rate_value, provider)
+    for (source_code, target_code), (rate_value, provider) in best.items():
+        inverse = graph.setdefault(target_code, {})
+        if source_code not in inverse:
+            inverse[source_code] = (Decimal('1') / rate_value, provider)
+    
+    return graph
+
+def _find_rate_path(
+    graph: Dict[str, Dict[str, Tuple[Decimal, str]]],
+    source_currency: str,
+    exchanged_currency: str,
+    max_hops: int,
+    base_currency: Optional[str] = None
+) -> Optional[List[str]]:
+    """Shortest path of at most ``max_hops`` edges. A stored or inverse edge
+    between the two currencies comes first, then the route through
+    ``base_currency``, then any other route."""
+    if max_hops < 1 or source_currency not in graph:
+        return None
+    
+    if exchanged_currency in graph[source_currency]:
+        return [source_currency, exchanged_currency]
+    
+    if max_hops >= 2 and base_currency and base_currency not in (source_currency, exchanged_currency):
+        if base_currency in graph[source_currency] and exchanged_currency in graph.get(base_currency, {}):
+            return [source_currency, base_currency, exchanged_currency]
+    
+    previous = {source_currency: None}
+    frontier = [source_currency]
+    for _ in range(max_hops):
+        next_frontier = []
+        for code in frontier:
+            for neighbour in graph.get(code, {}):
+                if neighbour in previous:
+                    continue
+                previous[neighbour] = code
+                if neighbour == exchanged_currency:
+                    path = [neighbour]
+                    while previous[path[-1]] is not None:
+                        path.append(previous[path[-1]])
+                    return list(reversed(path))
+                next_frontier.append(neighbour)
+        frontier = next_frontier
+    
+    return None
+
+def _get_derived_rate(
+    source_currency: str,
+    exchanged_currency: str,
+    valuation_date: date,
+    graphs: Optional[Dict[date, Dict[str, Dict[str, Tuple[Decimal, str]]]]] = None
+) -> Dict[str, Any]:
+    """``get_cross_rate_data`` behind the rate cache, under the derived
+    provider slot. ``graphs`` memoizes the rate graph per date across calls."""
+    cached = rate_cache.get(source_currency, exchanged_currency, valuation_date, DERIVED_PROVIDER)
+    if cached is not None:
+        return cached
+    
+    graph = None
+    if graphs is not None:
+        if valuation_date not in graphs:
+            graphs[valuation_date] = build_rate_graph(valuation_date)
+        graph = graphs[valuation_date]
+    
+    derived = get_cross_rate_data(source_currency, exchanged_currency, valuation_date, graph=graph)
+    if derived.get('success'):
+        rate_cache.set(source_currency, exchanged_currency, valuation_date, derived, DERIVED_PROVIDER)
+    return derived
+
+def get_cross_rate_data(
+    source_currency: str,
+    exchanged_currency: str,
+    valuation_date: date,
+    max_hops: Optional[int] = None,
+    graph: Optional[Dict[str, Dict[str, Tuple[Decimal, str]]]] = None
+) -> Dict[str, Any]:
+    """Derive a rate from the stored rates of the same date, either through the
+    configured base currency or along the shortest path of at most
+    ``max_hops`` conversions. Inverse pairs are served the same way."""
+    config = getattr(settings, 'CROSS_RATES', {})
+    if max_hops is None:
+        max_hops = config.get('max_hops', 2)
+    if graph is None:
+        graph = build_rate_graph(valuation_date)
+    
+    path = _find_rate_path(
+        graph, source_currency, exchanged_currency, max_hops, config.get('base_currency')
+    )
+    if not path:
+        return {'success': False, 'error': 'No cross rate path available'}
+    
+    rate_value = Decimal('1')
+    providers = []
+    for hop_source, hop_target in zip(path, path[1:]):
+        hop_rate, hop_provider = graph[hop_source][hop_target]
+        rate_value *= hop_rate
+        providers.append(hop_provider)
+    
+    return {
+        'source_currency': source_currency,
+        'exchanged_currency': exchanged_currency,
+        'valuation_date': valuation_date,
+        'rate_value': rate_value.quantize(Decimal('0.000001')),
+        'provider': 'derived',
+        'derived': True,
+        'path': path,
+        'path_providers': providers,
+        'success': True
+    }
+
+def ensure_currencies(codes) -> Dict[str, int]:
+    """Return the ids for the given currency codes, creating missing currencies in bulk."""
+    codes = set(codes)
+    currency_ids = currency_codes.get_ids(codes)
+    
+    missing = codes - set(currency_ids)
+    if missing:
+        Currency.objects.bulk_create(
+            [Currency(code=code, name=code, symbol=code) for code in missing],
+            ignore_conflicts=True
         )
-        target, _ = Currency.objects.get_or_create(
-            code=data['exchanged_currency'],
-            defaults={'name': data['exchanged_currency'], 'symbol': data['exchanged_currency']}
+        # bulk_create does not send post_save, so drop the map explicitly.
+        currency_codes.invalidate()
+        currency_ids = currency_codes.get_ids(codes)
+    
+    return currency_ids
+
+def _save_exchange_rates(rates: List[Dict[str, Any]]) -> int:
+    """Upsert many rates with as few statements as possible: one query to
+    resolve currency codes, one to create missing currencies and one
+    ``INSERT ... ON CONFLICT`` per batch of rates."""
+    rates = [data for data in rates if data.get('success', True)]
+    if not rates:
+        return 0
+    
+    with metrics.timer('rate_save_seconds') as labels:
+        saved = _upsert_exchange_rates(rates)
+        labels['outcome'] = 'success' if saved else 'error'
+    metrics.inc('rates_saved_total', saved)
+    return saved
+
+def _upsert_exchange_rates(rates: List[Dict[str, Any]]) -> int:
+    try:
+        currency_ids = ensure_currencies(
+            {data['source_currency'] for data in rates} | {data['exchanged_currency'] for data in rates}
         )
         
-        CurrencyExchangeRate.objects.update_or_create(
-            source_currency=source,
-            exchanged_currency=target,
-            valuation_date=data['valuation_date'],
-            provider=data['provider'],
-            defaults={'rate_value': data['rate_value']}
+        objects = {}
+        for data in rates:
+            key = (data['source_currency'], data['exchanged_currency'], data['valuation_date'], data['provider'])
+            objects[key] = CurrencyExchangeRate(
+                source_currency_id=currency_ids[data['source_currency']],
+                exchanged_currency_id=currency_ids[data['exchanged_currency']],
+                valuation_date=data['valuation_date'],
+                provider=data['provider'],
+                rate_value=data['rate_value']
+            )
+        
+        CurrencyExchangeRate.objects.bulk_create(
+            list(objects.values()),
+            batch_size=settings.RATE_BULK_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['source_currency', 'exchanged_currency', 'valuation_date', 'provider'],
+            update_fields=['rate_value']
         )
+        
+        for source_currency, exchanged_currency, valuation_date, provider in objects:
+            rate_cache.invalidate(source_currency, exchanged_currency, valuation_date, provider)
+    except Exception as e:
+        logger.error(f"Error saving exchange rates: {str(e)}")
+        return 0
+    
+    try:
+        refresh_rate_snapshots({(source, valuation_date) for source, _, valuation_date, _ in objects})
     except Exception as e:
-        logger.error(f"Error saving exchange rate: {str(e)}")
+        logger.error(f"Error refreshing rate snapshots: {str(e)}")
+    
+    return len(objects)
+
+def _save_exchange_rate(data: Dict[str, Any]):
+    if not data.get('success'):
+        return
+    
+    _save_exchange_rates([data])
 
 def convert_amount(
     source_currency: str,
     amount: Decimal,
     exchanged_currency: str,
-    valuation_date: Optional[date] = None
+    valuation_date: Optional[date] = None,
+    allow_derived: Optional[bool] = None
 ) -> Dict[str, Any]:
     if valuation_date is None:
         valuation_date = date.today()
     
-    rate_data = get_exchange_rate_data(
-        source_currency=source_currency,
-        exchanged_currency=exchanged_currency,
-        valuation_date=valuation_date
-    )
+    with metrics.timer('conversion_seconds') as labels:
+        rate_data = get_exchange_rate_data(
+            source_currency=source_currency,
+            exchanged_currency=exchanged_currency,
+            valuation_date=valuation_date,
+            allow_derived=allow_derived
+        )
+        labels['outcome'] = 'success' if rate_data.get('success') else 'error'
+        
+        if not rate_data.get('success'):
+            return rate_data
+        
+        return _build_conversion(source_currency, amount, exchanged_currency, valuation_date, rate_data)
+
+def convert_amounts(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Convert a batch of amounts, resolving all needed rates together.
     
-    if not rate_data.get('success'):
-        return rate_data
+    Each item holds ``source_currency``, ``amount``, ``exchanged_currency`` and
+    optional ``valuation_date`` and ``allow_derived`` values. Results are
+    returned in the same order and a failed item does not fail the rest of the
+    batch.
+    """
+    today = date.today()
+    pairs = []
+    derivable_pairs = set()
+    for item in items:
+        if item['source_currency'] != item['exchanged_currency']:
+            key = (
+                item['source_currency'],
+                item['exchanged_currency'],
+                item.get('valuation_date') or today
+            )
+            pairs.append(key)
+            if _derivation_enabled(item.get('allow_derived')):
+                derivable_pairs.add(key)
     
+    rates = get_exchange_rates_data(pairs, derivable_pairs)
+    
+    results = []
+    for item in items:
+        valuation_date = item.get('valuation_date') or today
+        if item['source_currency'] == item['exchanged_currency']:
+            rate_data = {'rate_value': Decimal('1'), 'provider': None, 'success': True}
+        else:
+            rate_data = rates[(item['source_currency'], item['exchanged_currency'], valuation_date)]
+        
+        if not rate_data.get('success'):
+            results.append({
+                'source_currency': item['source_currency'],
+                'amount': item['amount'],
+                'exchanged_currency': item['exchanged_currency'],
+                'valuation_date': valuation_date,
+                'success': False,
+                'error': rate_data.get('error', 'Conversion failed')
+            })
+            continue
+        
+        results.append(_build_conversion(
+            item['source_currency'],
+            item['amount'],
+            item['exchanged_currency'],
+            valuation_date,
+            rate_data
+        ))
+    
+    return results
+
+def _build_conversion(
+    source_currency: str,
+    amount: Decimal,
+    exchanged_currency: str,
+    valuation_date: date,
+    rate_data: Dict[str, Any]
+) -> Dict[str, Any]:
     converted_amount = amount * rate_data['rate_value']
     
-    return {
+    result = {
         'source_currency': source_currency,
         'amount': amount,
         'exchanged_currency': exchanged_currency,
@@ -118,4 +755,96 @@ def convert_amount(
         'valuation_date': valuation_date,
         'provider': rate_data['provider'],
         'success': True
-    }
\ No newline at end of file
+    }
+    if rate_data.get('derived'):
+        result['derived'] = True
+        result['path'] = rate_data['path']
+    return result
+
+def convert_amount_timeseries(
+    source_currency: str,
+    amount: Decimal,
+    exchanged_currency: str,
+    date_from: date,
+    date_to: date,
+    fill: str = 'previous'
+) -> Dict[str, Any]:
+    """Convert an amount for every day between two dates from stored rates.
+    
+    The whole series is read with one query. Days without a rate are filled
+    according to ``fill``: ``previous`` carries the last known rate forward
+    (the previous business day over weekends and holidays), ``interpolate``
+    interpolates linearly between the surrounding known rates and ``none``
+    leaves them empty. Rates and amounts stay Decimal throughout.
+    """
+    lookback = getattr(settings, 'TIMESERIES', {}).get('lookback_days', 7)
+    priorities = ProviderFactory.get_provider_priorities()
+    source_id = currency_codes.get_id(source_currency)
+    target_id = currency_codes.get_id(exchanged_currency)
+    if not source_id or not target_id:
+        return {'success': False, 'error': 'No rates found for the specified period'}
+    
+    rows = CurrencyExchangeRate.objects.filter(
+        source_currency_id=source_id,
+        exchanged_currency_id=target_id,
+        valuation_date__gte=date_from - timedelta(days=lookback),
+        valuation_date__lte=date_to
+    ).order_by('-created_at').values_list('valuation_date', 'rate_value', 'provider')
+    
+    by_date = {}
+    for valuation_date, rate_value, provider in rows:
+        by_date.setdefault(valuation_date, []).append((rate_value, provider))
+    known = {}
+    for valuation_date, date_rows in by_date.items():
+        stored = pick_rate(date_rows, priorities)
+        if stored is not None:
+            known[valuation_date] = stored[0]
+    
+    if not known:
+        return {'success': False, 'error': 'No rates found for the specified period'}
+    
+    known_dates = sorted(known)
+    days = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+    rates = []
+    filled = []
+    previous_index = -1
+    
+    for day in days:
+        while previous_index + 1 < len(known_dates) and known_dates[previous_index + 1] <= day:
+            previous_index += 1
+        previous_date = known_dates[previous_index] if previous_index >= 0 else None
+        
+        if previous_date == day:
+            rates.append(known[day])
+            filled.append(False)
+            continue
+        
+        rate_value = None
+        if fill == 'previous' and previous_date is not None:
+            rate_value = known[previous_date]
+        elif fill == 'interpolate' and previous_date is not None:
+            rate_value = known[previous_date]
+            if previous_index + 1 < len(known_dates):
+                next_date = known_dates[previous_index + 1]
+                weight = Decimal((day - previous_date).days) / Decimal((next_date - previous_date).days)
+                rate_value = (rate_value + (known[next_date] - rate_value) * weight).quantize(Decimal('0.000001'))
+        
+        rates.append(rate_value)
+        filled.append(rate_value is not None)
+    
+    converted_amounts = [
+        (amount * rate_value).quantize(Decimal('0.01')) if rate_value is not None else None
+        for rate_value in rates
+    ]
+    
+    return {
+        'source_currency': source_currency,
+        'exchanged_currency': exchanged_currency,
+        'amount': amount,
+        'fill': fill,
+        'dates': days,
+        'rates': rates,
+        'converted_amounts': converted_amounts,
+        'filled': filled,
+        'success': True
+    }
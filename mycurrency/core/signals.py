@@ -0,0 +1,24 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.cache import currency_codes
+from core.models import Currency, CurrencyExchangeRate
+from core.snapshots import refresh_rate_snapshots
+
+@receiver(post_save, sender=Currency)
+@receiver(post_delete, sender=Currency)
+def invalidate_currency_codes(sender, **kwargs):
+    currency_codes.invalidate()
+
+@receiver(post_save, sender=CurrencyExchangeRate)
+@receiver(post_delete, sender=CurrencyExchangeRate)
+def refresh_rate_snapshot(sender, instance, **kwargs):
+    # Bulk writes in core.services refresh their snapshots themselves; this
+    # covers rates saved or deleted one at a time (admin, shell, fixtures).
+    if kwargs.get('raw'):
+        return
+    source_code = currency_codes.get_code(instance.source_currency_id)
+    if source_code is not None:
+        # Saving does not convert a date given as a string.
+        valuation_date = sender._meta.get_field('valuation_date').to_python(instance.valuation_date)
+        refresh_rate_snapshots({(source_code, valuation_date)})
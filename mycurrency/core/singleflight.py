@@ -0,0 +1,228 @@
+from typing import Dict, Any, Optional, Callable, Awaitable
+import asyncio
+import logging
+import threading
+import time
+import uuid
+import weakref
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+def _copy(result):
+    # Every waiter gets its own dict so callers can annotate their result.
+    return dict(result) if isinstance(result, dict) else result
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent fetches of the same key.
+
+    The first caller for a key (the leader) runs the fetch; callers arriving
+    while it is in flight wait for its result instead of starting their own.
+    With ``distributed`` enabled the leader also takes a short lock in the
+    shared cache, and leaders in other processes poll ``recheck`` until the
+    lock holder has stored the rate, or take over once the lock is released.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._async_calls = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._stats = {
+            'leaders': 0,
+            'coalesced': 0,
+            'remote_waits': 0,
+            'remote_hits': 0,
+            'timeouts': 0,
+        }
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return getattr(settings, 'SINGLE_FLIGHT', {})
+
+    def do(
+        self,
+        key: str,
+        fetch: Callable[[], Dict[str, Any]],
+        recheck: Optional[Callable[[], Optional[Dict[str, Any]]]] = None
+    ) -> Dict[str, Any]:
+        if not self.config.get('enabled', True):
+            return fetch()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._stats['leaders' if leader else 'coalesced'] += 1
+
+        if not leader:
+            if not call.event.wait(self.config.get('wait_timeout', 10)):
+                self._count('timeouts')
+                return fetch()
+            if call.error is not None:
+                raise call.error
+            return _copy(call.result)
+
+        try:
+            call.result = self._lead(key, fetch, recheck)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def ado(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+        recheck: Optional[Callable[[], Awaitable[Optional[Dict[str, Any]]]]] = None
+    ) -> Dict[str, Any]:
+        """Async variant of do; calls are coalesced per event loop."""
+        if not self.config.get('enabled', True):
+            return await fetch()
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            calls = self._async_calls.setdefault(loop, {})
+            task = calls.get(key)
+            leader = task is None
+            if leader:
+                task = calls[key] = loop.create_task(self._alead(key, fetch, recheck))
+                task.add_done_callback(lambda done: calls.pop(key, None) if calls.get(key) is done else None)
+            self._stats['leaders' if leader else 'coalesced'] += 1
+
+        if leader:
+            return await asyncio.shield(task)
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), self.config.get('wait_timeout', 10))
+        except asyncio.TimeoutError:
+            self._count('timeouts')
+            return await fetch()
+        return _copy(result)
+
+    def _lead(self, key, fetch, recheck):
+        if not self.config.get('distributed', False):
+            return fetch()
+
+        shared = caches[self.config.get('cache_alias', 'default')]
+        lock_key = f'singleflight:{key}'
+        deadline = time.monotonic() + self.config.get('wait_timeout', 10)
+        waited = False
+
+        while True:
+            token = self._acquire(shared, lock_key)
+            if token is not None:
+                try:
+                    return fetch()
+                finally:
+                    self._release(shared, lock_key, token)
+
+            if not waited:
+                waited = True
+                self._count('remote_waits')
+            if time.monotonic() >= deadline:
+                self._count('timeouts')
+                return fetch()
+
+            time.sleep(self.config.get('poll_interval', 0.1))
+            value = recheck() if recheck is not None else None
+            if value is not None:
+                self._count('remote_hits')
+                return value
+
+    async def _alead(self, key, fetch, recheck):
+        if not self.config.get('distributed', False):
+            return await fetch()
+
+        shared = caches[self.config.get('cache_alias', 'default')]
+        lock_key = f'singleflight:{key}'
+        deadline = time.monotonic() + self.config.get('wait_timeout', 10)
+        waited = False
+
+        while True:
+            token = await self._aacquire(shared, lock_key)
+            if token is not None:
+                try:
+                    return await fetch()
+                finally:
+                    await self._arelease(shared, lock_key, token)
+
+            if not waited:
+                waited = True
+                self._count('remote_waits')
+            if time.monotonic() >= deadline:
+                self._count('timeouts')
+                return await fetch()
+
+            await asyncio.sleep(self.config.get('poll_interval', 0.1))
+            value = await recheck() if recheck is not None else None
+            if value is not None:
+                self._count('remote_hits')
+                return value
+
+    def _acquire(self, shared, lock_key: str) -> Optional[str]:
+        """Take the lock and return the token it holds, or None when another
+        caller holds it."""
+        token = uuid.uuid4().hex
+        # An unreachable lock store must not block fetches, so fail open.
+        try:
+            return token if shared.add(lock_key, token, self.config.get('lock_ttl', 15)) else None
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable: {str(e)}")
+            return token
+
+    def _release(self, shared, lock_key: str, token: str):
+        # A fetch outliving lock_ttl loses the lock to another leader, whose
+        # lock must survive; only a lock still holding our token is deleted.
+        try:
+            if shared.get(lock_key) == token:
+                shared.delete(lock_key)
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable: {str(e)}")
+
+    async def _aacquire(self, shared, lock_key: str) -> Optional[str]:
+        token = uuid.uuid4().hex
+        try:
+            return token if await shared.aadd(lock_key, token, self.config.get('lock_ttl', 15)) else None
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable: {str(e)}")
+            return token
+
+    async def _arelease(self, shared, lock_key: str, token: str):
+        try:
+            if await shared.aget(lock_key) == token:
+                await shared.adelete(lock_key)
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable: {str(e)}")
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls) + sum(len(calls) for calls in self._async_calls.values())
+        requests = stats['leaders'] + stats['coalesced']
+        stats['coalesced_ratio'] = stats['coalesced'] / requests if requests else 0.0
+        return stats
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,181 @@
+"""Materialized per-day rate tables (``DailyRateSnapshot``).
+
+Each snapshot holds every rate from one base currency on one date, already
+resolved by provider priority, so "all rates from X on D" is a single-row
+read. ``refresh_rate_snapshots`` recomputes the snapshots touched by a write
+and is called wherever rates are stored; ``rebuild_rate_snapshots``
+recomputes a whole date range.
+
+Every stored-rate read resolves rates the same way, snapshots or not
+(``resolve_rates`` for many pairs, ``pick_rate`` for one): zero rates never
+win, then the best provider priority, then the most recently stored rate.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.cache import currency_codes
+from core.models import CurrencyExchangeRate, DailyRateSnapshot
+from providers.factory import ProviderFactory
+
+REFRESH_BATCH_SIZE = 500
+
+
+def snapshots_enabled() -> bool:
+    return getattr(settings, 'RATE_SNAPSHOTS', {}).get('enabled', True)
+
+
+def pick_rate(
+    rows: Iterable[Tuple[Decimal, str]],
+    priorities: Optional[Dict[str, int]] = None
+) -> Optional[Tuple[Decimal, str]]:
+    """Winning (rate, provider) among the stored rates of one pair and date,
+    given newest first, by the same rule as ``resolve_rates``."""
+    if priorities is None:
+        priorities = ProviderFactory.get_provider_priorities()
+    best = None
+    for rate_value, provider in rows:
+        if not rate_value:
+            continue
+        rank = priorities.get(provider, 999)
+        if best is None or rank < best[2]:
+            best = (rate_value, provider, rank)
+    return best[:2] if best else None
+
+
+def resolve_rates(rows: Iterable[Tuple[int, int, date, Decimal, str]], priorities: Optional[Dict[str, int]] = None):
+    """Best rate per (base, date, target): best provider priority first, then
+    the most recently stored. Rows must come newest first."""
+    if priorities is None:
+        priorities = ProviderFactory.get_provider_priorities()
+    codes = currency_codes.codes()
+    best = {}
+    for source_id, target_id, valuation_date, rate_value, provider in rows:
+        if not rate_value:
+            continue
+        source_code = codes.get(source_id) or currency_codes.get_code(source_id)
+        target_code = codes.get(target_id) or currency_codes.get_code(target_id)
+        table = best.setdefault((source_code, valuation_date), {})
+        rank = priorities.get(provider, 999)
+        if target_code not in table or rank < table[target_code][2]:
+            table[target_code] = (rate_value, provider, rank)
+
+    return {
+        key: {code: [str(rate_value), provider] for code, (rate_value, provider, _) in sorted(table.items())}
+        for key, table in best.items()
+    }
+
+
+def _store(tables: Dict[Tuple[str, date], Dict[str, List[str]]], emptied: Set[Tuple[str, date]] = frozenset()):
+    if tables:
+        DailyRateSnapshot.objects.bulk_create(
+            [
+                DailyRateSnapshot(source_currency=source, valuation_date=valuation_date, rates=rates)
+                for (source, valuation_date), rates in tables.items()
+            ],
+            batch_size=settings.RATE_BULK_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['source_currency', 'valuation_date'],
+            update_fields=['rates', 'updated_at']
+        )
+    for source, valuation_date in emptied:
+        DailyRateSnapshot.objects.filter(source_currency=source, valuation_date=valuation_date).delete()
+
+
+def _lock(keys: Iterable[Tuple[str, date]]):
+    """Take a transaction-level advisory lock per (base, date) on PostgreSQL,
+    in a fixed order, so concurrent refreshes of a snapshot run one after
+    the other and the last one reads every committed rate. SQLite already
+    serializes writers."""
+    if connection.vendor != 'postgresql':
+        return
+    names = [f'rate-snapshot:{source}:{valuation_date}' for source, valuation_date in keys]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT pg_advisory_xact_lock(lock_key)
+            FROM (SELECT hashtext(name) AS lock_key FROM unnest(%s::text[]) AS name ORDER BY 1) AS locks
+            """,
+            [names]
+        )
+
+
+def refresh_rate_snapshots(keys: Iterable[Tuple[str, date]]) -> int:
+    """Recompute the snapshots of the given (base code, date) keys from the
+    stored rates. Keys left without any rate lose their snapshot."""
+    if not snapshots_enabled():
+        return 0
+
+    keys = set(keys)
+    priorities = ProviderFactory.get_provider_priorities()
+    refreshed = 0
+    batch = sorted(keys, key=lambda key: (key[1], key[0]))
+    for start in range(0, len(batch), REFRESH_BATCH_SIZE):
+        chunk = set(batch[start:start + REFRESH_BATCH_SIZE])
+        source_ids = currency_codes.get_ids({source for source, _ in chunk})
+        with transaction.atomic():
+            _lock(chunk)
+            rows = CurrencyExchangeRate.objects.filter(
+                source_currency_id__in=source_ids.values(),
+                valuation_date__in={valuation_date for _, valuation_date in chunk}
+            ).order_by('-created_at').values_list(
+                'source_currency_id', 'exchanged_currency_id', 'valuation_date', 'rate_value', 'provider'
+            )
+
+            tables = {key: rates for key, rates in resolve_rates(rows, priorities).items() if key in chunk}
+            _store(tables, chunk - set(tables))
+        refreshed += len(chunk)
+    return refreshed
+
+
+def rebuild_rate_snapshots(
+    date_from: date,
+    date_to: date,
+    source_currency: Optional[str] = None,
+    days_per_batch: int = 7
+) -> Iterator[Tuple[date, int]]:
+    """Recompute every snapshot between two dates, ``days_per_batch`` days
+    per query. Yields the last date of each batch and the snapshots written."""
+    priorities = ProviderFactory.get_provider_priorities()
+    day = date_from
+    while day <= date_to:
+        last = min(date_to, day + timedelta(days=days_per_batch - 1))
+        rows = CurrencyExchangeRate.objects.filter(valuation_date__range=(day, last))
+        stale = DailyRateSnapshot.objects.filter(valuation_date__range=(day, last))
+        if source_currency:
+            rows = rows.filter(source_currency_id=currency_codes.get_id(source_currency))
+            stale = stale.filter(source_currency=source_currency)
+
+        tables = resolve_rates(
+            rows.order_by('-created_at').values_list(
+                'source_currency_id', 'exchanged_currency_id', 'valuation_date', 'rate_value', 'provider'
+            ).iterator(chunk_size=5000),
+            priorities
+        )
+        started = timezone.now()
+        _store(tables)
+        # Snapshots not rewritten above have no rates left.
+        stale.filter(updated_at__lt=started).delete()
+        yield last, len(tables)
+        day = last + timedelta(days=1)
+
+
+def get_rate_snapshots(keys: Iterable[Tuple[str, date]]) -> Dict[Tuple[str, date], Dict[str, Any]]:
+    """Stored snapshots for the given (base code, date) keys, with the rates
+    as ``{code: (Decimal rate, provider)}``. Missing keys are left out."""
+    keys = set(keys)
+    if not keys:
+        return {}
+    rows = DailyRateSnapshot.objects.filter(
+        source_currency__in={source for source, _ in keys},
+        valuation_date__in={valuation_date for _, valuation_date in keys}
+    ).values_list('source_currency', 'valuation_date', 'rates')
+    return {
+        (source, valuation_date): {code: (Decimal(rate), provider) for code, (rate, provider) in rates.items()}
+        for source, valuation_date, rates in rows
+        if (source, valuation_date) in keys
+    }
@@ -1,66 +1,386 @@
-from celery import shared_task
+from celery import shared_task, chord
+from celery.result import AsyncResult, GroupResult
 import logging
+import time
+from contextlib import contextmanager
 from datetime import date, timedelta
-from core.services import get_exchange_rate_data
-from core.models import Currency
+from django.conf import settings
+from django.core.cache import cache
+from core.services import _get_stored_rate, get_exchange_rate_table, ensure_currencies
+from core.cache import rate_cache, currency_codes
+from core.metrics import metrics
+from core.traffic import request_traffic
+from core.models import CurrencyExchangeRate
+from core.partitions import partitioning_enabled, ensure_partitions, apply_retention
+from providers.factory import ProviderFactory
+from providers.limits import batch_traffic
 
 logger = logging.getLogger(__name__)
 
+class BackfillSlotBusy(Exception):
+    """Every backfill slot of a provider is taken."""
+
+    def __init__(self, provider: str):
+        super().__init__(f"No free backfill slot for provider {provider}")
+        self.provider = provider
+
 @shared_task
 def load_historical_exchange_rates(
     days_back: int = 30,
     source_currencies: list = None,
-    target_currencies: list = None
+    target_currencies: list = None,
+    provider: str = None
 ):
+    """Schedule a historical backfill as a chord of per-chunk subtasks.
 
+    The returned ``group_id`` can be passed to ``get_historical_load_progress``
+    while the chunks run; ``callback_id`` holds the final summary.
+    """
     if not source_currencies:
         source_currencies = ['EUR', 'USD', 'GBP', 'CHF']
-    
+
     if not target_currencies:
         target_currencies = ['EUR', 'USD', 'GBP', 'CHF']
-    
+
     end_date = date.today()
     start_date = end_date - timedelta(days=days_back)
-    
-    for code in set(source_currencies + target_currencies):
-        Currency.objects.get_or_create(
-            code=code,
-            defaults={'name': code, 'symbol': code}
-        )
-    
-    current_date = start_date
+
+    ensure_currencies(source_currencies + target_currencies)
+
+    dates = [
+        (start_date + timedelta(days=offset)).isoformat()
+        for offset in range((end_date - start_date).days + 1)
+    ]
+    chunk_days = settings.HISTORICAL_BACKFILL['chunk_days']
+    chunks = [dates[i:i + chunk_days] for i in range(0, len(dates), chunk_days)]
+
+    header = [
+        load_exchange_rate_chunk.s(chunk, source_currencies, target_currencies, provider)
+        for chunk in chunks
+    ]
+    callback = summarize_historical_load.s(days_back, source_currencies, target_currencies)
+    result = chord(header)(callback)
+
+    # Eagerly executed chords have no parent group to report progress on.
+    group_id = None
+    if result.parent is not None:
+        result.parent.save()
+        group_id = result.parent.id
+
+    return {
+        'group_id': group_id,
+        'callback_id': result.id,
+        'chunks': len(chunks),
+        'days_processed': days_back,
+        'source_currencies': source_currencies,
+        'target_currencies': target_currencies
+    }
+
+@shared_task(bind=True, max_retries=None)
+def load_exchange_rate_chunk(
+    self,
+    dates: list,
+    source_currencies: list,
+    target_currencies: list,
+    provider: str = None
+):
+    """Load the rates for a chunk of dates, skipping rows already stored so an
+    interrupted backfill can simply be run again.
+
+    A chunk holds one backfill slot of its provider (or of the chain when no
+    provider is pinned). Unpinned chunks also take a slot of each provider
+    with its own ``backfill_concurrency`` around the calls to it, and retry
+    later when that provider has no free slot.
+    """
+    slot = _acquire_backfill_slot(provider, self.request.id)
+    if slot is None:
+        raise self.retry(countdown=settings.HISTORICAL_BACKFILL['slot_retry_delay'])
+
+    started = time.perf_counter()
     success_count = 0
     error_count = 0
-    
-    while current_date <= end_date:
-        for source in source_currencies:
-            for target in target_currencies:
-                if source == target:
+    skipped_count = 0
+    provider_slot = None if provider else _provider_slot(self.request.id)
+    busy = False
+
+    try:
+        existing = _existing_rate_keys(dates, source_currencies, target_currencies, provider)
+
+        for index, day in enumerate(dates):
+            current_date = date.fromisoformat(day)
+
+            for source in source_currencies:
+                candidates = [target for target in target_currencies if target != source]
+                targets = [
+                    target for target in candidates
+                    if (source, target, current_date) not in existing
+                ]
+                skipped_count += len(candidates) - len(targets)
+                if not targets:
                     continue
-                    
+
                 try:
-                    result = get_exchange_rate_data(
-                        source_currency=source,
-                        exchanged_currency=target,
-                        valuation_date=current_date
-                    )
-                    
+                    with batch_traffic():
+                        result = get_exchange_rate_table(
+                            source_currency=source,
+                            exchanged_currencies=targets,
+                            valuation_date=current_date,
+                            provider=provider,
+                            provider_slot=provider_slot
+                        )
+
                     if result.get('success'):
-                        success_count += 1
+                        success_count += len(result['rates'])
+                        error_count += len(result['missing'])
+                        for target in result['missing']:
+                            logger.error(f"Failed to get rate for {source}/{target} on {current_date}")
                     else:
-                        error_count += 1
-                        logger.error(f"Failed to get rate for {source}/{target} on {current_date}: {result.get('error')}")
-                
+                        error_count += len(targets)
+                        logger.error(f"Failed to get rates for {source} on {current_date}: {result.get('error')}")
+
+                except BackfillSlotBusy:
+                    raise
                 except Exception as e:
-                    error_count += 1
-                    logger.error(f"Exception getting rate for {source}/{target} on {current_date}: {str(e)}")
-                
-        current_date += timedelta(days=1)
-    
+                    error_count += len(targets)
+                    logger.error(f"Exception getting rates for {source} on {current_date}: {str(e)}")
+
+            if self.request.id:
+                self.update_state(state='PROGRESS', meta={
+                    'dates_done': index + 1,
+                    'dates_total': len(dates),
+                    'success_count': success_count,
+                    'error_count': error_count,
+                    'skipped_count': skipped_count
+                })
+    except BackfillSlotBusy as e:
+        logger.info(str(e))
+        busy = True
+    finally:
+        _release_backfill_slot(provider, slot)
+
+    if busy:
+        # Rates stored so far are skipped when the chunk runs again.
+        raise self.retry(countdown=settings.HISTORICAL_BACKFILL['slot_retry_delay'])
+
+    metrics.observe('backfill_chunk_seconds', time.perf_counter() - started, provider=provider or 'chain')
+    for outcome, count in (('success', success_count), ('error', error_count), ('skipped', skipped_count)):
+        metrics.inc('backfill_rates_total', count, outcome=outcome)
+
     return {
+        'dates_done': len(dates),
+        'dates_total': len(dates),
         'success_count': success_count,
         'error_count': error_count,
+        'skipped_count': skipped_count
+    }
+
+@shared_task
+def summarize_historical_load(
+    chunk_results: list,
+    days_back: int,
+    source_currencies: list,
+    target_currencies: list
+):
+    return {
+        'success_count': sum(result['success_count'] for result in chunk_results),
+        'error_count': sum(result['error_count'] for result in chunk_results),
+        'skipped_count': sum(result['skipped_count'] for result in chunk_results),
+        'chunks': len(chunk_results),
         'days_processed': days_back,
         'source_currencies': source_currencies,
         'target_currencies': target_currencies
-    }
\ No newline at end of file
+    }
+
+@shared_task
+def prefetch_todays_rates(provider: str = None):
+    """Fetch today's rates for the most requested pairs and warm the rate
+    cache, so the first request of the day does not wait on a provider.
+
+    Scheduled by Celery beat shortly after each provider's publish time.
+    A run pinned to one provider caches that provider's rates under its own
+    key; the provider-agnostic entry is reloaded from the database, so it
+    keeps the rate ``get_exchange_rate_data`` would pick. The warm-up only
+    reaches the web processes through the shared tier
+    (``RATE_CACHE['shared']``); with the local tier alone it only warms the
+    worker running the task.
+    """
+    config = settings.PREFETCH
+    if not config.get('enabled', True):
+        return {'skipped': True}
+
+    request_traffic.flush()
+    pairs = _prefetch_pairs()
+    today = date.today()
+
+    targets_by_source = {}
+    for source, target in pairs:
+        targets_by_source.setdefault(source, []).append(target)
+
+    ensure_currencies(list(targets_by_source) + [target for _, target in pairs])
+
+    success_count = 0
+    error_count = 0
+    for source, targets in targets_by_source.items():
+        try:
+            with batch_traffic():
+                result = get_exchange_rate_table(
+                    source_currency=source,
+                    exchanged_currencies=targets,
+                    valuation_date=today,
+                    provider=provider
+                )
+        except Exception as e:
+            error_count += len(targets)
+            logger.error(f"Exception prefetching rates for {source}: {str(e)}")
+            continue
+
+        if not result.get('success'):
+            error_count += len(targets)
+            logger.error(f"Failed to prefetch rates for {source}: {result.get('error')}")
+            continue
+
+        for target, rate_value in result['rates'].items():
+            if provider:
+                rate_cache.set(source, target, today, {
+                    'source_currency': source,
+                    'exchanged_currency': target,
+                    'valuation_date': today,
+                    'rate_value': rate_value,
+                    'provider': provider,
+                    'success': True
+                }, provider)
+            _get_stored_rate(source, target, today)
+        success_count += len(result['rates'])
+        error_count += len(result['missing'])
+
+    return {
+        'provider': provider,
+        'valuation_date': today.isoformat(),
+        'pairs': len(pairs),
+        'success_count': success_count,
+        'error_count': error_count
+    }
+
+@shared_task
+def maintain_rate_partitions():
+    """Create the coming months' rate partitions and apply the retention
+    policy of ``RATE_PARTITIONS``.
+
+    Scheduled daily by Celery beat; does nothing unless the rates table is
+    partitioned (PostgreSQL after migration 0005).
+    """
+    if not partitioning_enabled():
+        return {'skipped': True}
+
+    created = ensure_partitions()
+    summary = apply_retention()
+    summary['created'] = created
+    if summary['compacted'] or summary['expired']:
+        logger.info(
+            f"Rate retention compacted {len(summary['compacted'])} and expired "
+            f"{len(summary['expired'])} partitions, {summary['rows_deleted']} rows deleted"
+        )
+    return summary
+
+def _prefetch_pairs() -> list:
+    """Pairs to prefetch: the busiest pairs of the last ``traffic_days`` days,
+    or the static ``PREFETCH['pairs']`` list when there is no traffic yet or
+    the source is set to ``static``."""
+    config = settings.PREFETCH
+    pairs = []
+    if config.get('source', 'traffic') == 'traffic':
+        pairs = request_traffic.top_pairs(
+            days=config.get('traffic_days', 7),
+            limit=config.get('max_pairs', 200),
+            min_requests=config.get('min_requests', 1)
+        )
+    if not pairs:
+        pairs = [tuple(pair) for pair in config.get('pairs', [])]
+    return [(source, target) for source, target in pairs if source != target]
+
+def get_historical_load_progress(group_id: str) -> dict:
+    """Aggregate the progress reported by the chunk tasks of a backfill."""
+    group_result = GroupResult.restore(group_id)
+    if group_result is None:
+        return {'state': 'UNKNOWN'}
+
+    progress = {
+        'chunks_total': len(group_result.results),
+        'chunks_done': 0,
+        'dates_done': 0,
+        'success_count': 0,
+        'error_count': 0,
+        'skipped_count': 0
+    }
+    for chunk in group_result.results:
+        info = chunk.info if isinstance(chunk.info, dict) else {}
+        if chunk.successful():
+            progress['chunks_done'] += 1
+        for key in ('dates_done', 'success_count', 'error_count', 'skipped_count'):
+            progress[key] += info.get(key, 0)
+
+    progress['state'] = 'SUCCESS' if progress['chunks_done'] == progress['chunks_total'] else 'PROGRESS'
+    return progress
+
+def get_backfill_group_id(task_id: str) -> str:
+    result = AsyncResult(task_id)
+    if result.successful() and isinstance(result.result, dict):
+        return result.result.get('group_id')
+    return None
+
+def _existing_rate_keys(dates: list, source_currencies: list, target_currencies: list, provider: str = None) -> set:
+    if provider:
+        providers = [provider]
+    else:
+        providers = [config['name'] for config in ProviderFactory.get_active_providers()]
+
+    source_ids = currency_codes.get_ids(source_currencies)
+    target_ids = currency_codes.get_ids(target_currencies)
+    rows = CurrencyExchangeRate.objects.filter(
+        valuation_date__in=dates,
+        source_currency_id__in=source_ids.values(),
+        exchanged_currency_id__in=target_ids.values(),
+        provider__in=providers
+    ).values_list('source_currency_id', 'exchanged_currency_id', 'valuation_date')
+
+    return {
+        (currency_codes.get_code(source_id), currency_codes.get_code(target_id), valuation_date)
+        for source_id, target_id, valuation_date in rows
+    }
+
+def _backfill_concurrency(provider: str = None) -> int:
+    provider_config = settings.CURRENCY_PROVIDERS.get(provider, {}) if provider else {}
+    return provider_config.get('backfill_concurrency', settings.HISTORICAL_BACKFILL['max_concurrency'])
+
+def _backfill_slot_key(provider: str, slot: int) -> str:
+    return f"backfill-slot:{provider or 'chain'}:{slot}"
+
+def _acquire_backfill_slot(provider: str, owner: str):
+    """Take one of the provider's backfill slots. Slots live in the default
+    cache, so the limit holds across workers when that cache is Redis."""
+    for slot in range(_backfill_concurrency(provider)):
+        if cache.add(_backfill_slot_key(provider, slot), owner or 'local', settings.HISTORICAL_BACKFILL['slot_lease']):
+            return slot
+    return None
+
+def _release_backfill_slot(provider: str, slot: int):
+    cache.delete(_backfill_slot_key(provider, slot))
+
+def _provider_slot(owner: str):
+    """provider_slot for get_exchange_rate_table in unpinned chunks: holds
+    one of the provider's backfill slots during the call when the provider
+    sets its own ``backfill_concurrency``."""
+    @contextmanager
+    def provider_slot(provider: str):
+        if 'backfill_concurrency' not in settings.CURRENCY_PROVIDERS.get(provider, {}):
+            yield
+            return
+        slot = _acquire_backfill_slot(provider, owner)
+        if slot is None:
+            raise BackfillSlotBusy(provider)
+        try:
+            yield
+        finally:
+            _release_backfill_slot(provider, slot)
+
+    return provider_slot
@@ -1,2 +1,1164 @@
-from django.test import TestCase
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
 
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.async_services import (
+    _afetch_from_provider_chain, _arun_hedged_chain, aconvert_amount, aget_exchange_rate_data
+)
+from core.cache import DERIVED_PROVIDER, RateCache, currency_codes, rate_cache
+from core.exports import iter_exchange_rates, stream_csv
+from core.management.commands.import_rates import Command as ImportRatesCommand
+from core.metrics import MetricsRegistry, metrics
+from core.models import Currency, CurrencyExchangeRate, DailyRateSnapshot, RateRequestStat
+from core.partitions import (
+    DEFAULT_PARTITION, add_months, apply_retention, archive_name, ensure_partitions, list_partitions,
+    month_start, partition_name
+)
+from core.services import (
+    _fetch_from_provider_chain, _fetch_from_providers, _find_rate_path, _get_derived_rate, _get_hedge_executor,
+    _get_stored_rate, _run_hedged_chain, _save_exchange_rates, _stored_rates, ensure_currencies,
+    build_rate_graph, convert_amount_timeseries, convert_amounts, get_exchange_rate_table
+)
+from core.snapshots import refresh_rate_snapshots
+from core.singleflight import single_flight
+from core.tasks import (
+    BackfillSlotBusy, _acquire_backfill_slot, _provider_slot, _release_backfill_slot, prefetch_todays_rates
+)
+from core.traffic import RequestTraffic
+from providers.factory import ProviderFactory
+
+
+def _stub_fetch(answers, calls=None):
+    """fetch() for the provider chains: ``answers`` maps a provider to
+    (delay in seconds, success)."""
+    lock = threading.Lock()
+
+    def fetch(provider_name):
+        if calls is not None:
+            with lock:
+                calls.append(provider_name)
+        delay, success = answers[provider_name]
+        time.sleep(delay)
+        if success:
+            return {'success': True, 'provider': provider_name}
+        return {'success': False, 'error': f'{provider_name} failed'}
+
+    return fetch
+
+
+class HedgedChainTests(SimpleTestCase):
+    def test_first_success_wins(self):
+        calls = []
+        fetch = _stub_fetch({'primary': (0, True), 'secondary': (0, True)}, calls)
+
+        result = _run_hedged_chain(['primary', 'secondary'], fetch, hedge_delay=0.5, max_concurrency=2)
+
+        self.assertEqual(result['provider'], 'primary')
+        self.assertEqual(calls, ['primary'])
+
+    def test_slow_primary_is_hedged(self):
+        fetch = _stub_fetch({'primary': (1, True), 'secondary': (0, True)})
+
+        started = time.monotonic()
+        result = _run_hedged_chain(['primary', 'secondary'], fetch, hedge_delay=0.05, max_concurrency=2)
+
+        self.assertEqual(result['provider'], 'secondary')
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_failure_launches_the_next_provider_at_once(self):
+        calls = []
+        fetch = _stub_fetch({'primary': (0, False), 'secondary': (0, True)}, calls)
+
+        started = time.monotonic()
+        result = _run_hedged_chain(['primary', 'secondary'], fetch, hedge_delay=5, max_concurrency=1)
+
+        self.assertEqual(result['provider'], 'secondary')
+        self.assertEqual(calls, ['primary', 'secondary'])
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_all_providers_failing_returns_none(self):
+        calls = []
+        fetch = _stub_fetch({'a': (0, False), 'b': (0.01, False), 'c': (0, False)}, calls)
+
+        result = _run_hedged_chain(['a', 'b', 'c'], fetch, hedge_delay=0.01, max_concurrency=2)
+
+        self.assertIsNone(result)
+        self.assertEqual(sorted(calls), ['a', 'b', 'c'])
+
+    @override_settings(PROVIDER_FALLBACK={'mode': 'hedged', 'hedge_delay': 0.01, 'max_concurrency': 2})
+    def test_chain_reports_an_error_when_every_provider_fails(self):
+        adapter = mock.Mock()
+        adapter.get_exchange_rate.return_value = {'success': False, 'error': 'down'}
+        with mock.patch.object(ProviderFactory, 'get_active_providers', return_value=[{'name': 'a'}, {'name': 'b'}]), \
+                mock.patch.object(ProviderFactory, 'get_provider', return_value=adapter):
+            result = _fetch_from_provider_chain('EUR', 'USD', date(2024, 1, 1))
+
+        self.assertEqual(result, {'success': False, 'error': 'No provider could fetch the exchange rate'})
+        self.assertEqual(adapter.get_exchange_rate.call_count, 2)
+
+    def test_executor_is_shared(self):
+        fetch = _stub_fetch({'primary': (0, True)})
+        _run_hedged_chain(['primary'], fetch, hedge_delay=0.1, max_concurrency=2)
+        executor = _get_hedge_executor()
+        _run_hedged_chain(['primary'], fetch, hedge_delay=0.1, max_concurrency=2)
+
+        self.assertIs(_get_hedge_executor(), executor)
+
+
+class _AsyncAdapter:
+    def __init__(self, name, delay=0, success=True):
+        self.name = name
+        self.delay = delay
+        self.success = success
+        self.calls = 0
+        self.cancelled = False
+
+    async def aget_exchange_rate(self, source_currency, exchanged_currency, valuation_date):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if not self.success:
+            return {'success': False, 'error': f'{self.name} failed'}
+        return {
+            'source_currency': source_currency,
+            'exchanged_currency': exchanged_currency,
+            'valuation_date': valuation_date,
+            'rate_value': Decimal('1.2'),
+            'provider': self.name,
+            'success': True
+        }
+
+
+class AsyncHedgedChainTests(SimpleTestCase):
+    async def test_slow_primary_is_hedged_and_cancelled(self):
+        adapters = {'primary': _AsyncAdapter('primary', delay=5), 'secondary': _AsyncAdapter('secondary')}
+
+        async def fetch(provider_name):
+            return await adapters[provider_name].aget_exchange_rate('EUR', 'USD', date(2024, 1, 1))
+
+        started = time.monotonic()
+        result = await _arun_hedged_chain(['primary', 'secondary'], fetch, hedge_delay=0.01, max_concurrency=2)
+        await asyncio.sleep(0)
+
+        self.assertEqual(result['provider'], 'secondary')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertTrue(adapters['primary'].cancelled)
+
+    async def test_active_providers_are_listed_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        threads = []
+
+        def get_active_providers():
+            threads.append(threading.get_ident())
+            return []
+
+        with mock.patch.object(ProviderFactory, 'get_active_providers', side_effect=get_active_providers):
+            result = await _afetch_from_provider_chain('EUR', 'USD', date(2024, 1, 1))
+
+        self.assertFalse(result['success'])
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], loop_thread)
+
+
+@override_settings(CROSS_RATES={'enabled': True, 'base_currency': 'USD', 'max_hops': 2})
+class AsyncLookupTests(TestCase):
+    def setUp(self):
+        rate_cache.clear()
+        currency_codes.invalidate()
+        ensure_currencies(['EUR', 'USD', 'GBP', 'JPY'])
+        self.day = date(2024, 1, 1)
+        _save_exchange_rates([
+            {
+                'source_currency': source,
+                'exchanged_currency': target,
+                'valuation_date': self.day,
+                'rate_value': Decimal(rate_value),
+                'provider': 'mock',
+            }
+            for source, target, rate_value in [('EUR', 'USD', '1.10'), ('USD', 'GBP', '0.80')]
+        ])
+        rate_cache.clear()
+        self.adapter = _AsyncAdapter('stub')
+        for patcher in (
+            mock.patch.object(ProviderFactory, 'get_active_providers', return_value=[{'name': 'stub'}]),
+            mock.patch.object(ProviderFactory, 'get_provider', return_value=self.adapter),
+            mock.patch('core.async_services.request_traffic.arecord', mock.AsyncMock()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def _lookup(self, source, target):
+        with mock.patch('core.async_services.metrics.inc') as inc:
+            result = await aget_exchange_rate_data(source, target, self.day)
+        return inc.call_args.kwargs['outcome'], result
+
+    async def test_cache_is_read_first(self):
+        await rate_cache.aset('EUR', 'USD', self.day, {'rate_value': Decimal('1.05'), 'provider': 'cached', 'success': True})
+
+        outcome, result = await self._lookup('EUR', 'USD')
+
+        self.assertEqual((outcome, result['rate_value']), ('cache', Decimal('1.05')))
+
+    async def test_database_is_read_before_the_providers(self):
+        outcome, result = await self._lookup('EUR', 'USD')
+
+        self.assertEqual((outcome, result['rate_value']), ('database', Decimal('1.10')))
+        self.assertEqual(self.adapter.calls, 0)
+        self.assertIsNotNone(await rate_cache.aget('EUR', 'USD', self.day))
+
+    async def test_cross_rate_is_derived_before_the_providers(self):
+        outcome, result = await self._lookup('EUR', 'GBP')
+
+        self.assertEqual((outcome, result['rate_value']), ('derived', Decimal('0.88')))
+        self.assertEqual(self.adapter.calls, 0)
+
+    async def test_providers_are_called_last_and_the_rate_is_saved(self):
+        outcome, result = await self._lookup('EUR', 'JPY')
+
+        self.assertEqual((outcome, result['provider']), ('provider', 'stub'))
+        self.assertEqual(self.adapter.calls, 1)
+        stored = await CurrencyExchangeRate.objects.filter(
+            source_currency__code='EUR', exchanged_currency__code='JPY'
+        ).values_list('rate_value', flat=True).aget()
+        self.assertEqual(stored, Decimal('1.2'))
+
+    async def test_aconvert_amount(self):
+        result = await aconvert_amount('EUR', Decimal('10'), 'USD', self.day)
+
+        self.assertEqual(result['converted_amount'], Decimal('11.00'))
+        self.assertEqual(result['provider'], 'mock')
+
+    async def test_aconvert_amount_reports_a_missing_rate(self):
+        self.adapter.success = False
+
+        result = await aconvert_amount('EUR', Decimal('10'), 'JPY', self.day, allow_derived=False)
+
+        self.assertEqual(result, {'success': False, 'error': 'No provider could fetch the exchange rate'})
+
+
+@override_settings(CURRENCY_PROVIDERS={'mock': {'active': True, 'priority': 1, 'seed': 1, 'backfill_concurrency': 1}})
+class BackfillSlotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        currency_codes.invalidate()
+        ensure_currencies(['EUR', 'USD'])
+
+    def test_unpinned_chunks_respect_the_provider_limit(self):
+        slot = _acquire_backfill_slot('mock', 'other-chunk')
+        with self.assertRaises(BackfillSlotBusy):
+            get_exchange_rate_table('EUR', ['USD'], date(2024, 1, 2), provider_slot=_provider_slot('chunk'))
+        _release_backfill_slot('mock', slot)
+
+        result = get_exchange_rate_table('EUR', ['USD'], date(2024, 1, 2), provider_slot=_provider_slot('chunk'))
+
+        self.assertEqual(list(result['rates']), ['USD'])
+        # The call released its slot.
+        self.assertEqual(_acquire_backfill_slot('mock', 'other-chunk'), 0)
+
+
+class RatePathTests(SimpleTestCase):
+    graph = {
+        'EUR': {'USD': (Decimal('1.1'), 'mock'), 'GBP': (Decimal('0.85'), 'mock')},
+        'USD': {'EUR': (Decimal('1') / Decimal('1.1'), 'mock'), 'JPY': (Decimal('150'), 'mock')},
+        'GBP': {'EUR': (Decimal('1') / Decimal('0.85'), 'mock')},
+        'JPY': {'USD': (Decimal('1') / Decimal('150'), 'mock')},
+    }
+
+    def test_inverse_edge_beats_the_base_route(self):
+        path = _find_rate_path(self.graph, 'USD', 'EUR', max_hops=2, base_currency='GBP')
+
+        self.assertEqual(path, ['USD', 'EUR'])
+
+    def test_base_route_needs_two_hops(self):
+        self.assertEqual(_find_rate_path(self.graph, 'USD', 'GBP', max_hops=2, base_currency='EUR'),
+                         ['USD', 'EUR', 'GBP'])
+        self.assertIsNone(_find_rate_path(self.graph, 'USD', 'GBP', max_hops=1, base_currency='EUR'))
+
+    def test_max_hops_limits_every_route(self):
+        self.assertIsNone(_find_rate_path(self.graph, 'GBP', 'JPY', max_hops=2))
+        self.assertEqual(_find_rate_path(self.graph, 'GBP', 'JPY', max_hops=3), ['GBP', 'EUR', 'USD', 'JPY'])
+        self.assertIsNone(_find_rate_path(self.graph, 'EUR', 'USD', max_hops=0))
+
+
+class _CountingAdapter:
+    def __init__(self, delay=0.2, success=True):
+        self.delay = delay
+        self.success = success
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def get_exchange_rate(self, source_currency, exchanged_currency, valuation_date):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if not self.success:
+            raise RuntimeError('provider down')
+        return {
+            'source_currency': source_currency,
+            'exchanged_currency': exchanged_currency,
+            'valuation_date': valuation_date,
+            'rate_value': Decimal('1.1'),
+            'provider': 'stub',
+            'success': True
+        }
+
+
+def _run_concurrently(target, count):
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(index):
+        barrier.wait()
+        try:
+            results[index] = target()
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@override_settings(SINGLE_FLIGHT={'enabled': True, 'distributed': False, 'wait_timeout': 10})
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        rate_cache.clear()
+
+    def test_concurrent_identical_requests_make_one_provider_call(self):
+        adapter = _CountingAdapter()
+        with mock.patch.object(ProviderFactory, 'get_active_providers', return_value=[{'name': 'stub'}]), \
+                mock.patch.object(ProviderFactory, 'get_provider', return_value=adapter), \
+                mock.patch('core.services._save_exchange_rate'):
+            results = _run_concurrently(lambda: _fetch_from_providers('EUR', 'USD', date(2024, 1, 1)), 8)
+
+        self.assertEqual(adapter.calls, 1)
+        self.assertTrue(all(result['rate_value'] == Decimal('1.1') for result in results))
+        # Every caller gets its own copy of the result.
+        self.assertEqual(len({id(result) for result in results}), 8)
+
+    def test_failing_leader_releases_the_followers(self):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            raise RuntimeError('provider down')
+
+        started = time.monotonic()
+        results = _run_concurrently(lambda: single_flight.do('failing-key', fetch), 4)
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(single_flight.do('failing-key', lambda: {'success': True}), {'success': True})
+
+
+@override_settings(SINGLE_FLIGHT={'enabled': True, 'distributed': True, 'wait_timeout': 10, 'lock_ttl': 15})
+class DistributedSingleFlightTests(SimpleTestCase):
+    lock_key = 'singleflight:lock-key'
+
+    def setUp(self):
+        cache.clear()
+
+    def _steal_lock(self):
+        # The lock expired mid-fetch and another process's leader took it.
+        cache.delete(self.lock_key)
+        cache.add(self.lock_key, 'other-leader', 15)
+        return {'success': True}
+
+    def test_leader_releases_its_own_lock(self):
+        single_flight.do('lock-key', lambda: {'success': True})
+
+        self.assertIsNone(cache.get(self.lock_key))
+
+    def test_expired_lock_taken_by_another_leader_is_kept(self):
+        single_flight.do('lock-key', self._steal_lock)
+
+        self.assertEqual(cache.get(self.lock_key), 'other-leader')
+
+    async def test_async_leader_keeps_a_lock_taken_by_another_leader(self):
+        async def fetch():
+            return self._steal_lock()
+
+        await single_flight.ado('lock-key', fetch)
+
+        self.assertEqual(cache.get(self.lock_key), 'other-leader')
+
+
+class RequestTrafficTests(TestCase):
+    def test_flush_adds_to_the_stored_counts(self):
+        traffic = RequestTraffic()
+        for pair in [('EUR', 'USD'), ('EUR', 'USD'), ('EUR', 'GBP')]:
+            traffic._buffer(*pair)
+        traffic.flush()
+        traffic._buffer('EUR', 'USD')
+
+        with self.assertNumQueries(1):
+            traffic.flush()
+
+        counts = {
+            (stat.source_currency, stat.exchanged_currency): stat.count
+            for stat in RateRequestStat.objects.filter(day=date.today())
+        }
+        self.assertEqual(counts, {('EUR', 'USD'): 3, ('EUR', 'GBP'): 1})
+
+
+_CACHE_CONFIG = {
+    'enabled': True, 'max_entries': 2, 'today_ttl': 60, 'historical_ttl': 3600, 'local_ttl': 300,
+    'shared': False, 'cache_alias': 'default',
+}
+
+
+@override_settings(RATE_CACHE=_CACHE_CONFIG)
+class RateCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = RateCache()
+        self.day = date(2024, 1, 1)
+        self.clock = mock.patch('core.cache.time.monotonic', return_value=1000.0)
+        self.monotonic = self.clock.start()
+        self.addCleanup(self.clock.stop)
+        cache.clear()
+
+    def _set(self, target, valuation_date=None):
+        self.cache.set('EUR', target, valuation_date or self.day, {'rate_value': Decimal('1.1')})
+
+    def test_entry_expires_after_its_ttl(self):
+        today = date.today()
+        self._set('USD', today)
+
+        self.monotonic.return_value = 1059.0
+        self.assertIsNotNone(self.cache.get('EUR', 'USD', today))
+        self.monotonic.return_value = 1061.0
+        self.assertIsNone(self.cache.get('EUR', 'USD', today))
+
+    def test_local_entry_is_capped_at_local_ttl(self):
+        self._set('USD')
+
+        self.monotonic.return_value = 1299.0
+        self.assertIsNotNone(self.cache.get('EUR', 'USD', self.day))
+        self.monotonic.return_value = 1301.0
+        self.assertIsNone(self.cache.get('EUR', 'USD', self.day))
+
+    def test_derived_entry_has_its_own_key_and_short_ttl(self):
+        self.cache.set('EUR', 'USD', self.day, {'rate_value': Decimal('1.1')}, DERIVED_PROVIDER)
+
+        self.assertIsNone(self.cache.get('EUR', 'USD', self.day))
+        self.monotonic.return_value = 1059.0
+        self.assertIsNotNone(self.cache.get('EUR', 'USD', self.day, DERIVED_PROVIDER))
+        self.monotonic.return_value = 1061.0
+        self.assertIsNone(self.cache.get('EUR', 'USD', self.day, DERIVED_PROVIDER))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self._set('USD')
+        self._set('GBP')
+        self.cache.get('EUR', 'USD', self.day)
+        self._set('JPY')
+
+        self.assertIsNone(self.cache.get('EUR', 'GBP', self.day))
+        self.assertIsNotNone(self.cache.get('EUR', 'USD', self.day))
+        self.assertIsNotNone(self.cache.get('EUR', 'JPY', self.day))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_stats_count_hits_misses_and_invalidations(self):
+        self._set('USD')
+        self.cache.get('EUR', 'USD', self.day)
+        self.cache.get('EUR', 'GBP', self.day)
+        self.cache.invalidate('EUR', 'USD', self.day)
+        self.cache.get('EUR', 'USD', self.day)
+
+        stats = self.cache.stats()
+        self.assertEqual(
+            {key: stats[key] for key in ('local_hits', 'shared_hits', 'misses', 'sets', 'invalidations', 'size')},
+            {'local_hits': 1, 'shared_hits': 0, 'misses': 2, 'sets': 1, 'invalidations': 1, 'size': 0}
+        )
+        self.assertAlmostEqual(stats['hit_ratio'], 1 / 3)
+
+    @override_settings(RATE_CACHE={**_CACHE_CONFIG, 'shared': True})
+    def test_invalidation_reaches_other_processes_within_local_ttl(self):
+        other = RateCache()
+        self._set('USD')
+        self.assertIsNotNone(other.get('EUR', 'USD', self.day))
+        self.assertEqual(other.stats()['shared_hits'], 1)
+
+        self.cache.invalidate('EUR', 'USD', self.day)
+
+        self.assertIsNone(self.cache.get('EUR', 'USD', self.day))
+        self.assertIsNotNone(other.get('EUR', 'USD', self.day))
+        self.monotonic.return_value = 1301.0
+        self.assertIsNone(other.get('EUR', 'USD', self.day))
+
+
+class RateCacheInvalidationTests(TestCase):
+    def test_saving_a_rate_invalidates_its_cached_entry(self):
+        rate_cache.clear()
+        currency_codes.invalidate()
+        ensure_currencies(['EUR', 'USD'])
+        day = date(2024, 1, 1)
+        rate_cache.set('EUR', 'USD', day, {'rate_value': Decimal('1.05')})
+        rate_cache.set('EUR', 'USD', day, {'rate_value': Decimal('1.05')}, 'mock')
+
+        _save_exchange_rates([{
+            'source_currency': 'EUR',
+            'exchanged_currency': 'USD',
+            'valuation_date': day,
+            'rate_value': Decimal('1.10'),
+            'provider': 'mock',
+        }])
+
+        self.assertIsNone(rate_cache.get('EUR', 'USD', day))
+        self.assertIsNone(rate_cache.get('EUR', 'USD', day, 'mock'))
+        self.assertEqual(_get_stored_rate('EUR', 'USD', day)['rate_value'], Decimal('1.10'))
+
+
+class StoredRateTests(TestCase):
+    def setUp(self):
+        rate_cache.clear()
+        currency_codes.invalidate()
+        ensure_currencies(['EUR', 'USD'])
+        self.day = date(2024, 1, 1)
+        for provider, rate_value in [('currencybeacon', '1.10'), ('exchangerate', '0'), ('mock', '1.08')]:
+            _save_exchange_rates([{
+                'source_currency': 'EUR',
+                'exchanged_currency': 'USD',
+                'valuation_date': self.day,
+                'rate_value': Decimal(rate_value),
+                'provider': provider,
+            }])
+
+    def _winners(self):
+        keys = {('EUR', 'USD', self.day)}
+        rate_cache.clear()
+        single = _get_stored_rate('EUR', 'USD', self.day)
+        return (single['rate_value'], single['provider']), [row[3:] for row in _stored_rates(keys)]
+
+    def test_single_and_batch_reads_pick_the_same_rate(self):
+        expected = (Decimal('1.10'), 'currencybeacon')
+
+        single, snapshot = self._winners()
+        with override_settings(RATE_SNAPSHOTS={'enabled': False}):
+            _, rows = self._winners()
+
+        self.assertEqual(single, expected)
+        self.assertEqual(snapshot, [expected])
+        self.assertEqual(rows, [expected])
+
+    def test_rate_graph_picks_the_same_rate(self):
+        single, _ = self._winners()
+
+        self.assertEqual(build_rate_graph(self.day)['EUR']['USD'], single)
+
+    def test_rate_saved_with_a_string_date_refreshes_its_snapshot(self):
+        ids = currency_codes.get_ids(['EUR', 'USD'])
+        CurrencyExchangeRate.objects.create(
+            source_currency_id=ids['EUR'],
+            exchanged_currency_id=ids['USD'],
+            valuation_date='2024-01-02',
+            rate_value=Decimal('1.09'),
+            provider='mock'
+        )
+
+        self.assertEqual(
+            DailyRateSnapshot.objects.get(source_currency='EUR', valuation_date=date(2024, 1, 2)).rates,
+            {'USD': ['1.090000', 'mock']}
+        )
+
+
+def _count_rows(table):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM {table}')
+        return cursor.fetchone()[0]
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Rate partitions need PostgreSQL')
+class RatePartitionTests(TestCase):
+    def setUp(self):
+        currency_codes.invalidate()
+        ensure_currencies(['EUR', 'USD', 'GBP'])
+        self.current = month_start(date.today())
+
+    def _store(self, valuation_date, rates):
+        ids = currency_codes.get_ids(['EUR', 'USD', 'GBP'])
+        CurrencyExchangeRate.objects.bulk_create([
+            CurrencyExchangeRate(
+                source_currency_id=ids['EUR'],
+                exchanged_currency_id=ids[target],
+                valuation_date=valuation_date,
+                rate_value=Decimal(rate_value),
+                provider=provider
+            )
+            for target, provider, rate_value in rates
+        ])
+        refresh_rate_snapshots({('EUR', valuation_date)})
+
+    def test_migration_partitions_the_table(self):
+        months = [month for month, _, _ in list_partitions()]
+
+        self.assertEqual(months[-4:], [add_months(self.current, offset) for offset in range(4)])
+        self.assertEqual(_count_rows(DEFAULT_PARTITION), 0)
+
+    def test_ensure_partitions_moves_rows_out_of_the_default_partition(self):
+        old_month = add_months(self.current, -40)
+        self._store(old_month.replace(day=10), [('USD', 'mock', '1.1')])
+        self.assertEqual(_count_rows(DEFAULT_PARTITION), 1)
+
+        created = ensure_partitions(months_ahead=5)
+
+        self.assertEqual(created, [partition_name(old_month)] + [
+            partition_name(add_months(self.current, offset)) for offset in (4, 5)
+        ])
+        self.assertEqual(_count_rows(DEFAULT_PARTITION), 0)
+        self.assertEqual(_count_rows(partition_name(old_month)), 1)
+        self.assertEqual(CurrencyExchangeRate.objects.filter(valuation_date__lt=self.current).count(), 1)
+        self.assertEqual(ensure_partitions(months_ahead=5), [])
+
+    def test_retention_compacts_and_expires_old_months(self):
+        expired, compacted, kept = (add_months(self.current, offset) for offset in (-30, -8, -2))
+        for month in (expired, compacted, kept):
+            self._store(month, [
+                ('USD', 'mock', '1.08'),
+                ('USD', 'currencybeacon', '1.10'),
+                ('GBP', 'currencybeacon', '0'),
+                ('GBP', 'mock', '0.85'),
+            ])
+        ensure_partitions()
+        snapshot = DailyRateSnapshot.objects.get(valuation_date=compacted).rates
+
+        preview = apply_retention(compact_after_months=6, retention_months=24, dry_run=True)
+        self.assertEqual(CurrencyExchangeRate.objects.count(), 12)
+
+        summary = apply_retention(compact_after_months=6, retention_months=24)
+
+        self.assertEqual(preview['compacted'], summary['compacted'])
+        self.assertEqual(preview['expired'], summary['expired'])
+        self.assertEqual(summary['compacted'], [partition_name(compacted)])
+        self.assertEqual(summary['expired'], [partition_name(expired)])
+        self.assertEqual(summary['rows_deleted'], 2)
+        # The winners are the rates the snapshot already served.
+        self.assertEqual(
+            {
+                row[0]: [str(row[1]), row[2]]
+                for row in CurrencyExchangeRate.objects.filter(valuation_date=compacted).values_list(
+                    'exchanged_currency__code', 'rate_value', 'provider'
+                )
+            },
+            snapshot
+        )
+        self.assertEqual(CurrencyExchangeRate.objects.filter(valuation_date=kept).count(), 4)
+        self.assertFalse(CurrencyExchangeRate.objects.filter(valuation_date=expired).exists())
+        self.assertFalse(DailyRateSnapshot.objects.filter(valuation_date=expired).exists())
+        self.assertEqual(_count_rows(archive_name(expired)), 4)
+        self.assertTrue(next(flag for month, _, flag in list_partitions() if month == compacted))
+        self.assertEqual(apply_retention(compact_after_months=6)['compacted'], [])
+
+    def test_compaction_is_opt_in(self):
+        old_month = add_months(self.current, -12)
+        self._store(old_month, [('USD', 'mock', '1.08'), ('USD', 'currencybeacon', '1.10')])
+        ensure_partitions()
+
+        summary = apply_retention()
+
+        self.assertEqual(summary['compacted'], [])
+        self.assertEqual(CurrencyExchangeRate.objects.filter(valuation_date=old_month).count(), 2)
+
+
+@override_settings(CROSS_RATES={'enabled': True, 'base_currency': 'USD', 'max_hops': 2})
+class DerivedRateTests(TestCase):
+    def setUp(self):
+        rate_cache.clear()
+        currency_codes.invalidate()
+        ensure_currencies(['EUR', 'USD', 'GBP'])
+        self.day = date(2024, 1, 1)
+        _save_exchange_rates([
+            {
+                'source_currency': source,
+                'exchanged_currency': target,
+                'valuation_date': self.day,
+                'rate_value': Decimal(rate_value),
+                'provider': 'mock',
+            }
+            for source, target, rate_value in [('EUR', 'USD', '1.10'), ('USD', 'GBP', '0.80')]
+        ])
+        rate_cache.clear()
+
+    def test_derived_rate_is_cached(self):
+        derived = _get_derived_rate('EUR', 'GBP', self.day)
+
+        with self.assertNumQueries(0):
+            cached = _get_derived_rate('EUR', 'GBP', self.day)
+
+        self.assertEqual(cached['rate_value'], Decimal('0.88'))
+        self.assertEqual(cached, derived)
+        self.assertIsNone(rate_cache.get('EUR', 'GBP', self.day))
+
+    def test_failed_derivation_is_not_cached(self):
+        _get_derived_rate('EUR', 'JPY', self.day)
+
+        self.assertIsNone(rate_cache.get('EUR', 'JPY', self.day, DERIVED_PROVIDER))
+
+
+class ConvertAmountsTests(TestCase):
+    def setUp(self):
+        rate_cache.clear()
+        currency_codes.invalidate()
+        ensure_currencies(['EUR', 'USD', 'GBP', 'JPY'])
+        self.day = date(2024, 1, 1)
+        _save_exchange_rates([
+            {
+                'source_currency': source,
+                'exchanged_currency': target,
+                'valuation_date': self.day,
+                'rate_value': Decimal(rate_value),
+                'provider': 'mock',
+            }
+            for source, target, rate_value in [('EUR', 'USD', '1.10'), ('EUR', 'GBP', '0.85'), ('USD', 'JPY', '150')]
+        ])
+        currency_codes.get_ids(['EUR', 'USD', 'GBP', 'JPY'])
+        rate_cache.clear()
+        traffic = mock.patch('core.services.request_traffic')
+        traffic.start()
+        self.addCleanup(traffic.stop)
+
+    def _item(self, source, target, amount='10'):
+        return {
+            'source_currency': source, 'exchanged_currency': target, 'amount': Decimal(amount),
+            'valuation_date': self.day, 'allow_derived': False,
+        }
+
+    def test_stored_rates_are_read_in_one_query(self):
+        items = [self._item('EUR', 'USD'), self._item('EUR', 'GBP'), self._item('USD', 'JPY')]
+
+        with self.assertNumQueries(1):
+            results = convert_amounts(items)
+        with override_settings(RATE_SNAPSHOTS={'enabled': False}), self.assertNumQueries(1):
+            rate_cache.clear()
+            convert_amounts(items)
+
+        self.assertEqual(
+            [result['converted_amount'] for result in results],
+            [Decimal('11.00'), Decimal('8.50'), Decimal('1500.00')]
+        )
+
+    def test_missing_rates_are_fetched_in_one_table_per_base_and_date(self):
+        table = {
+            'success': True, 'rates': {'CHF': Decimal('0.95')}, 'providers': {'CHF': 'mock'}, 'missing': ['JPY'],
+        }
+        items = [self._item('EUR', 'USD'), self._item('EUR', 'CHF'), self._item('EUR', 'JPY')]
+
+        with mock.patch('core.services.get_exchange_rate_table', return_value=table) as fetch:
+            results = convert_amounts(items)
+
+        fetch.assert_called_once()
+        source, targets, valuation_date = fetch.call_args.args
+        self.assertEqual((source, sorted(targets), valuation_date), ('EUR', ['CHF', 'JPY'], self.day))
+        self.assertEqual([result['success'] for result in results], [True, True, False])
+        self.assertEqual(results[1]['converted_amount'], Decimal('9.50'))
+        self.assertEqual(results[2]['error'], 'No provider could fetch the exchange rate')
+        self.assertEqual(rate_cache.get('EUR', 'CHF', self.day)['rate_value'], Decimal('0.95'))
+
+    def test_failed_table_fails_only_its_items(self):
+        items = [self._item('EUR', 'USD'), self._item('GBP', 'CHF')]
+
+        with mock.patch(
+            'core.services.get_exchange_rate_table',
+            return_value={'success': False, 'error': 'No provider could fetch the exchange rates'}
+        ):
+            results = convert_amounts(items)
+
+        self.assertTrue(results[0]['success'])
+        self.assertFalse(results[1]['success'])
+        self.assertEqual(results[1]['amount'], Decimal('10'))
+
+
+class TimeseriesTests(TestCase):
+    def setUp(self):
+        currency_codes.invalidate()
+        ensure_currencies(['EUR', 'USD'])
+        ids = currency_codes.get_ids(['EUR', 'USD'])
+        CurrencyExchangeRate.objects.bulk_create([
+            CurrencyExchangeRate(
+                source_currency_id=ids['EUR'],
+                exchanged_currency_id=ids['USD'],
+                valuation_date=valuation_date,
+                rate_value=Decimal(rate_value),
+                provider=provider
+            )
+            for valuation_date, rate_value, provider in [
+                (date(2023, 12, 30), '1.00', 'mock'),
+                (date(2024, 1, 3), '1.10', 'mock'),
+                # The best provider's zero rate never wins.
+                (date(2024, 1, 3), '0', 'currencybeacon'),
+                (date(2024, 1, 5), '1.20', 'mock'),
+            ]
+        ])
+
+    def _rates(self, fill):
+        result = convert_amount_timeseries('EUR', Decimal('100'), 'USD', date(2024, 1, 1), date(2024, 1, 6), fill)
+        self.assertTrue(result['success'])
+        return result
+
+    def test_previous_carries_the_last_rate_forward(self):
+        result = self._rates('previous')
+
+        self.assertEqual(result['rates'], [Decimal(rate) for rate in ('1', '1', '1.1', '1.1', '1.2', '1.2')])
+        self.assertEqual(result['filled'], [True, True, False, True, False, True])
+        self.assertEqual(result['converted_amounts'][2], Decimal('110.00'))
+
+    def test_interpolate_between_known_rates(self):
+        result = self._rates('interpolate')
+
+        self.assertEqual(
+            result['rates'],
+            [Decimal(rate) for rate in ('1.05', '1.075', '1.1', '1.15', '1.2', '1.2')]
+        )
+        self.assertEqual(result['converted_amounts'][1], Decimal('107.50'))
+
+    def test_none_leaves_gaps_empty(self):
+        result = self._rates('none')
+
+        self.assertEqual(result['rates'], [None, None, Decimal('1.1'), None, Decimal('1.2'), None])
+        self.assertEqual(result['converted_amounts'], [None, None, Decimal('110.00'), None, Decimal('120.00'), None])
+        self.assertEqual(result['filled'], [False] * 6)
+
+    @override_settings(TIMESERIES={'max_days': 3660, 'lookback_days': 1})
+    def test_lookback_limits_the_rates_read_before_the_range(self):
+        result = self._rates('previous')
+
+        self.assertEqual(result['rates'][:3], [None, None, Decimal('1.1')])
+
+
+@override_settings(PREFETCH={'enabled': True, 'source': 'static', 'pairs': [('EUR', 'USD')]})
+class PrefetchTests(TestCase):
+    def setUp(self):
+        rate_cache.clear()
+        currency_codes.invalidate()
+        ensure_currencies(['EUR', 'USD'])
+        self.today = date.today()
+        _save_exchange_rates([{
+            'source_currency': 'EUR',
+            'exchanged_currency': 'USD',
+            'valuation_date': self.today,
+            'rate_value': Decimal('1.10'),
+            'provider': 'currencybeacon',
+        }])
+
+    def test_pinned_run_keeps_the_winning_rate_in_the_shared_entry(self):
+        summary = prefetch_todays_rates.apply(kwargs={'provider': 'mock'}).get()
+
+        self.assertEqual(summary['success_count'], 1)
+        self.assertEqual(rate_cache.get('EUR', 'USD', self.today)['provider'], 'currencybeacon')
+        self.assertEqual(rate_cache.get('EUR', 'USD', self.today, 'mock')['provider'], 'mock')
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        currency_codes.invalidate()
+        ensure_currencies(['EUR', 'USD', 'GBP'])
+        _save_exchange_rates([
+            {
+                'source_currency': 'EUR',
+                'exchanged_currency': target,
+                'valuation_date': valuation_date,
+                'rate_value': Decimal(rate_value),
+                'provider': provider,
+            }
+            for target, valuation_date, rate_value, provider in [
+                ('USD', date(2024, 1, 1), '1.08', 'mock'),
+                ('GBP', date(2024, 1, 1), '0.86', 'mock'),
+                ('USD', date(2024, 1, 2), '1.09', 'exchangerate'),
+            ]
+        ])
+
+    def test_rows_follow_the_unique_index_order(self):
+        ids = currency_codes.get_ids(['EUR', 'USD', 'GBP'])
+        rows = list(iter_exchange_rates(chunk_size=1))
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows, sorted(rows, key=lambda row: (ids[row[0]], ids[row[1]], row[2], row[4])))
+        self.assertEqual(list(iter_exchange_rates(provider='exchangerate')), [
+            ('EUR', 'USD', date(2024, 1, 2), Decimal('1.09'), 'exchangerate')
+        ])
+
+    def test_csv_values_are_quoted(self):
+        lines = list(stream_csv([('EUR', 'USD', date(2024, 1, 1), Decimal('1.5'), 'a,b')]))
+
+        self.assertEqual(lines[1], 'EUR,USD,2024-01-01,1.5,"a,b"\r\n')
+
+    def test_command_streams_to_stdout(self):
+        stdout = StringIO()
+        call_command('export_rates', '--output-format', 'ndjson', '--target', 'GBP', stdout=stdout)
+
+        self.assertEqual(
+            [json.loads(line) for line in stdout.getvalue().splitlines()],
+            [{
+                'source_currency': 'EUR', 'exchanged_currency': 'GBP', 'valuation_date': '2024-01-01',
+                'rate_value': '0.860000', 'provider': 'mock',
+            }]
+        )
+
+    def test_command_writes_a_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'rates.csv')
+            stdout = StringIO()
+            call_command('export_rates', '--output', path, '--date-from', '2024-01-02', stdout=stdout)
+            with open(path, encoding='utf-8') as output:
+                lines = output.read().splitlines()
+
+        self.assertEqual(lines, [
+            'source_currency,exchanged_currency,valuation_date,rate_value,provider',
+            'EUR,USD,2024-01-02,1.090000,exchangerate',
+        ])
+        self.assertIn('Exported 1 rates', stdout.getvalue())
+
+    def test_command_rejects_an_inverted_range(self):
+        with self.assertRaises(CommandError):
+            call_command('export_rates', '--date-from', '2024-01-02', '--date-to', '2024-01-01')
+
+
+ECB_HISTORY = """<?xml version="1.0" encoding="UTF-8"?>
+<gesmes:Envelope xmlns:gesmes="http://www.gesmes.org/xml/2002-08-01" xmlns="http://www.ecb.int/vocabulary/2002-08-01/eurofxref">
+    <gesmes:subject>Reference rates</gesmes:subject>
+    <gesmes:Sender><gesmes:name>European Central Bank</gesmes:name></gesmes:Sender>
+    <Cube>
+        <Cube time="2024-01-03"><Cube currency="USD" rate="1.0919"/><Cube currency="JPY" rate="155.18"/></Cube>
+        <Cube time="2024-01-02"><Cube currency="USD" rate="1.0956"/><Cube currency="JPY" rate="155.72"/></Cube>
+    </Cube>
+</gesmes:Envelope>
+"""
+
+
+class ImportRatesTests(TestCase):
+    def setUp(self):
+        rate_cache.clear()
+        currency_codes.invalidate()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def _file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as output:
+            output.write(content)
+        return path
+
+    def _import(self, path, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_rates', path, *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def _stored(self, target, valuation_date):
+        return CurrencyExchangeRate.objects.filter(
+            source_currency__code='EUR', exchanged_currency__code=target, valuation_date=valuation_date
+        ).values_list('rate_value', 'provider').get()
+
+    def test_invalid_rows_are_rejected(self):
+        command = ImportRatesCommand()
+        for row in [
+            ('EU', 'USD', '2024-01-01', '1.1', 'mock'),
+            ('EUR', 'US1', '2024-01-01', '1.1', 'mock'),
+            ('EUR', 'eur', '2024-01-01', '1.1', 'mock'),
+            ('EUR', 'USD', '2024-01-01', '0', 'mock'),
+            ('EUR', 'USD', '2024-01-01', '-1', 'mock'),
+            ('EUR', 'USD', '2024-01-01', '1e12', 'mock'),
+            ('EUR', 'USD', '2024-01-01', 'abc', 'mock'),
+            ('EUR', 'USD', '2024-13-01', '1.1', 'mock'),
+            ('EUR', 'USD', '', '1.1', 'mock'),
+            ('EUR', 'USD', '2024-01-01', '1.1', ''),
+        ]:
+            with self.subTest(row=row), self.assertRaises(ValueError):
+                command._clean(*row)
+
+        self.assertEqual(
+            command._clean(' eur', 'usd ', '2024-01-01', ' 1.1234567 ', 'mock'),
+            ('EUR', 'USD', date(2024, 1, 1), Decimal('1.123457'), 'mock')
+        )
+
+    def test_invalid_rows_are_counted_and_skipped(self):
+        path = self._file('rates.csv', (
+            'source_currency,exchanged_currency,valuation_date,rate_value,provider\n'
+            'EUR,USD,2024-01-01,1.10,mock\n'
+            'EUR,EUR,2024-01-01,1,mock\n'
+            'EUR,GBP,2024-01-01,0,mock\n'
+        ))
+
+        stdout, stderr = self._import(path)
+
+        self.assertIn('Loaded 1 rates (2 invalid)', stdout)
+        self.assertIn('Row 3: source and target are both EUR', stderr)
+        self.assertIn('Row 4: rate 0.000000 out of range', stderr)
+
+    def test_last_duplicate_in_the_file_wins(self):
+        path = self._file('rates.csv', (
+            'source_currency,exchanged_currency,valuation_date,rate_value\n'
+            'EUR,USD,2024-01-01,1.10\n'
+            'EUR,GBP,2024-01-01,0.86\n'
+            'EUR,USD,2024-01-01,1.12\n'
+        ))
+
+        self._import(path, '--provider', 'mock')
+
+        self.assertEqual(self._stored('USD', date(2024, 1, 1)), (Decimal('1.12'), 'mock'))
+        self.assertEqual(CurrencyExchangeRate.objects.count(), 2)
+
+    def test_ecb_history(self):
+        path = self._file('eurofxref-hist.xml', ECB_HISTORY)
+
+        self.assertEqual(list(ImportRatesCommand()._read_ecb(path, 'ecb')), [
+            (1, ('EUR', 'USD', '2024-01-03', '1.0919', 'ecb')),
+            (2, ('EUR', 'JPY', '2024-01-03', '155.18', 'ecb')),
+            (3, ('EUR', 'USD', '2024-01-02', '1.0956', 'ecb')),
+            (4, ('EUR', 'JPY', '2024-01-02', '155.72', 'ecb')),
+        ])
+
+        stdout, _ = self._import(path)
+
+        self.assertIn('Loaded 4 rates (0 invalid)', stdout)
+        self.assertEqual(self._stored('JPY', date(2024, 1, 2)), (Decimal('155.72'), 'ecb'))
+
+    def test_import_invalidates_the_cache_and_refreshes_snapshots(self):
+        ensure_currencies(['EUR', 'USD'])
+        day = date(2024, 1, 1)
+        _save_exchange_rates([{
+            'source_currency': 'EUR',
+            'exchanged_currency': 'USD',
+            'valuation_date': day,
+            'rate_value': Decimal('1.10'),
+            'provider': 'mock',
+        }])
+        _get_stored_rate('EUR', 'USD', day)
+        self.assertIsNotNone(rate_cache.get('EUR', 'USD', day))
+
+        self._import(self._file('rates.csv', (
+            'source_currency,exchanged_currency,valuation_date,rate_value,provider\n'
+            'EUR,USD,2024-01-01,1.20,mock\n'
+        )))
+
+        self.assertIsNone(rate_cache.get('EUR', 'USD', day))
+        self.assertEqual(_get_stored_rate('EUR', 'USD', day)['rate_value'], Decimal('1.2'))
+        self.assertEqual(
+            DailyRateSnapshot.objects.get(source_currency='EUR', valuation_date=day).rates,
+            {'USD': ['1.200000', 'mock']}
+        )
+
+
+@override_settings(METRICS={'enabled': True})
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def _lines(self, registry=None):
+        return (registry or self.registry).render().splitlines()
+
+    def test_counter_family_has_help_and_type_lines(self):
+        self.registry.inc('rate_lookups_total', outcome='cache')
+        self.registry.inc('rate_lookups_total', outcome='cache')
+        self.registry.inc('rate_lookups_total', outcome='database')
+
+        lines = self._lines()
+        start = lines.index('# HELP mycurrency_rate_lookups_total Exchange rate lookups, by where the rate was found')
+        self.assertEqual(lines[start + 1:start + 4], [
+            '# TYPE mycurrency_rate_lookups_total counter',
+            'mycurrency_rate_lookups_total{outcome="cache"} 2',
+            'mycurrency_rate_lookups_total{outcome="database"} 1',
+        ])
+
+    def test_label_values_are_escaped(self):
+        self.registry.inc('provider_retries_total', provider='a"b\\c\nd')
+
+        self.assertIn('mycurrency_provider_retries_total{provider="a\\"b\\\\c\\nd"} 1', self._lines())
+
+    def test_histogram_buckets_are_cumulative(self):
+        for value in (0.03, 0.1, 0.3, 20):
+            self.registry.observe('conversion_seconds', value, outcome='success')
+
+        lines = [line for line in self._lines() if line.startswith('mycurrency_conversion_seconds')]
+        self.assertIn('# TYPE mycurrency_conversion_seconds histogram', self._lines())
+        self.assertEqual(lines, [
+            'mycurrency_conversion_seconds_bucket{outcome="success",le="0.005"} 0',
+            'mycurrency_conversion_seconds_bucket{outcome="success",le="0.01"} 0',
+            'mycurrency_conversion_seconds_bucket{outcome="success",le="0.025"} 0',
+            'mycurrency_conversion_seconds_bucket{outcome="success",le="0.05"} 1',
+            'mycurrency_conversion_seconds_bucket{outcome="success",le="0.1"} 2',
+            'mycurrency_conversion_seconds_bucket{outcome="success",le="0.25"} 2',
+            'mycurrency_conversion_seconds_bucket{outcome="success",le="0.5"} 3',
+            'mycurrency_conversion_seconds_bucket{outcome="success",le="1.0"} 3',
+            'mycurrency_conversion_seconds_bucket{outcome="success",le="2.5"} 3',
+            'mycurrency_conversion_seconds_bucket{outcome="success",le="5.0"} 3',
+            'mycurrency_conversion_seconds_bucket{outcome="success",le="10.0"} 3',
+            'mycurrency_conversion_seconds_bucket{outcome="success",le="+Inf"} 4',
+            f'mycurrency_conversion_seconds_sum{{outcome="success"}} {0.03 + 0.1 + 0.3 + 20!r}',
+            'mycurrency_conversion_seconds_count{outcome="success"} 4',
+        ])
+
+    def test_nothing_is_recorded_when_disabled(self):
+        with override_settings(METRICS={'enabled': False}):
+            self.registry.inc('rate_lookups_total', outcome='cache')
+            response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(any(line.startswith('mycurrency_rate_lookups_total') for line in self._lines()))
+
+    def test_middleware_records_requests(self):
+        self.client.get('/api/currencies/')
+        self.client.get('/api/currencies/')
+
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        lines = response.content.decode().splitlines()
+        self.assertIn('mycurrency_http_request_seconds_count{method="GET",status="200",view="currency-list"} 2', lines)
+        self.assertIn('mycurrency_db_queries_per_request_count{view="currency-list"} 2', lines)
+
+
+class CurrencyCodeSignalTests(TestCase):
+    def setUp(self):
+        currency_codes.invalidate()
+        self.eur = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        # A frozen clock rules out the reload on a miss, so only the signal
+        # can refresh the map.
+        clock = mock.patch('core.cache.time.monotonic', return_value=1000.0)
+        clock.start()
+        self.addCleanup(clock.stop)
+        currency_codes.codes()
+
+    def test_creating_a_currency_invalidates_the_map(self):
+        usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+
+        self.assertFalse(currency_codes.is_loaded())
+        self.assertEqual(currency_codes.get_id('USD'), usd.id)
+
+    def test_renaming_a_currency_invalidates_the_map(self):
+        self.eur.code = 'EUX'
+        self.eur.save()
+
+        self.assertFalse(currency_codes.is_loaded())
+        self.assertEqual(currency_codes.get_code(self.eur.id), 'EUX')
+        self.assertIsNone(currency_codes.get_id('EUR'))
+
+    def test_deleting_a_currency_invalidates_the_map(self):
+        currency_id = self.eur.id
+        self.eur.delete()
+
+        self.assertFalse(currency_codes.is_loaded())
+        self.assertIsNone(currency_codes.get_id('EUR'))
+        self.assertIsNone(currency_codes.get_code(currency_id))
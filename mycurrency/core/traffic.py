@@ -0,0 +1,99 @@
+from collections import Counter
+from datetime import date, timedelta
+from typing import List, Tuple
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTraffic:
+    """Counts rate requests per currency pair.
+
+    Counts are buffered in process and added to ``RateRequestStat`` at most
+    once per ``traffic_flush_interval`` seconds, in a single upsert, so
+    recording a request costs a dict update rather than a query.
+    """
+
+    def __init__(self):
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    @property
+    def config(self):
+        return getattr(settings, 'PREFETCH', {})
+
+    def _buffer(self, source_currency: str, exchanged_currency: str) -> bool:
+        if source_currency == exchanged_currency:
+            return False
+        with self._lock:
+            self._pending[(source_currency, exchanged_currency)] += 1
+            return time.monotonic() - self._last_flush >= self.config.get('traffic_flush_interval', 60)
+
+    def record(self, source_currency: str, exchanged_currency: str):
+        if self._buffer(source_currency, exchanged_currency):
+            self.flush()
+
+    async def arecord(self, source_currency: str, exchanged_currency: str):
+        if self._buffer(source_currency, exchanged_currency):
+            await sync_to_async(self.flush)()
+
+    def flush(self):
+        from core.models import RateRequestStat
+
+        with self._lock:
+            pending = self._pending
+            self._pending = Counter()
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return
+        table = RateRequestStat._meta.db_table
+        quote = connection.ops.quote_name
+        today = date.today()
+        # One upsert for every pair, adding to the counts already stored today.
+        rows = ', '.join(['(%s, %s, %s, %s)'] * len(pending))
+        params = [
+            value
+            for (source, target), count in pending.items()
+            for value in (source, target, today, count)
+        ]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {quote(table)} (source_currency, exchanged_currency, day, {quote('count')})
+                    VALUES {rows}
+                    ON CONFLICT (source_currency, exchanged_currency, day)
+                    DO UPDATE SET {quote('count')} = {quote(table)}.{quote('count')} + EXCLUDED.{quote('count')}
+                    """,
+                    params
+                )
+        except Exception as e:
+            logger.warning(f"Could not store request traffic: {str(e)}")
+
+    def top_pairs(self, days: int, limit: int, min_requests: int = 1) -> List[Tuple[str, str]]:
+        """Most requested pairs over the last ``days`` days, busiest first."""
+        from core.models import RateRequestStat
+
+        rows = RateRequestStat.objects.filter(
+            day__gte=date.today() - timedelta(days=days)
+        ).values(
+            'source_currency', 'exchanged_currency'
+        ).annotate(
+            requests=Sum('count')
+        ).filter(
+            requests__gte=min_requests
+        ).order_by('-requests', 'source_currency', 'exchanged_currency')[:limit]
+
+        return [(row['source_currency'], row['exchanged_currency']) for row in rows]
+
+
+request_traffic = RequestTraffic()
@@ -1 +1,12 @@
-from django.shortcuts import render
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+
+from core.metrics import metrics, metrics_enabled
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus text exposition of this process's metrics."""
+    if not metrics_enabled():
+        raise Http404
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -27,6 +27,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,28 +85,201 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+PROVIDER_HTTP_CONFIG = {
+    'pool_connections': 4,
+    'pool_maxsize': int(os.getenv('PROVIDER_HTTP_POOL_MAXSIZE', '20')),
+    'connect_timeout': float(os.getenv('PROVIDER_HTTP_CONNECT_TIMEOUT', '3.05')),
+    'read_timeout': float(os.getenv('PROVIDER_HTTP_READ_TIMEOUT', '10')),
+    'max_retries': int(os.getenv('PROVIDER_HTTP_MAX_RETRIES', '2')),
+    'backoff_factor': 0.3,
+    'retry_statuses': [429, 500, 502, 503, 504],
+    # Longest wait honoured for a Retry-After header before retrying.
+    'max_retry_after': float(os.getenv('PROVIDER_HTTP_MAX_RETRY_AFTER', '2')),
+}
+
+# Per-provider call budgets; batch traffic (backfills, prefetch) may not use
+# the interactive_reserve share of the bucket or of the monthly quota.
+PROVIDER_RATE_LIMITS = {
+    'per_minute': int(os.getenv('PROVIDER_RATE_LIMIT_PER_MINUTE', '60')),
+    'burst': None,
+    'monthly_quota': int(os.getenv('PROVIDER_MONTHLY_QUOTA', '0')),
+    'interactive_reserve': float(os.getenv('PROVIDER_INTERACTIVE_RESERVE', '0.2')),
+}
+
 CURRENCY_PROVIDERS = {
     'currencybeacon': {
         'active': True,
         'priority': 1,
         'api_key': os.getenv('CURRENCYBEACON_API_KEY'),
+        'base_url': os.getenv('CURRENCYBEACON_BASE_URL', 'https://api.currencybeacon.com/v1'),
+        'http': PROVIDER_HTTP_CONFIG,
+        'limits': PROVIDER_RATE_LIMITS,
+        'publish_time': os.getenv('CURRENCYBEACON_PUBLISH_TIME', '00:05'),
     },
     'exchangerate': {
         'active': True,
         'priority': 2,
         'api_key': os.getenv('EXCHANGE_RATE_API_KEY'),
+        'base_url': os.getenv('EXCHANGERATE_BASE_URL', 'https://v6.exchangerate-api.com/v6'),
+        'http': PROVIDER_HTTP_CONFIG,
+        'limits': PROVIDER_RATE_LIMITS,
+        'publish_time': os.getenv('EXCHANGERATE_PUBLISH_TIME', '00:10'),
     },
     'openexchangerates': {
         'active': True,
         'priority': 3,
         'api_key': os.getenv('OPENEXCHANGERATES_API_KEY'),
+        'base_url': os.getenv('OPENEXCHANGERATES_BASE_URL', 'https://openexchangerates.org/api'),
+        'http': PROVIDER_HTTP_CONFIG,
+        'limits': PROVIDER_RATE_LIMITS,
+        'publish_time': os.getenv('OPENEXCHANGERATES_PUBLISH_TIME', '00:05'),
     },
     'mock': {
         'active': True,
         'priority': 4,
+        # Synthetic rates are reproducible for a given seed.
+        'seed': int(os.getenv('MOCK_PROVIDER_SEED', '42')),
+        'volatility': float(os.getenv('MOCK_PROVIDER_VOLATILITY', '0.004')),
     },
 }
 
+RATES_LIST_STREAM_THRESHOLD_DAYS = int(os.getenv('RATES_LIST_STREAM_THRESHOLD_DAYS', '90'))
+
+CONVERT_BATCH_MAX_ITEMS = int(os.getenv('CONVERT_BATCH_MAX_ITEMS', '100'))
+
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', '100'))
+
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', '1000'))
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+RATE_CACHE = {
+    'enabled': True,
+    'max_entries': int(os.getenv('RATE_CACHE_MAX_ENTRIES', '10000')),
+    'today_ttl': int(os.getenv('RATE_CACHE_TODAY_TTL', '60')),
+    'historical_ttl': int(os.getenv('RATE_CACHE_HISTORICAL_TTL', str(60 * 60 * 24 * 30))),
+    # Cap on the in-process tier's TTL: invalidations do not reach the other
+    # processes' local entries, which may serve a corrected rate this long.
+    'local_ttl': int(os.getenv('RATE_CACHE_LOCAL_TTL', '300')),
+    # Derived cross rates are not invalidated when their legs change.
+    'derived_ttl': int(os.getenv('RATE_CACHE_DERIVED_TTL', '60')),
+    'shared': os.getenv('RATE_CACHE_SHARED', 'False') == 'True',
+    'cache_alias': 'default',
+}
+
+TIMESERIES = {
+    'max_days': int(os.getenv('TIMESERIES_MAX_DAYS', '3660')),
+    'lookback_days': int(os.getenv('TIMESERIES_LOOKBACK_DAYS', '7')),
+}
+
+CROSS_RATES = {
+    'enabled': os.getenv('CROSS_RATES_ENABLED', 'False') == 'True',
+    'base_currency': os.getenv('CROSS_RATES_BASE_CURRENCY', 'EUR'),
+    'max_hops': int(os.getenv('CROSS_RATES_MAX_HOPS', '2')),
+}
+
+PROVIDER_FALLBACK = {
+    'mode': os.getenv('PROVIDER_FALLBACK_MODE', 'sequential'),
+    'hedge_delay': float(os.getenv('PROVIDER_HEDGE_DELAY', '0.25')),
+    'max_concurrency': int(os.getenv('PROVIDER_HEDGE_MAX_CONCURRENCY', '2')),
+    # Threads shared by all hedged calls of a process.
+    'executor_workers': int(os.getenv('PROVIDER_HEDGE_EXECUTOR_WORKERS', '32')),
+}
+
+SINGLE_FLIGHT = {
+    'enabled': os.getenv('SINGLE_FLIGHT_ENABLED', 'True') == 'True',
+    'distributed': os.getenv('SINGLE_FLIGHT_DISTRIBUTED', 'False') == 'True',
+    'cache_alias': 'default',
+    'lock_ttl': int(os.getenv('SINGLE_FLIGHT_LOCK_TTL', '15')),
+    'wait_timeout': float(os.getenv('SINGLE_FLIGHT_WAIT_TIMEOUT', '10')),
+    'poll_interval': float(os.getenv('SINGLE_FLIGHT_POLL_INTERVAL', '0.1')),
+}
+
+# The prefetched rates reach the web processes through the shared rate cache
+# tier only, so turn on RATE_CACHE['shared'] (Redis) along with it.
+PREFETCH = {
+    'enabled': os.getenv('PREFETCH_ENABLED', 'True') == 'True',
+    # 'traffic' ranks pairs by recent requests and falls back to 'pairs';
+    # 'static' always uses 'pairs'.
+    'source': os.getenv('PREFETCH_SOURCE', 'traffic'),
+    'pairs': [
+        ('EUR', 'USD'), ('EUR', 'GBP'), ('EUR', 'CHF'),
+        ('USD', 'EUR'), ('USD', 'GBP'), ('USD', 'CHF'),
+        ('GBP', 'EUR'), ('GBP', 'USD'), ('CHF', 'EUR'),
+    ],
+    'traffic_days': int(os.getenv('PREFETCH_TRAFFIC_DAYS', '7')),
+    'max_pairs': int(os.getenv('PREFETCH_MAX_PAIRS', '200')),
+    'min_requests': int(os.getenv('PREFETCH_MIN_REQUESTS', '2')),
+    # Minutes to wait after a provider's publish_time before prefetching.
+    'delay_minutes': int(os.getenv('PREFETCH_DELAY_MINUTES', '5')),
+    # Seconds between flushes of the in-process request counters.
+    'traffic_flush_interval': int(os.getenv('PREFETCH_TRAFFIC_FLUSH_INTERVAL', '60')),
+}
+
+PROVIDER_HEALTH = {
+    'enabled': os.getenv('PROVIDER_HEALTH_ENABLED', 'True') == 'True',
+    'consecutive_failures': int(os.getenv('PROVIDER_BREAKER_FAILURES', '5')),
+    'error_rate_threshold': float(os.getenv('PROVIDER_BREAKER_ERROR_RATE', '0.5')),
+    'min_calls': 10,
+    'window': 60,
+    'cooldown': int(os.getenv('PROVIDER_BREAKER_COOLDOWN', '30')),
+    'probe_timeout': 15,
+    'latency_alpha': 0.2,
+    # Move degraded providers behind healthy ones in the fallback chain.
+    'dynamic_order': os.getenv('PROVIDER_DYNAMIC_ORDER', 'True') == 'True',
+    'degraded_error_rate': 0.2,
+    'degraded_latency_ms': 2000,
+}
+
+METRICS = {
+    # Latency histograms and counters served at /metrics, per process.
+    'enabled': os.getenv('METRICS_ENABLED', 'False') == 'True',
+}
+
+RATE_SNAPSHOTS = {
+    # Serve "all rates from a base on a date" reads from DailyRateSnapshot.
+    'enabled': os.getenv('RATE_SNAPSHOTS_ENABLED', 'True') == 'True',
+}
+
+# Monthly partitions of the rates table and their retention (PostgreSQL only,
+# see core.partitions).
+RATE_PARTITIONS = {
+    'months_ahead': int(os.getenv('RATE_PARTITIONS_MONTHS_AHEAD', '3')),
+    # Months after which only the winning provider's rate per pair and date
+    # is kept. Compaction deletes rows, so it is opt-in: 0 keeps every
+    # provider's rate.
+    'compact_after_months': int(os.getenv('RATE_COMPACT_AFTER_MONTHS', '0')),
+    # Months of rates kept; older partitions are detached, or dropped when
+    # drop_expired is set. 0 keeps everything.
+    'retention_months': int(os.getenv('RATE_RETENTION_MONTHS', '0')),
+    'drop_expired': os.getenv('RATE_RETENTION_DROP', 'False') == 'True',
+    # Daily maintenance run by Celery beat (HH:MM in CELERY_TIMEZONE).
+    'maintenance_time': os.getenv('RATE_PARTITIONS_MAINTENANCE_TIME', '03:30'),
+}
+
+RATE_BULK_BATCH_SIZE = int(os.getenv('RATE_BULK_BATCH_SIZE', '1000'))
+
+HISTORICAL_BACKFILL = {
+    'chunk_days': int(os.getenv('BACKFILL_CHUNK_DAYS', '7')),
+    'max_concurrency': int(os.getenv('BACKFILL_MAX_CONCURRENCY', '4')),
+    'slot_lease': 600,
+    'slot_retry_delay': 5,
+}
+
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'memory://')
 CELERY_RESULT_BACKEND = 'django-db'
 CELERY_CACHE_BACKEND = 'django-cache'
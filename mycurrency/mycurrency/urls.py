@@ -1,7 +1,9 @@
 from django.urls import path, include
 from core.admin import admin_site
+from core.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin_site.urls),
     path('api/', include('api.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,137 +1,384 @@
 from abc import ABC, abstractmethod
 from datetime import date
 from decimal import Decimal
-import random
-import requests
+import asyncio
+import time
 from django.conf import settings
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
+
+from core.metrics import metrics
+from .health import provider_health
+from .limits import ProviderThrottled, rate_limiter
+from .sessions import get_session, get_async_client, get_http_config, retry_delay
+from .synthetic import get_synthetic_rates
 
 class ProviderAdapter(ABC):
+    provider_name = None
+
+    def _get(self, url: str, params: Optional[Dict[str, Any]] = None):
+        """GET through the provider's pooled session with its configured timeouts
+        and retries, once the circuit breaker and rate limit budget allow it."""
+        generation = provider_health.admit(self.provider_name)
+        try:
+            if generation is None:
+                raise ProviderThrottled(self.provider_name, 'circuit_open')
+            try:
+                rate_limiter.acquire(self.provider_name)
+            except ProviderThrottled:
+                provider_health.release(self.provider_name, generation)
+                raise
+        except ProviderThrottled as e:
+            metrics.inc('provider_skips_total', provider=self.provider_name, reason=e.reason)
+            raise
+        
+        started = time.perf_counter()
+        try:
+            response = get_session(self.provider_name).get(url, params=params)
+        except Exception as e:
+            elapsed = time.perf_counter() - started
+            provider_health.record_failure(self.provider_name, elapsed, str(e), generation)
+            metrics.observe('provider_request_seconds', elapsed, provider=self.provider_name, outcome='error')
+            raise
+        elapsed = time.perf_counter() - started
+        provider_health.record_response(self.provider_name, elapsed, response.status_code, generation)
+        metrics.observe('provider_request_seconds', elapsed, provider=self.provider_name,
+                        outcome=_response_outcome(response.status_code))
+        return response
+
+    async def _aget(self, url: str, params: Optional[Dict[str, Any]] = None):
+        """GET through the provider's pooled async client, retrying on the
+        configured statuses with exponential backoff or the capped Retry-After
+        wait. Every retry is taken from the rate limit budget."""
+        generation = await provider_health.aadmit(self.provider_name)
+        try:
+            if generation is None:
+                raise ProviderThrottled(self.provider_name, 'circuit_open')
+            try:
+                await rate_limiter.aacquire(self.provider_name)
+            except ProviderThrottled:
+                await provider_health.arelease(self.provider_name, generation)
+                raise
+        except ProviderThrottled as e:
+            metrics.inc('provider_skips_total', provider=self.provider_name, reason=e.reason)
+            raise
+        config = get_http_config(self.provider_name)
+        client = get_async_client(self.provider_name)
+        
+        started = time.perf_counter()
+        try:
+            for attempt in range(config['max_retries'] + 1):
+                response = await client.get(url, params=params)
+                if response.status_code not in config['retry_statuses'] or attempt == config['max_retries']:
+                    break
+                await asyncio.sleep(retry_delay(config, attempt, response.headers.get('Retry-After')))
+                try:
+                    await rate_limiter.aacquire(self.provider_name)
+                except ProviderThrottled as e:
+                    metrics.inc('provider_skips_total', provider=self.provider_name, reason=e.reason)
+                    break
+                metrics.inc('provider_retries_total', provider=self.provider_name)
+        except Exception as e:
+            elapsed = time.perf_counter() - started
+            await provider_health.arecord_failure(self.provider_name, elapsed, str(e), generation)
+            metrics.observe('provider_request_seconds', elapsed, provider=self.provider_name, outcome='error')
+            raise
+        elapsed = time.perf_counter() - started
+        await provider_health.arecord_response(self.provider_name, elapsed, response.status_code, generation)
+        metrics.observe('provider_request_seconds', elapsed, provider=self.provider_name,
+                        outcome=_response_outcome(response.status_code))
+        return response
+
     @abstractmethod
     def get_exchange_rate(self, source_currency: str, exchanged_currency: str, valuation_date: date) -> Dict[str, Any]:
         """Get exchange rate data from provider."""
         pass
 
-class CurrencyBeaconAdapter(ProviderAdapter):
-    def __init__(self):
-        self.api_key = settings.CURRENCY_PROVIDERS['currencybeacon']['api_key']
-        # Import later from env
-        self.base_url = "https://api.currencybeacon.com/v1"
-        
+    async def aget_exchange_rate(self, source_currency: str, exchanged_currency: str, valuation_date: date) -> Dict[str, Any]:
+        """Async variant of get_exchange_rate."""
+        return await asyncio.to_thread(self.get_exchange_rate, source_currency, exchanged_currency, valuation_date)
+
+    def get_rates(self, source_currency: str, exchanged_currencies: List[str], valuation_date: date) -> Dict[str, Any]:
+        """Get the rates from one base currency to many currencies for a date.
+
+        Providers that can return a whole table in one call override this; the
+        default falls back to one call per pair.
+        """
+        rates = {}
+        provider = None
+        for exchanged_currency in exchanged_currencies:
+            result = self.get_exchange_rate(source_currency, exchanged_currency, valuation_date)
+            if result.get('success'):
+                rates[exchanged_currency] = result['rate_value']
+                provider = result['provider']
+
+        if not rates:
+            return {'success': False, 'error': 'No rates returned by provider'}
+        return _rates_table(source_currency, valuation_date, rates, provider)
+
+    async def aget_rates(self, source_currency: str, exchanged_currencies: List[str], valuation_date: date) -> Dict[str, Any]:
+        """Async variant of get_rates."""
+        return await asyncio.to_thread(self.get_rates, source_currency, exchanged_currencies, valuation_date)
+
+class HTTPProviderAdapter(ProviderAdapter):
+    """Base for providers reached over HTTP.
+
+    Subclasses describe each call with ``_rate_request``/``_rates_request``
+    (returning the URL and query parameters) and turn the decoded JSON into a
+    result with ``_parse_rate``/``_parse_rates``; the sync and async variants
+    share them.
+    """
+
+    @abstractmethod
+    def _rate_request(self, source_currency: str, exchanged_currency: str, valuation_date: date):
+        """URL and query parameters of a single-rate call."""
+        pass
+
+    @abstractmethod
+    def _parse_rate(self, data: Dict[str, Any], source_currency: str, exchanged_currency: str, valuation_date: date) -> Dict[str, Any]:
+        """Turn a single-rate response into a rate result."""
+        pass
+
+    @abstractmethod
+    def _rates_request(self, source_currency: str, exchanged_currencies: List[str], valuation_date: date):
+        """URL and query parameters of a rate table call."""
+        pass
+
+    @abstractmethod
+    def _parse_rates(self, data: Dict[str, Any], source_currency: str, exchanged_currencies: List[str], valuation_date: date) -> Dict[str, Any]:
+        """Turn a rate table response into a rates table result."""
+        pass
+
     def get_exchange_rate(self, source_currency: str, exchanged_currency: str, valuation_date: date) -> Dict[str, Any]:
-        url = f"{self.base_url}/historical"
-        params = {
-            'api_key': self.api_key,
-            'base': source_currency,
-            'symbols': exchanged_currency,
-            'date': valuation_date.strftime('%Y-%m-%d')
-        }
+        url, params = self._rate_request(source_currency, exchanged_currency, valuation_date)
         
         try:
-            response = requests.get(url, params=params)
+            response = self._get(url, params=params)
             response.raise_for_status()
-            data = response.json()
-            
-            if 'rates' in data and exchanged_currency in data['rates']:
-                return {
-                    'source_currency': source_currency,
-                    'exchanged_currency': exchanged_currency,
-                    'valuation_date': valuation_date,
-                    'rate_value': Decimal(str(data['rates'][exchanged_currency])),
-                    'provider': 'currencybeacon',
-                    'success': True
-                }
-            return {'success': False, 'error': 'Invalid response from CurrencyBeacon'}
+            return self._parse_rate(response.json(), source_currency, exchanged_currency, valuation_date)
+        except ProviderThrottled:
+            raise
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
-class ExchangeRateAdapter(ProviderAdapter):
-    def __init__(self):
-        self.api_key = settings.CURRENCY_PROVIDERS['exchangerate']['api_key']
-        # Import later from env
-        self.base_url = "https://v6.exchangerate-api.com/v6"
-        
-    def get_exchange_rate(self, source_currency: str, exchanged_currency: str, valuation_date: date) -> Dict[str, Any]:
-        url = f"{self.base_url}/{self.api_key}/pair/{source_currency}/{exchanged_currency}"
+    async def aget_exchange_rate(self, source_currency: str, exchanged_currency: str, valuation_date: date) -> Dict[str, Any]:
+        url, params = self._rate_request(source_currency, exchanged_currency, valuation_date)
         
         try:
-            response = requests.get(url)
+            response = await self._aget(url, params=params)
             response.raise_for_status()
-            data = response.json()
-            
-            if data.get('result') == 'success' and 'conversion_rate' in data:
-                return {
-                    'source_currency': source_currency,
-                    'exchanged_currency': exchanged_currency,
-                    'valuation_date': valuation_date,
-                    'rate_value': Decimal(str(data['conversion_rate'])),
-                    'provider': 'exchangerate',
-                    'success': True
-                }
-            return {'success': False, 'error': 'Invalid response from ExchangeRate API'}
+            return self._parse_rate(response.json(), source_currency, exchanged_currency, valuation_date)
+        except ProviderThrottled:
+            raise
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
-class OpenExchangeRatesAdapter(ProviderAdapter):
-    def __init__(self):
-        self.api_key = settings.CURRENCY_PROVIDERS['openexchangerates']['api_key']
-        self.base_url = "https://openexchangerates.org/api"
+    def get_rates(self, source_currency: str, exchanged_currencies: List[str], valuation_date: date) -> Dict[str, Any]:
+        url, params = self._rates_request(source_currency, exchanged_currencies, valuation_date)
         
-    def get_exchange_rate(self, source_currency: str, exchanged_currency: str, valuation_date: date) -> Dict[str, Any]:
-        url = f"{self.base_url}/historical/{valuation_date.strftime('%Y-%m-%d')}.json"
-        params = {'app_id': self.api_key}
+        try:
+            response = self._get(url, params=params)
+            response.raise_for_status()
+            return self._parse_rates(response.json(), source_currency, exchanged_currencies, valuation_date)
+        except ProviderThrottled:
+            raise
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    async def aget_rates(self, source_currency: str, exchanged_currencies: List[str], valuation_date: date) -> Dict[str, Any]:
+        url, params = self._rates_request(source_currency, exchanged_currencies, valuation_date)
         
         try:
-            response = requests.get(url, params=params)
+            response = await self._aget(url, params=params)
             response.raise_for_status()
-            data = response.json()
-            
-            if 'rates' in data:
-                if source_currency == 'USD':
-                    rate = Decimal(str(data['rates'].get(exchanged_currency, 0)))
-                elif exchanged_currency == 'USD':
-                    source_rate = Decimal(str(data['rates'].get(source_currency, 0)))
-                    rate = Decimal('1') / source_rate if source_rate else 0
-                else:
-                    source_rate = Decimal(str(data['rates'].get(source_currency, 0)))
-                    target_rate = Decimal(str(data['rates'].get(exchanged_currency, 0)))
-                    rate = target_rate / source_rate if source_rate else 0
-                
-                return {
-                    'source_currency': source_currency,
-                    'exchanged_currency': exchanged_currency,
-                    'valuation_date': valuation_date,
-                    'rate_value': rate,
-                    'provider': 'openexchangerates',
-                    'success': True
-                }
-            return {'success': False, 'error': 'Invalid response from OpenExchangeRates'}
+            return self._parse_rates(response.json(), source_currency, exchanged_currencies, valuation_date)
+        except ProviderThrottled:
+            raise
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
-class MockAdapter(ProviderAdapter):
-    def get_exchange_rate(self, source_currency: str, exchanged_currency: str, valuation_date: date) -> Dict[str, Any]:
-        base_rates = {
-            'EUR': Decimal('1.0'),
-            'USD': Decimal('1.08'),
-            'GBP': Decimal('0.85'),
-            'CHF': Decimal('0.98'),
+def _response_outcome(status_code: int) -> str:
+    return 'success' if status_code < 400 else 'http_error'
+
+def _rates_table(source_currency: str, valuation_date: date, rates: Dict[str, Decimal], provider: str) -> Dict[str, Any]:
+    return {
+        'source_currency': source_currency,
+        'valuation_date': valuation_date,
+        'rates': rates,
+        'provider': provider,
+        'success': True
+    }
+
+class CurrencyBeaconAdapter(HTTPProviderAdapter):
+    provider_name = 'currencybeacon'
+    default_base_url = 'https://api.currencybeacon.com/v1'
+
+    def __init__(self):
+        config = settings.CURRENCY_PROVIDERS['currencybeacon']
+        self.api_key = config['api_key']
+        self.base_url = config.get('base_url', self.default_base_url).rstrip('/')
+        
+    def _rate_request(self, source_currency: str, exchanged_currency: str, valuation_date: date):
+        return self._rates_request(source_currency, [exchanged_currency], valuation_date)
+
+    def _parse_rate(self, data: Dict[str, Any], source_currency: str, exchanged_currency: str, valuation_date: date) -> Dict[str, Any]:
+        if 'rates' in data and exchanged_currency in data['rates']:
+            return {
+                'source_currency': source_currency,
+                'exchanged_currency': exchanged_currency,
+                'valuation_date': valuation_date,
+                'rate_value': Decimal(str(data['rates'][exchanged_currency])),
+                'provider': 'currencybeacon',
+                'success': True
+            }
+        return {'success': False, 'error': 'Invalid response from CurrencyBeacon'}
+
+    def _rates_request(self, source_currency: str, exchanged_currencies: List[str], valuation_date: date):
+        url = f"{self.base_url}/historical"
+        params = {
+            'api_key': self.api_key,
+            'base': source_currency,
+            'symbols': ','.join(exchanged_currencies),
+            'date': valuation_date.strftime('%Y-%m-%d')
         }
+        return url, params
+
+    def _parse_rates(self, data: Dict[str, Any], source_currency: str, exchanged_currencies: List[str], valuation_date: date) -> Dict[str, Any]:
+        if 'rates' in data:
+            rates = {
+                code: Decimal(str(data['rates'][code]))
+                for code in exchanged_currencies
+                if code in data['rates']
+            }
+            return _rates_table(source_currency, valuation_date, rates, 'currencybeacon')
+        return {'success': False, 'error': 'Invalid response from CurrencyBeacon'}
+
+class ExchangeRateAdapter(HTTPProviderAdapter):
+    provider_name = 'exchangerate'
+    default_base_url = 'https://v6.exchangerate-api.com/v6'
+
+    def __init__(self):
+        config = settings.CURRENCY_PROVIDERS['exchangerate']
+        self.api_key = config['api_key']
+        self.base_url = config.get('base_url', self.default_base_url).rstrip('/')
         
-        if source_currency not in base_rates or exchanged_currency not in base_rates:
-            return {'success': False, 'error': 'Currency not supported by Mock provider'}
+    def _rate_request(self, source_currency: str, exchanged_currency: str, valuation_date: date):
+        return f"{self.base_url}/{self.api_key}/pair/{source_currency}/{exchanged_currency}", None
+
+    def _parse_rate(self, data: Dict[str, Any], source_currency: str, exchanged_currency: str, valuation_date: date) -> Dict[str, Any]:
+        if data.get('result') == 'success' and 'conversion_rate' in data:
+            return {
+                'source_currency': source_currency,
+                'exchanged_currency': exchanged_currency,
+                'valuation_date': valuation_date,
+                'rate_value': Decimal(str(data['conversion_rate'])),
+                'provider': 'exchangerate',
+                'success': True
+            }
+        return {'success': False, 'error': 'Invalid response from ExchangeRate API'}
+
+    def _rates_request(self, source_currency: str, exchanged_currencies: List[str], valuation_date: date):
+        if valuation_date < date.today():
+            url = (
+                f"{self.base_url}/{self.api_key}/history/{source_currency}/"
+                f"{valuation_date.year}/{valuation_date.month}/{valuation_date.day}"
+            )
+        else:
+            url = f"{self.base_url}/{self.api_key}/latest/{source_currency}"
+        return url, None
+
+    def _parse_rates(self, data: Dict[str, Any], source_currency: str, exchanged_currencies: List[str], valuation_date: date) -> Dict[str, Any]:
+        if data.get('result') == 'success' and 'conversion_rates' in data:
+            rates = {
+                code: Decimal(str(data['conversion_rates'][code]))
+                for code in exchanged_currencies
+                if code in data['conversion_rates']
+            }
+            return _rates_table(source_currency, valuation_date, rates, 'exchangerate')
+        return {'success': False, 'error': 'Invalid response from ExchangeRate API'}
+
+class OpenExchangeRatesAdapter(HTTPProviderAdapter):
+    provider_name = 'openexchangerates'
+    default_base_url = 'https://openexchangerates.org/api'
+
+    def __init__(self):
+        config = settings.CURRENCY_PROVIDERS['openexchangerates']
+        self.api_key = config['api_key']
+        self.base_url = config.get('base_url', self.default_base_url).rstrip('/')
         
-        source_rate = base_rates[source_currency]
-        target_rate = base_rates[exchanged_currency]
+    def _rate_request(self, source_currency: str, exchanged_currency: str, valuation_date: date):
+        return self._rates_request(source_currency, [exchanged_currency], valuation_date)
+
+    def _parse_rate(self, data: Dict[str, Any], source_currency: str, exchanged_currency: str, valuation_date: date) -> Dict[str, Any]:
+        table = self._parse_rates(data, source_currency, [exchanged_currency], valuation_date)
+        if not table.get('success'):
+            return table
+        if exchanged_currency not in table['rates']:
+            return {'success': False, 'error': f'{exchanged_currency} not available from OpenExchangeRates'}
         
-        variability = Decimal(str(random.uniform(-0.02, 0.02)))
-        rate = (target_rate / source_rate) * (1 + variability)
+        return {
+            'source_currency': source_currency,
+            'exchanged_currency': exchanged_currency,
+            'valuation_date': valuation_date,
+            'rate_value': table['rates'][exchanged_currency],
+            'provider': 'openexchangerates',
+            'success': True
+        }
+
+    def _rates_request(self, source_currency: str, exchanged_currencies: List[str], valuation_date: date):
+        url = f"{self.base_url}/historical/{valuation_date.strftime('%Y-%m-%d')}.json"
+        return url, {'app_id': self.api_key}
+
+    def _parse_rates(self, data: Dict[str, Any], source_currency: str, exchanged_currencies: List[str], valuation_date: date) -> Dict[str, Any]:
+        if 'rates' in data:
+            usd_rates = {code: Decimal(str(value)) for code, value in data['rates'].items()}
+            usd_rates['USD'] = Decimal('1')
+            source_rate = usd_rates.get(source_currency)
+            if not source_rate:
+                return {'success': False, 'error': f'{source_currency} not available from OpenExchangeRates'}
+            
+            rates = {
+                code: usd_rates[code] / source_rate
+                for code in exchanged_currencies
+                if code in usd_rates
+            }
+            
+            return _rates_table(source_currency, valuation_date, rates, 'openexchangerates')
+        return {'success': False, 'error': 'Invalid response from OpenExchangeRates'}
+
+class MockAdapter(ProviderAdapter):
+    """Offline provider serving seeded synthetic rates for every ISO 4217
+    currency (see ``providers.synthetic``), reproducible for a given seed."""
+    provider_name = 'mock'
+
+    def __init__(self):
+        config = settings.CURRENCY_PROVIDERS.get('mock', {})
+        self.rates = get_synthetic_rates(
+            seed=config.get('seed', 0),
+            volatility=config.get('volatility', 0.004)
+        )
+
+    def get_exchange_rate(self, source_currency: str, exchanged_currency: str, valuation_date: date) -> Dict[str, Any]:
+        rates = self.rates.rates(source_currency, [exchanged_currency], valuation_date)
+        if not rates:
+            return {'success': False, 'error': 'Currency not supported by Mock provider'}
         
         return {
             'source_currency': source_currency,
             'exchanged_currency': exchanged_currency,
             'valuation_date': valuation_date,
-            'rate_value': rate.quantize(Decimal('0.000001')),
+            'rate_value': rates[exchanged_currency],
             'provider': 'mock',
             'success': True
-        }
\ No newline at end of file
+        }
+
+    async def aget_exchange_rate(self, source_currency: str, exchanged_currency: str, valuation_date: date) -> Dict[str, Any]:
+        return self.get_exchange_rate(source_currency, exchanged_currency, valuation_date)
+
+    def get_rates(self, source_currency: str, exchanged_currencies: List[str], valuation_date: date) -> Dict[str, Any]:
+        rates = self.rates.rates(source_currency, exchanged_currencies, valuation_date)
+        if not rates:
+            return {'success': False, 'error': 'Currency not supported by Mock provider'}
+        return _rates_table(source_currency, valuation_date, rates, 'mock')
+
+    async def aget_rates(self, source_currency: str, exchanged_currencies: List[str], valuation_date: date) -> Dict[str, Any]:
+        return self.get_rates(source_currency, exchanged_currencies, valuation_date)
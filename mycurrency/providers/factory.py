@@ -1,6 +1,7 @@
 from django.conf import settings
 from typing import List, Dict, Any
 
+from .health import provider_health
 from .adapter import (
     ProviderAdapter,
     CurrencyBeaconAdapter,
@@ -27,7 +28,8 @@ class ProviderFactory:
     
     @staticmethod
     def get_active_providers() -> List[Dict[str, Any]]:
-        """Get all active providers sorted by priority"""
+        """Get all active providers sorted by priority, with degraded and
+        open-circuit providers moved to the back of the chain"""
         providers_config = settings.CURRENCY_PROVIDERS
         active_providers = []
         
@@ -38,4 +40,14 @@ class ProviderFactory:
                     'priority': config.get('priority', 999)
                 })
         
-        return sorted(active_providers, key=lambda x: x['priority'])
\ No newline at end of file
+        active_providers = sorted(active_providers, key=lambda x: x['priority'])
+        order = provider_health.order([provider['name'] for provider in active_providers])
+        return sorted(active_providers, key=lambda x: order.index(x['name']))
+    
+    @staticmethod
+    def get_provider_priorities() -> Dict[str, int]:
+        """Get the configured priority of every provider, active or not"""
+        return {
+            name: config.get('priority', 999)
+            for name, config in settings.CURRENCY_PROVIDERS.items()
+        }
\ No newline at end of file
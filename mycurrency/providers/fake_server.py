@@ -0,0 +1,177 @@
+"""Local HTTP stand-in for the real rate providers, used by the benchmarks.
+
+It answers the CurrencyBeacon, ExchangeRate-API and OpenExchangeRates
+endpoints the adapters call, with the same response shapes, under one path
+prefix per provider::
+
+    http://host:port/currencybeacon/v1
+    http://host:port/exchangerate/v6
+    http://host:port/openexchangerates/api
+
+Each response can be delayed (``latency`` plus up to ``jitter`` seconds) and
+turned into a server error with probability ``error_rate``; providers listed
+in ``down`` always answer 503. Rates come from the seeded synthetic
+generator the mock provider uses, so runs are comparable.
+"""
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit, parse_qs
+import json
+import random
+import threading
+import time
+
+from .synthetic import get_synthetic_rates
+
+FAKE_PROVIDERS = {
+    'currencybeacon': '/currencybeacon/v1',
+    'exchangerate': '/exchangerate/v6',
+    'openexchangerates': '/openexchangerates/api',
+}
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        provider = next(
+            (name for name, prefix in FAKE_PROVIDERS.items() if url.path.startswith(prefix + '/')),
+            None
+        )
+        if provider is None:
+            return self._send(404, {'error': 'unknown endpoint'})
+
+        server.count(provider)
+        delay = server.latency + server.random.uniform(0, server.jitter) if server.jitter else server.latency
+        if delay:
+            time.sleep(delay)
+
+        if provider in server.down:
+            return self._send(503, {'error': 'service unavailable'})
+        if server.error_rate and server.random.random() < server.error_rate:
+            return self._send(500, {'error': 'injected failure'})
+
+        path = url.path[len(FAKE_PROVIDERS[provider]):].strip('/').split('/')
+        try:
+            body = getattr(self, f'_{provider}')(path, params)
+        except (ValueError, IndexError, KeyError, OverflowError):
+            body = None
+        if body is None:
+            return self._send(404, {'error': 'not found'})
+        self._send(200, body)
+
+    def _rates(self, source_currency: str, valuation_date: date) -> Optional[Dict[str, float]]:
+        usd_values = self.server.rates.usd_values(valuation_date)
+        if source_currency not in usd_values:
+            return None
+        source_value = usd_values[source_currency]
+        return {code: value / source_value for code, value in usd_values.items()}
+
+    def _currencybeacon(self, path, params):
+        if path != ['historical']:
+            return None
+        valuation_date = date.fromisoformat(params['date'])
+        rates = self._rates(params['base'], valuation_date)
+        if rates is None:
+            return {'meta': {'code': 200}, 'response': {}, 'rates': {}}
+        symbols = params.get('symbols')
+        if symbols:
+            rates = {code: value for code, value in rates.items() if code in symbols.split(',')}
+        return {
+            'meta': {'code': 200},
+            'response': {'date': valuation_date.isoformat(), 'base': params['base'], 'rates': rates},
+            'date': valuation_date.isoformat(),
+            'base': params['base'],
+            'rates': rates,
+        }
+
+    def _exchangerate(self, path, params):
+        # /{key}/pair/{from}/{to}, /{key}/latest/{from}, /{key}/history/{from}/{y}/{m}/{d}
+        endpoint = path[1]
+        if endpoint == 'pair':
+            rates = self._rates(path[2], date.today())
+            if rates is None or path[3] not in rates:
+                return {'result': 'error', 'error-type': 'unsupported-code'}
+            return {
+                'result': 'success',
+                'base_code': path[2],
+                'target_code': path[3],
+                'conversion_rate': rates[path[3]],
+            }
+        if endpoint == 'latest':
+            valuation_date = date.today()
+        elif endpoint == 'history':
+            valuation_date = date(int(path[3]), int(path[4]), int(path[5]))
+        else:
+            return None
+        rates = self._rates(path[2], valuation_date)
+        if rates is None:
+            return {'result': 'error', 'error-type': 'unsupported-code'}
+        return {'result': 'success', 'base_code': path[2], 'conversion_rates': rates}
+
+    def _openexchangerates(self, path, params):
+        if len(path) != 2 or path[0] != 'historical' or not path[1].endswith('.json'):
+            return None
+        valuation_date = date.fromisoformat(path[1][:-len('.json')])
+        rates = self._rates('USD', valuation_date)
+        return {'timestamp': int(time.time()), 'base': 'USD', 'rates': rates}
+
+    def _send(self, status: int, body: Dict[str, Any]):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    """Threaded fake provider server. ``latency``, ``jitter``, ``error_rate``
+    and ``down`` can be changed while it runs."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, down=(), seed: int = 0):
+        super().__init__((host, port), FakeProviderHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.down = set(down)
+        self.random = random.Random(seed)
+        self.rates = get_synthetic_rates(seed=seed)
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def base_urls(self) -> Dict[str, str]:
+        """base_url to configure for each provider to reach this server."""
+        return {name: self.url + prefix for name, prefix in FAKE_PROVIDERS.items()}
+
+    def count(self, provider: str):
+        with self._lock:
+            self.requests[provider] = self.requests.get(provider, 0) + 1
+
+    def start(self) -> 'FakeProviderServer':
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-providers', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,292 @@
+from typing import Dict, Any, List, Optional
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+DEFAULT_HEALTH_CONFIG = {
+    'enabled': True,
+    'consecutive_failures': 5,
+    'error_rate_threshold': 0.5,
+    'min_calls': 10,
+    'window': 60,
+    'cooldown': 30,
+    'probe_timeout': 15,
+    'latency_alpha': 0.2,
+    'dynamic_order': True,
+    'degraded_error_rate': 0.2,
+    'degraded_latency_ms': 2000,
+}
+
+
+def _new_state() -> Dict[str, Any]:
+    return {
+        'state': CLOSED,
+        'generation': 0,
+        'consecutive_failures': 0,
+        'opened_at': None,
+        'latency_ms': None,
+        'buckets': {},
+        'last_error': None,
+    }
+
+
+class ProviderHealth:
+    """Circuit breaker and health score per provider.
+
+    The breaker opens after ``consecutive_failures`` failed calls in a row, or
+    when at least ``min_calls`` calls in the last ``window`` seconds failed at
+    ``error_rate_threshold`` or more. After ``cooldown`` seconds a single
+    probe call is let through (half-open). Its outcome closes or re-opens
+    the breaker. Latency is tracked as an EWMA.
+
+    Every time the breaker opens its generation goes up. ``admit`` hands out
+    the generation a call runs under, and outcomes of calls admitted under
+    an earlier generation are counted but never move the breaker, so a slow
+    success that started before the breaker opened cannot close it.
+
+    State is kept in the default cache, so it is shared by every process
+    when that cache is Redis. Updates are read-modify-write, so concurrent
+    outcomes can occasionally overwrite each other; only the probe slot,
+    taken with ``cache.add``, needs to be exact.
+    """
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return {**DEFAULT_HEALTH_CONFIG, **getattr(settings, 'PROVIDER_HEALTH', {})}
+
+    def _cache(self):
+        return caches['default']
+
+    @staticmethod
+    def _key(provider_name: str) -> str:
+        return f'provider-health:{provider_name}'
+
+    def _load(self, provider_name: str) -> Dict[str, Any]:
+        try:
+            return self._cache().get(self._key(provider_name)) or _new_state()
+        except Exception as e:
+            logger.warning(f"Provider health store unavailable: {str(e)}")
+            return _new_state()
+
+    def _store(self, provider_name: str, state: Dict[str, Any]):
+        try:
+            self._cache().set(self._key(provider_name), state, None)
+        except Exception as e:
+            logger.warning(f"Provider health store unavailable: {str(e)}")
+
+    def allow(self, provider_name: str) -> bool:
+        """Whether a call to the provider may go ahead now."""
+        return self.admit(provider_name) is not None
+
+    def admit(self, provider_name: str) -> Optional[int]:
+        """The breaker generation a call to the provider goes ahead under, or
+        None when the breaker refuses it. Pass the generation to the record
+        methods, and to ``release`` when the call is not made after all."""
+        config = self.config
+        if not config['enabled']:
+            return 0
+
+        state = self._load(provider_name)
+        generation = state.get('generation', 0)
+        if state['state'] == CLOSED:
+            return generation
+        if time.time() - state['opened_at'] < config['cooldown']:
+            return None
+
+        try:
+            probe = self._cache().add(f'{self._key(provider_name)}:probe', 1, config['probe_timeout'])
+        except Exception as e:
+            logger.warning(f"Provider health store unavailable: {str(e)}")
+            probe = True
+        if not probe:
+            return None
+        if state['state'] != HALF_OPEN:
+            state['state'] = HALF_OPEN
+            self._store(provider_name, state)
+        return generation
+
+    def release(self, provider_name: str, generation: int):
+        """Give back the probe slot of an admitted call that was not made
+        (throttled by the rate limiter, say), so the next call can probe
+        instead of waiting for the slot to time out."""
+        if not self.config['enabled']:
+            return
+        state = self._load(provider_name)
+        if state['state'] == HALF_OPEN and state.get('generation', 0) == generation:
+            self._delete_probe(provider_name)
+
+    def record_failure(self, provider_name: str, latency: float, error: str, generation: Optional[int] = None):
+        self._record(provider_name, latency, error, generation)
+
+    def record_response(self, provider_name: str, latency: float, status_code: int,
+                        generation: Optional[int] = None):
+        """Count server errors and 429s as failures; other statuses mean the
+        provider is up, whatever the payload says."""
+        if status_code >= 500 or status_code == 429:
+            self._record(provider_name, latency, f'HTTP {status_code}', generation)
+        else:
+            self._record(provider_name, latency, None, generation)
+
+    async def aallow(self, provider_name: str) -> bool:
+        return await self._run(self.allow, provider_name)
+
+    async def aadmit(self, provider_name: str) -> Optional[int]:
+        return await self._run(self.admit, provider_name)
+
+    async def arelease(self, provider_name: str, generation: int):
+        await self._run(self.release, provider_name, generation)
+
+    async def arecord_failure(self, provider_name: str, latency: float, error: str,
+                              generation: Optional[int] = None):
+        await self._run(self.record_failure, provider_name, latency, error, generation)
+
+    async def arecord_response(self, provider_name: str, latency: float, status_code: int,
+                               generation: Optional[int] = None):
+        await self._run(self.record_response, provider_name, latency, status_code, generation)
+
+    async def _run(self, method, *args):
+        # Only a network-backed cache needs to leave the event loop.
+        if isinstance(self._cache(), RedisCache):
+            return await sync_to_async(method, thread_sensitive=False)(*args)
+        return method(*args)
+
+    def _record(self, provider_name: str, latency: float, error: Optional[str], generation: Optional[int] = None):
+        config = self.config
+        if not config['enabled']:
+            return
+
+        now = time.time()
+        state = self._load(provider_name)
+
+        latency_ms = latency * 1000
+        alpha = config['latency_alpha']
+        state['latency_ms'] = latency_ms if state['latency_ms'] is None else (
+            alpha * latency_ms + (1 - alpha) * state['latency_ms']
+        )
+
+        second = int(now)
+        buckets = {
+            bucket: counts for bucket, counts in state['buckets'].items()
+            if bucket > second - config['window']
+        }
+        calls, errors = buckets.get(second, (0, 0))
+        buckets[second] = (calls + 1, errors + (1 if error else 0))
+        state['buckets'] = buckets
+
+        previous = state['state']
+        current = state.get('generation', 0)
+        if generation is not None and generation != current:
+            # Admitted before the breaker last opened: counted, but the
+            # breaker is left to the calls of the current generation.
+            self._store(provider_name, state)
+            return
+
+        if error is None:
+            state['consecutive_failures'] = 0
+            if previous != CLOSED:
+                state.update(state=CLOSED, opened_at=None)
+                logger.info(f"Circuit for provider {provider_name} closed")
+        else:
+            state['consecutive_failures'] += 1
+            state['last_error'] = error
+            calls, errors = self._window_counts(state)
+            tripped = (
+                state['consecutive_failures'] >= config['consecutive_failures']
+                or (calls >= config['min_calls'] and errors / calls >= config['error_rate_threshold'])
+            )
+            if previous == HALF_OPEN or (previous == CLOSED and tripped):
+                state.update(state=OPEN, opened_at=now, generation=current + 1)
+                logger.warning(f"Circuit for provider {provider_name} opened: {error}")
+
+        self._store(provider_name, state)
+        if previous == HALF_OPEN:
+            self._delete_probe(provider_name)
+
+    def _delete_probe(self, provider_name: str):
+        try:
+            self._cache().delete(f'{self._key(provider_name)}:probe')
+        except Exception as e:
+            logger.warning(f"Provider health store unavailable: {str(e)}")
+
+    @staticmethod
+    def _window_counts(state: Dict[str, Any]):
+        calls = sum(counts[0] for counts in state['buckets'].values())
+        errors = sum(counts[1] for counts in state['buckets'].values())
+        return calls, errors
+
+    def snapshot(self, provider_names: List[str]) -> List[Dict[str, Any]]:
+        """Current breaker state, error rate and latency of each provider."""
+        config = self.config
+        try:
+            states = self._cache().get_many([self._key(name) for name in provider_names])
+        except Exception as e:
+            logger.warning(f"Provider health store unavailable: {str(e)}")
+            states = {}
+
+        now = time.time()
+        snapshot = []
+        for name in provider_names:
+            state = states.get(self._key(name)) or _new_state()
+            state['buckets'] = {
+                bucket: counts for bucket, counts in state['buckets'].items()
+                if bucket > now - config['window']
+            }
+            calls, errors = self._window_counts(state)
+            error_rate = errors / calls if calls else 0.0
+            latency_ms = state['latency_ms']
+            snapshot.append({
+                'provider': name,
+                'state': state['state'],
+                'consecutive_failures': state['consecutive_failures'],
+                'calls': calls,
+                'errors': errors,
+                'error_rate': error_rate,
+                'latency_ms': latency_ms,
+                'degraded': (
+                    state['state'] != CLOSED
+                    or (calls >= config['min_calls'] and error_rate >= config['degraded_error_rate'])
+                    or (latency_ms is not None and latency_ms >= config['degraded_latency_ms'])
+                ),
+                'opened_at': state['opened_at'],
+                'last_error': state['last_error'],
+            })
+        return snapshot
+
+    def order(self, provider_names: List[str]) -> List[str]:
+        """Reorder providers (given in priority order) by health: healthy
+        providers keep their priority order, degraded ones follow sorted by
+        latency, and providers with an open breaker go last."""
+        if not self.config['enabled'] or not self.config['dynamic_order']:
+            return provider_names
+
+        snapshot = self.snapshot(provider_names)
+
+        def rank(entry):
+            index = provider_names.index(entry['provider'])
+            if entry['state'] == OPEN:
+                return (2, index)
+            if entry['degraded']:
+                score = (entry['latency_ms'] or 0) * (1 + 4 * entry['error_rate'])
+                return (1, score, index)
+            return (0, index)
+
+        return [entry['provider'] for entry in sorted(snapshot, key=rank)]
+
+    def reset(self, provider_name: str):
+        try:
+            self._cache().delete_many([self._key(provider_name), f'{self._key(provider_name)}:probe'])
+        except Exception as e:
+            logger.warning(f"Provider health store unavailable: {str(e)}")
+
+
+provider_health = ProviderHealth()
@@ -0,0 +1,220 @@
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Any, Optional
+import contextvars
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+
+DEFAULT_LIMIT_CONFIG = {
+    'per_minute': 60,
+    'burst': None,
+    'monthly_quota': 0,
+    'interactive_reserve': 0.2,
+}
+
+_traffic_class = contextvars.ContextVar('provider_traffic_class', default=INTERACTIVE)
+
+
+class ProviderThrottled(Exception):
+    """Raised instead of calling a provider whose budget is exhausted, so the
+    fallback chain moves on to the next provider straight away."""
+
+    def __init__(self, provider_name: str, reason: str):
+        super().__init__(f"Provider {provider_name} throttled ({reason})")
+        self.provider_name = provider_name
+        self.reason = reason
+
+
+@contextmanager
+def batch_traffic():
+    """Mark the provider calls made inside the block as batch traffic, which
+    may not use the headroom reserved for interactive requests."""
+    token = _traffic_class.set(BATCH)
+    try:
+        yield
+    finally:
+        _traffic_class.reset(token)
+
+
+def current_traffic_class() -> str:
+    return _traffic_class.get()
+
+
+def get_limit_config(provider_name: str) -> Optional[Dict[str, Any]]:
+    """Merged limits for a provider, or None when it has no 'limits' entry."""
+    provider_config = settings.CURRENCY_PROVIDERS.get(provider_name, {})
+    if provider_config.get('limits') is None:
+        return None
+    return {**DEFAULT_LIMIT_CONFIG, **provider_config['limits']}
+
+
+# KEYS: bucket hash, monthly counter.
+# ARGV: capacity, refill per second, tokens to keep in reserve, monthly
+# quota (0 = none), monthly share available, counter ttl.
+# Returns 1 when a token was taken, 0 when rate limited, -1 when the monthly
+# quota is spent.
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local quota = tonumber(ARGV[4])
+local quota_share = tonumber(ARGV[5])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill)
+
+local result = 1
+if quota > 0 and tonumber(redis.call('GET', KEYS[2]) or '0') >= quota * quota_share then
+    result = -1
+elseif tokens < 1 + reserve then
+    result = 0
+else
+    tokens = tokens - 1
+    if quota > 0 then
+        redis.call('INCR', KEYS[2])
+        redis.call('EXPIRE', KEYS[2], tonumber(ARGV[6]))
+    end
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill) + 60)
+return result
+"""
+
+
+class ProviderRateLimiter:
+    """Token bucket per provider plus a monthly call quota.
+
+    Interactive and batch traffic draw from the same bucket, but batch calls
+    are refused once the bucket (or the monthly quota) is down to the share
+    reserved for interactive calls. State lives in Redis when the default
+    cache is Redis, so the limits hold across workers; otherwise it is kept
+    per process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._monthly = {}
+        self._script = None
+        self._stats = {}
+
+    def _redis(self):
+        cache = caches['default']
+        if isinstance(cache, RedisCache):
+            return cache
+        return None
+
+    def acquire(self, provider_name: str, traffic_class: Optional[str] = None):
+        """Take one call from the provider's budget or raise ProviderThrottled."""
+        config = get_limit_config(provider_name)
+        if config is None:
+            return
+
+        traffic_class = traffic_class or current_traffic_class()
+        capacity = float(config['burst'] or config['per_minute'])
+        refill = config['per_minute'] / 60.0
+        reserve = capacity * config['interactive_reserve'] if traffic_class == BATCH else 0.0
+        quota_share = 1 - config['interactive_reserve'] if traffic_class == BATCH else 1.0
+        month = date.today().strftime('%Y-%m')
+
+        cache = self._redis()
+        try:
+            if cache is not None:
+                result = self._take_shared(cache, provider_name, month, capacity, refill, reserve,
+                                           config['monthly_quota'], quota_share)
+            else:
+                result = self._take_local(provider_name, month, capacity, refill, reserve,
+                                          config['monthly_quota'], quota_share)
+        except Exception as e:
+            # A broken limiter store must not take the providers down with it.
+            logger.warning(f"Provider rate limiter unavailable: {str(e)}")
+            result = 1
+
+        outcome = {1: 'allowed', 0: 'rate_limited', -1: 'quota_exhausted'}[result]
+        self._count(provider_name, traffic_class, outcome)
+        if result != 1:
+            raise ProviderThrottled(provider_name, outcome)
+
+    async def aacquire(self, provider_name: str, traffic_class: Optional[str] = None):
+        if get_limit_config(provider_name) is None:
+            return
+        traffic_class = traffic_class or current_traffic_class()
+        if self._redis() is None:
+            return self.acquire(provider_name, traffic_class)
+        await sync_to_async(self.acquire, thread_sensitive=False)(provider_name, traffic_class)
+
+    def _take_shared(self, cache, provider_name, month, capacity, refill, reserve, quota, quota_share) -> int:
+        if self._script is None:
+            self._script = cache._cache.get_client(write=True).register_script(_TAKE_SCRIPT)
+        keys = [
+            cache.make_key(f'provider-limit:{provider_name}:bucket'),
+            cache.make_key(f'provider-limit:{provider_name}:{month}'),
+        ]
+        client = cache._cache.get_client(keys[0], write=True)
+        return int(self._script(
+            keys=keys,
+            args=[capacity, refill, reserve, quota, quota_share, 60 * 60 * 24 * 32],
+            client=client
+        ))
+
+    def _take_local(self, provider_name, month, capacity, refill, reserve, quota, quota_share) -> int:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(provider_name, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill)
+            used = self._monthly.get((provider_name, month), 0)
+
+            if quota and used >= quota * quota_share:
+                result = -1
+            elif tokens < 1 + reserve:
+                result = 0
+            else:
+                tokens -= 1
+                if quota:
+                    self._monthly[(provider_name, month)] = used + 1
+                result = 1
+
+            self._buckets[provider_name] = (tokens, now)
+        return result
+
+    def _count(self, provider_name: str, traffic_class: str, outcome: str):
+        with self._lock:
+            key = (provider_name, traffic_class, outcome)
+            self._stats[key] = self._stats.get(key, 0) + 1
+
+    def stats(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """Calls allowed and refused by this process, per provider and class."""
+        with self._lock:
+            items = list(self._stats.items())
+        stats = {}
+        for (provider_name, traffic_class, outcome), count in items:
+            stats.setdefault(provider_name, {}).setdefault(traffic_class, {})[outcome] = count
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+            self._monthly.clear()
+
+
+rate_limiter = ProviderRateLimiter()
@@ -0,0 +1,211 @@
+from typing import Dict, Any, List, Optional
+import asyncio
+import threading
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+from core.metrics import metrics
+from .limits import ProviderThrottled, rate_limiter
+
+DEFAULT_HTTP_CONFIG = {
+    'pool_connections': 4,
+    'pool_maxsize': 20,
+    'connect_timeout': 3.05,
+    'read_timeout': 10,
+    'max_retries': 2,
+    'backoff_factor': 0.3,
+    'retry_statuses': [429, 500, 502, 503, 504],
+    'max_retry_after': 2.0,
+}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+class ProviderSession(requests.Session):
+    """Keep-alive session that applies the provider's default timeout to every
+    request unless one is passed explicitly."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class ProviderRetry(Retry):
+    """urllib3 retry policy that waits at most ``max_retry_after`` seconds for
+    a Retry-After header and takes every retry from the provider's rate limit
+    budget; a throttled retry gives up and returns the last response."""
+
+    def __init__(self, *args, provider_name: Optional[str] = None, max_retry_after: Optional[float] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.provider_name = provider_name
+        self.max_retry_after = max_retry_after
+
+    def new(self, **kw):
+        kw.setdefault('provider_name', self.provider_name)
+        kw.setdefault('max_retry_after', self.max_retry_after)
+        return super().new(**kw)
+
+    def get_retry_after(self, response) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        if retry_after is None or self.max_retry_after is None:
+            return retry_after
+        return min(retry_after, self.max_retry_after)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        if self.provider_name is not None:
+            try:
+                rate_limiter.acquire(self.provider_name)
+            except ProviderThrottled as e:
+                metrics.inc('provider_skips_total', provider=self.provider_name, reason=e.reason)
+                reason = error or ResponseError(f'retry throttled ({e.reason})')
+                raise MaxRetryError(_pool, url, reason) from reason
+            metrics.inc('provider_retries_total', provider=self.provider_name)
+        return retry
+
+
+def retry_delay(config: Dict[str, Any], attempt: int, retry_after: Optional[str] = None) -> float:
+    """Seconds to wait before retry ``attempt`` (from 0): the Retry-After
+    header when there is one, capped at ``max_retry_after``, otherwise the
+    exponential backoff."""
+    if retry_after is not None:
+        try:
+            return min(max(0.0, float(retry_after)), config['max_retry_after'])
+        except ValueError:
+            pass
+    return config['backoff_factor'] * (2 ** attempt)
+
+
+def get_http_config(provider_name: str) -> Dict[str, Any]:
+    provider_config = settings.CURRENCY_PROVIDERS.get(provider_name, {})
+    return {**DEFAULT_HTTP_CONFIG, **provider_config.get('http', {})}
+
+
+def _build_session(provider_name: str) -> ProviderSession:
+    config = get_http_config(provider_name)
+    session = ProviderSession(timeout=(config['connect_timeout'], config['read_timeout']))
+
+    retries = ProviderRetry(
+        total=config['max_retries'],
+        backoff_factor=config['backoff_factor'],
+        status_forcelist=config['retry_statuses'],
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+        provider_name=provider_name,
+        max_retry_after=config['max_retry_after'],
+    )
+    adapter = HTTPAdapter(
+        pool_connections=config['pool_connections'],
+        pool_maxsize=config['pool_maxsize'],
+        max_retries=retries,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(provider_name: str) -> ProviderSession:
+    """Return the shared, pooled session for a provider, creating it on first use."""
+    session = _sessions.get(provider_name)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(provider_name)
+            if session is None:
+                session = _build_session(provider_name)
+                _sessions[provider_name] = session
+    return session
+
+
+def get_async_client(provider_name: str) -> httpx.AsyncClient:
+    """Return the pooled async client for a provider on the running event loop.
+
+    httpx clients cannot be shared between event loops, so there is one per
+    loop and provider. ``aclose_sessions`` closes the clients of a loop before
+    it ends; ``close_sessions`` closes all of them.
+    """
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    client = clients.get(provider_name)
+    if client is None:
+        config = get_http_config(provider_name)
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(config['read_timeout'], connect=config['connect_timeout']),
+            limits=httpx.Limits(
+                max_connections=config['pool_maxsize'],
+                max_keepalive_connections=config['pool_maxsize'],
+            ),
+            transport=httpx.AsyncHTTPTransport(retries=config['max_retries']),
+        )
+        clients[provider_name] = client
+    return client
+
+
+def close_sessions():
+    """Close every pooled session and async client. Clients of an event loop
+    that is still open are closed on that loop."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+    try:
+        current_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        current_loop = None
+    for loop, clients in list(_async_clients.items()):
+        for client in clients.values():
+            if loop.is_closed():
+                continue
+            if loop is current_loop:
+                loop.create_task(client.aclose())
+            elif loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            else:
+                loop.run_until_complete(client.aclose())
+    _async_clients.clear()
+
+
+async def aclose_sessions():
+    """Close the async clients of the running event loop."""
+    for client in _async_clients.pop(asyncio.get_running_loop(), {}).values():
+        await client.aclose()
+
+
+def get_pool_stats() -> List[Dict[str, Any]]:
+    """Connection pool statistics for every provider session opened so far."""
+    stats = []
+    for provider_name, session in list(_sessions.items()):
+        seen = set()
+        for adapter in session.adapters.values():
+            if id(adapter) in seen:
+                continue
+            seen.add(id(adapter))
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                stats.append({
+                    'provider': provider_name,
+                    'scheme': pool.scheme,
+                    'host': pool.host,
+                    'port': pool.port,
+                    'connections_opened': pool.num_connections,
+                    'requests': pool.num_requests,
+                    'idle_connections': pool.pool.qsize() if pool.pool is not None else 0,
+                    'max_connections': pool.pool.maxsize if pool.pool is not None else 0,
+                })
+    return stats
@@ -0,0 +1,193 @@
+"""Seeded synthetic exchange rates for the mock provider and the benchmarks.
+
+Every currency has a value in USD that follows a random walk of its log
+from ``EPOCH``, with a daily standard deviation of ``volatility``. Pegged
+currencies follow their anchor at the official parity. All rates come from
+the USD values (``rate = usd[target] / usd[source]``), so triangulating
+through a third currency gives the same rate up to rounding.
+
+The walk is generated in blocks of ``BLOCK_DAYS`` days. The total move of
+each block is drawn first, from a generator seeded only by the seed,
+currency and block number. The daily path inside the block is a Brownian
+bridge between the block's end points, so any date can be produced without
+walking from the epoch. Blocks are built for all currencies at once and
+kept in an LRU cache, which makes whole tables and long series cheap.
+Identical seeds give identical rates in every process.
+"""
+from array import array
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import lru_cache
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional, Tuple
+import math
+import random
+import threading
+
+EPOCH = date(2024, 1, 1)
+BLOCK_DAYS = 256
+RATE_QUANTUM = Decimal('0.000001')
+
+# Units of each currency per USD at the epoch (early 2024): the ISO 4217
+# currencies in circulation, the SDR and the precious metals.
+USD_RATES = {
+    'AFN': 71.0, 'ALL': 93.0, 'AMD': 388.0, 'AOA': 830.0, 'ARS': 870.0,
+    'AUD': 1.52, 'AZN': 1.7, 'BDT': 110.0, 'BIF': 2860.0, 'BOB': 6.91,
+    'BRL': 5.0, 'BWP': 13.6, 'BYN': 3.27, 'CAD': 1.36, 'CDF': 2780.0,
+    'CHF': 0.9, 'CLP': 950.0, 'CNY': 7.23, 'COP': 3900.0, 'CRC': 510.0,
+    'CZK': 23.3, 'DOP': 59.0, 'DZD': 134.5, 'EGP': 47.5, 'ETB': 57.0,
+    'EUR': 0.925, 'FJD': 2.25, 'GBP': 0.79, 'GEL': 2.68, 'GHS': 13.5,
+    'GMD': 67.8, 'GNF': 8600.0, 'GTQ': 7.8, 'GYD': 209.0, 'HNL': 24.7,
+    'HTG': 132.0, 'HUF': 360.0, 'IDR': 15900.0, 'ILS': 3.7, 'INR': 83.3,
+    'IQD': 1310.0, 'IRR': 42000.0, 'ISK': 138.0, 'JMD': 156.0, 'JPY': 151.0,
+    'KES': 131.0, 'KGS': 89.0, 'KHR': 4050.0, 'KPW': 900.0, 'KRW': 1350.0,
+    'KWD': 0.307, 'KZT': 447.0, 'LAK': 21000.0, 'LBP': 89500.0, 'LKR': 300.0,
+    'LRD': 193.0, 'LYD': 4.85, 'MAD': 10.0, 'MDL': 17.7, 'MGA': 4400.0,
+    'MMK': 2100.0, 'MNT': 3380.0, 'MRU': 39.7, 'MUR': 46.0, 'MVR': 15.4,
+    'MWK': 1735.0, 'MXN': 16.6, 'MYR': 4.72, 'MZN': 63.9, 'NGN': 1300.0,
+    'NIO': 36.8, 'NOK': 10.8, 'NZD': 1.66, 'PEN': 3.7, 'PGK': 3.75,
+    'PHP': 56.5, 'PKR': 278.0, 'PLN': 3.98, 'PYG': 7400.0, 'RON': 4.6,
+    'RSD': 108.0, 'RUB': 92.0, 'RWF': 1290.0, 'SBD': 8.45, 'SCR': 13.6,
+    'SDG': 600.0, 'SEK': 10.7, 'SGD': 1.35, 'SLE': 22.7, 'SOS': 571.0,
+    'SRD': 35.0, 'SSP': 1500.0, 'SYP': 13000.0, 'THB': 36.5, 'TJS': 10.9,
+    'TND': 3.12, 'TOP': 2.37, 'TRY': 32.2, 'TTD': 6.78, 'TWD': 32.0,
+    'TZS': 2560.0, 'UAH': 39.2, 'UGX': 3850.0, 'UYU': 38.5, 'UZS': 12600.0,
+    'VES': 36.3, 'VND': 24900.0, 'VUV': 119.0, 'WST': 2.73, 'YER': 250.0,
+    'ZAR': 18.8, 'ZMW': 25.5, 'ZWG': 13.6, 'XDR': 0.757, 'XAU': 0.00043,
+    'XAG': 0.036, 'XPT': 0.00105, 'XPD': 0.001,
+}
+
+# Pegged currencies: anchor currency and units per unit of the anchor.
+PEGS = {
+    'USD': (None, 1.0),
+    'AED': ('USD', 3.6725), 'ANG': ('USD', 1.79), 'AWG': ('USD', 1.79),
+    'BBD': ('USD', 2.0), 'BHD': ('USD', 0.376), 'BMD': ('USD', 1.0),
+    'BSD': ('USD', 1.0), 'BZD': ('USD', 2.0), 'CUP': ('USD', 24.0),
+    'DJF': ('USD', 177.721), 'ERN': ('USD', 15.0), 'HKD': ('USD', 7.8),
+    'JOD': ('USD', 0.709), 'KYD': ('USD', 0.833), 'OMR': ('USD', 0.3845),
+    'PAB': ('USD', 1.0), 'QAR': ('USD', 3.64), 'SAR': ('USD', 3.75),
+    'SVC': ('USD', 8.75), 'TMT': ('USD', 3.5), 'XCD': ('USD', 2.7),
+    'BAM': ('EUR', 1.95583), 'BGN': ('EUR', 1.95583), 'CVE': ('EUR', 110.265),
+    'DKK': ('EUR', 7.46038), 'KMF': ('EUR', 491.96775), 'MKD': ('EUR', 61.5),
+    'STN': ('EUR', 24.5), 'XAF': ('EUR', 655.957), 'XOF': ('EUR', 655.957),
+    'XPF': ('EUR', 119.332),
+    'FKP': ('GBP', 1.0), 'GIP': ('GBP', 1.0), 'SHP': ('GBP', 1.0),
+    'LSL': ('ZAR', 1.0), 'NAD': ('ZAR', 1.0), 'SZL': ('ZAR', 1.0),
+    'BTN': ('INR', 1.0), 'NPR': ('INR', 1.6), 'BND': ('SGD', 1.0),
+    'MOP': ('HKD', 1.03),
+}
+
+CURRENCY_CODES = sorted(set(USD_RATES) | set(PEGS))
+
+
+class SyntheticRates:
+    """Deterministic USD values for every supported currency on any date."""
+
+    def __init__(self, seed: int = 0, volatility: float = 0.004, cached_blocks: int = 32):
+        self.seed = seed
+        self.volatility = volatility
+        self.codes = CURRENCY_CODES
+        self._floating = sorted(USD_RATES)
+        self._starts = {0: [math.log(USD_RATES[code]) for code in self._floating]}
+        self._lock = threading.Lock()
+        self._block = lru_cache(maxsize=cached_blocks)(self._build_block)
+
+    def _rng(self, code: str, block: int) -> random.Random:
+        return random.Random(f'{self.seed}:{code}:{block}')
+
+    def _block_moves(self, block: int) -> List[float]:
+        """Total move of each floating currency's log value over a block."""
+        sigma = self.volatility * math.sqrt(BLOCK_DAYS)
+        return [self._rng(code, block).gauss(0.0, sigma) for code in self._floating]
+
+    def _block_start(self, block: int) -> List[float]:
+        with self._lock:
+            if block in self._starts:
+                return self._starts[block]
+            step = 1 if block > 0 else -1
+            known = max(b for b in self._starts if b < block) if block > 0 else min(b for b in self._starts if b > block)
+            starts = self._starts[known]
+            while known != block:
+                if step > 0:
+                    starts = [start + move for start, move in zip(starts, self._block_moves(known))]
+                else:
+                    starts = [start - move for start, move in zip(starts, self._block_moves(known - 1))]
+                known += step
+                self._starts[known] = starts
+            return starts
+
+    def _build_block(self, block: int) -> List[array]:
+        """Daily log values of every floating currency over one block: a
+        Brownian bridge from the block's start to the next block's start."""
+        starts = self._block_start(block)
+        sigma = self.volatility
+        sigma_block = sigma * math.sqrt(BLOCK_DAYS)
+        columns = []
+        for start, code in zip(starts, self._floating):
+            rng = self._rng(code, block)
+            move = rng.gauss(0.0, sigma_block)
+            walk = list(accumulate(rng.gauss(0.0, sigma) for _ in range(BLOCK_DAYS)))
+            correction = (move - walk[-1]) / BLOCK_DAYS
+            columns.append(array('d', (
+                start + value + correction * (day + 1) for day, value in enumerate(walk)
+            )))
+        return columns
+
+    def usd_values(self, valuation_date: date) -> Dict[str, float]:
+        """Units of each currency per USD on a date."""
+        block, day = divmod((valuation_date - EPOCH).days, BLOCK_DAYS)
+        columns = self._block(block)
+        values = {code: math.exp(column[day]) for code, column in zip(self._floating, columns)}
+
+        pending = dict(PEGS)
+        while pending:
+            for code, (anchor, parity) in list(pending.items()):
+                if anchor is None:
+                    values[code] = parity
+                elif anchor in values:
+                    values[code] = values[anchor] * parity
+                else:
+                    continue
+                del pending[code]
+        return values
+
+    def series(self, date_from: date, date_to: date) -> Iterator[Tuple[date, Dict[str, float]]]:
+        day = date_from
+        while day <= date_to:
+            yield day, self.usd_values(day)
+            day += timedelta(days=1)
+
+    def rates(self, source_currency: str, exchanged_currencies: List[str], valuation_date: date) -> Optional[Dict[str, Decimal]]:
+        """Rates from one currency to others on a date, quantized like stored
+        rates. Unknown targets, and rates too small to store, are left out;
+        None means the source is unknown."""
+        return rates_from_usd(self.usd_values(valuation_date), source_currency, exchanged_currencies)
+
+
+def rates_from_usd(usd_values: Dict[str, float], source_currency: str,
+                   exchanged_currencies: List[str]) -> Optional[Dict[str, Decimal]]:
+    source_value = usd_values.get(source_currency)
+    if source_value is None:
+        return None
+    rates = {}
+    for code in exchanged_currencies:
+        if code not in usd_values:
+            continue
+        rate = Decimal(repr(usd_values[code] / source_value)).quantize(RATE_QUANTUM)
+        if rate > 0:
+            rates[code] = rate
+    return rates
+
+
+_generators = {}
+_generators_lock = threading.Lock()
+
+
+def get_synthetic_rates(seed: int = 0, volatility: float = 0.004) -> SyntheticRates:
+    """Shared generator for a seed and volatility, so its block cache is
+    reused by every adapter instance in the process."""
+    key = (seed, volatility)
+    with _generators_lock:
+        if key not in _generators:
+            _generators[key] = SyntheticRates(seed=seed, volatility=volatility)
+        return _generators[key]
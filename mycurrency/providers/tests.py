@@ -1,2 +1,413 @@
-from django.test import TestCase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import date, timedelta
+from decimal import Decimal
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
 
+from django.core.cache.backends.redis import RedisCache
+from django.test import SimpleTestCase, override_settings
+
+from core.services import get_exchange_rate_table
+
+from .adapter import CurrencyBeaconAdapter, ExchangeRateAdapter, HTTPProviderAdapter, OpenExchangeRatesAdapter
+from .factory import ProviderFactory
+from .health import CLOSED, HALF_OPEN, OPEN, provider_health
+from .limits import BATCH, INTERACTIVE, ProviderRateLimiter, ProviderThrottled, rate_limiter
+from .sessions import aclose_sessions, close_sessions, get_async_client, get_session
+from .synthetic import CURRENCY_CODES, EPOCH, SyntheticRates
+
+try:
+    import fakeredis
+    import lupa  # noqa: F401 (fakeredis needs it to run Lua scripts)
+except ImportError:
+    fakeredis = None
+
+
+class _RetryAfterHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.calls += 1
+        self.send_response(503)
+        self.send_header('Retry-After', '3600')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+def _providers(limits=None, max_retries=2):
+    return {
+        'exchangerate': {
+            'active': True,
+            'priority': 1,
+            'http': {'max_retries': max_retries, 'max_retry_after': 0.05, 'backoff_factor': 0},
+            'limits': limits,
+        },
+    }
+
+
+class ProviderRetryTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _RetryAfterHandler)
+        self.server.calls = 0
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        close_sessions()
+        rate_limiter.reset()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        close_sessions()
+        rate_limiter.reset()
+
+    def test_retry_after_wait_is_capped(self):
+        with override_settings(CURRENCY_PROVIDERS=_providers()):
+            started = time.monotonic()
+            response = get_session('exchangerate').get(self.url)
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.calls, 3)
+        self.assertLess(elapsed, 2)
+
+    def test_retries_are_taken_from_the_rate_limit(self):
+        limits = {'per_minute': 1, 'burst': 2, 'monthly_quota': 0, 'interactive_reserve': 0}
+        with override_settings(CURRENCY_PROVIDERS=_providers(limits=limits, max_retries=5)):
+            # The first call is taken by the adapter; here the session is used
+            # directly, so both tokens go to the retries.
+            response = get_session('exchangerate').get(self.url)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.calls, 3)
+        self.assertEqual(rate_limiter.stats()['exchangerate']['interactive'], {'allowed': 2, 'rate_limited': 1})
+
+
+class AsyncClientTests(SimpleTestCase):
+    def test_close_sessions_closes_async_clients(self):
+        async def open_client():
+            return get_async_client('exchangerate')
+
+        loop = asyncio.new_event_loop()
+        try:
+            client = loop.run_until_complete(open_client())
+            close_sessions()
+            self.assertTrue(client.is_closed)
+            self.assertIsNot(loop.run_until_complete(open_client()), client)
+        finally:
+            close_sessions()
+            loop.close()
+
+    def test_aclose_sessions_closes_the_loop_clients(self):
+        async def run():
+            client = get_async_client('exchangerate')
+            await aclose_sessions()
+            return client
+
+        self.assertTrue(asyncio.run(run()).is_closed)
+
+
+class HTTPProviderAdapterTests(SimpleTestCase):
+    def test_missing_hook_fails_on_creation(self):
+        class IncompleteAdapter(HTTPProviderAdapter):
+            provider_name = 'incomplete'
+
+            def _rate_request(self, source_currency, exchanged_currency, valuation_date):
+                return 'http://example.invalid', {}
+
+        with self.assertRaises(TypeError):
+            IncompleteAdapter()
+
+
+# Recorded rate table responses, trimmed to a few currencies.
+CURRENCYBEACON_HISTORICAL = {
+    'meta': {'code': 200, 'disclaimer': 'Usage subject to terms: https://currencybeacon.com/terms'},
+    'response': {'date': '2024-01-02', 'base': 'EUR', 'rates': {'USD': 1.09565, 'GBP': 0.86553}},
+    'date': '2024-01-02',
+    'base': 'EUR',
+    'rates': {'USD': 1.09565, 'GBP': 0.86553},
+}
+EXCHANGERATE_HISTORY = {
+    'result': 'success',
+    'documentation': 'https://www.exchangerate-api.com/docs',
+    'terms_of_use': 'https://www.exchangerate-api.com/terms',
+    'year': 2024,
+    'month': 1,
+    'day': 2,
+    'base_code': 'EUR',
+    'conversion_rates': {'EUR': 1, 'USD': 1.0956, 'GBP': 0.8655, 'JPY': 155.72},
+}
+OPENEXCHANGERATES_HISTORICAL = {
+    'disclaimer': 'Usage subject to terms: https://openexchangerates.org/terms',
+    'license': 'https://openexchangerates.org/license',
+    'timestamp': 1704239999,
+    'base': 'USD',
+    'rates': {'EUR': 0.8, 'GBP': 0.7, 'JPY': 140.0},
+}
+
+_KEYED_PROVIDERS = {
+    name: {'active': True, 'priority': priority, 'api_key': 'test-key', 'base_url': f'https://{name}.test/api'}
+    for priority, name in enumerate(['currencybeacon', 'exchangerate', 'openexchangerates'], 1)
+}
+
+
+def _recorded(payload):
+    return mock.Mock(status_code=200, json=mock.Mock(return_value=payload))
+
+
+@override_settings(CURRENCY_PROVIDERS=_KEYED_PROVIDERS)
+class RateTableParsingTests(SimpleTestCase):
+    day = date(2024, 1, 2)
+
+    def _get_rates(self, adapter, payload, source, targets, valuation_date=None):
+        with mock.patch.object(adapter, '_get', return_value=_recorded(payload)) as get:
+            table = adapter.get_rates(source, targets, valuation_date or self.day)
+        return table, get.call_args
+
+    def test_currencybeacon_table(self):
+        table, call = self._get_rates(CurrencyBeaconAdapter(), CURRENCYBEACON_HISTORICAL, 'EUR', ['USD', 'GBP', 'CHF'])
+
+        self.assertEqual(call.args[0], 'https://currencybeacon.test/api/historical')
+        self.assertEqual(
+            call.kwargs['params'],
+            {'api_key': 'test-key', 'base': 'EUR', 'symbols': 'USD,GBP,CHF', 'date': '2024-01-02'}
+        )
+        self.assertEqual(table['rates'], {'USD': Decimal('1.09565'), 'GBP': Decimal('0.86553')})
+        self.assertEqual(table['provider'], 'currencybeacon')
+
+    def test_exchangerate_history_url(self):
+        adapter = ExchangeRateAdapter()
+        table, call = self._get_rates(adapter, EXCHANGERATE_HISTORY, 'EUR', ['USD', 'JPY'])
+        _, latest_call = self._get_rates(adapter, EXCHANGERATE_HISTORY, 'EUR', ['USD'], date.today())
+
+        self.assertEqual(call.args[0], 'https://exchangerate.test/api/test-key/history/EUR/2024/1/2')
+        self.assertEqual(latest_call.args[0], 'https://exchangerate.test/api/test-key/latest/EUR')
+        self.assertEqual(table['rates'], {'USD': Decimal('1.0956'), 'JPY': Decimal('155.72')})
+
+    def test_openexchangerates_divides_usd_rates_for_other_bases(self):
+        table, call = self._get_rates(
+            OpenExchangeRatesAdapter(), OPENEXCHANGERATES_HISTORICAL, 'EUR', ['USD', 'GBP', 'JPY', 'CHF']
+        )
+
+        self.assertEqual(call.args[0], 'https://openexchangerates.test/api/historical/2024-01-02.json')
+        self.assertEqual(
+            table['rates'],
+            {'USD': Decimal('1.25'), 'GBP': Decimal('0.875'), 'JPY': Decimal('175')}
+        )
+
+    def test_openexchangerates_unknown_base_fails(self):
+        table, _ = self._get_rates(OpenExchangeRatesAdapter(), OPENEXCHANGERATES_HISTORICAL, 'XYZ', ['USD'])
+
+        self.assertEqual(table, {'success': False, 'error': 'XYZ not available from OpenExchangeRates'})
+
+    def test_invalid_payload_fails(self):
+        table, _ = self._get_rates(ExchangeRateAdapter(), {'result': 'error', 'error-type': 'invalid-key'}, 'EUR', ['USD'])
+
+        self.assertEqual(table, {'success': False, 'error': 'Invalid response from ExchangeRate API'})
+
+    def test_absent_targets_are_reported_missing(self):
+        adapter = OpenExchangeRatesAdapter()
+        with mock.patch.object(adapter, '_get', return_value=_recorded(OPENEXCHANGERATES_HISTORICAL)), \
+                mock.patch.object(ProviderFactory, 'get_provider', return_value=adapter), \
+                mock.patch('core.services._save_exchange_rates') as save:
+            table = get_exchange_rate_table('EUR', ['USD', 'CHF'], self.day, provider='openexchangerates')
+
+        self.assertEqual(table['rates'], {'USD': Decimal('1.25')})
+        self.assertEqual(table['missing'], ['CHF'])
+        self.assertEqual(len(save.call_args.args[0]), 1)
+
+
+def _limited(per_minute=60, burst=None, monthly_quota=0, interactive_reserve=0):
+    limits = {
+        'per_minute': per_minute,
+        'burst': burst,
+        'monthly_quota': monthly_quota,
+        'interactive_reserve': interactive_reserve,
+    }
+    return override_settings(CURRENCY_PROVIDERS={'exchangerate': {'active': True, 'priority': 1, 'limits': limits}})
+
+
+def _take(limiter, traffic_class=INTERACTIVE):
+    try:
+        limiter.acquire('exchangerate', traffic_class)
+    except ProviderThrottled as e:
+        return e.reason
+    return 'allowed'
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LocalRateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.limiter = ProviderRateLimiter()
+        self.now = 1000.0
+        patcher = mock.patch('providers.limits.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_is_the_bucket_size(self):
+        with _limited(per_minute=60, burst=3):
+            outcomes = [_take(self.limiter) for _ in range(4)]
+
+        self.assertEqual(outcomes, ['allowed', 'allowed', 'allowed', 'rate_limited'])
+
+    def test_bucket_refills_at_the_per_minute_rate(self):
+        with _limited(per_minute=60, burst=2):
+            _take(self.limiter)
+            _take(self.limiter)
+            self.assertEqual(_take(self.limiter), 'rate_limited')
+
+            self.now += 1
+            self.assertEqual(_take(self.limiter), 'allowed')
+            self.assertEqual(_take(self.limiter), 'rate_limited')
+
+            # The bucket never holds more than the burst.
+            self.now += 3600
+            outcomes = [_take(self.limiter) for _ in range(3)]
+
+        self.assertEqual(outcomes, ['allowed', 'allowed', 'rate_limited'])
+
+    def test_batch_traffic_leaves_the_reserve_to_interactive_calls(self):
+        with _limited(per_minute=60, burst=5, interactive_reserve=0.4):
+            batch = [_take(self.limiter, BATCH) for _ in range(4)]
+            interactive = [_take(self.limiter) for _ in range(3)]
+
+        self.assertEqual(batch, ['allowed', 'allowed', 'allowed', 'rate_limited'])
+        self.assertEqual(interactive, ['allowed', 'allowed', 'rate_limited'])
+        self.assertEqual(self.limiter.stats()['exchangerate'], {
+            'batch': {'allowed': 3, 'rate_limited': 1},
+            'interactive': {'allowed': 2, 'rate_limited': 1},
+        })
+
+    def test_monthly_quota_keeps_a_share_for_interactive_calls(self):
+        with _limited(per_minute=60, burst=100, monthly_quota=4, interactive_reserve=0.5):
+            batch = [_take(self.limiter, BATCH) for _ in range(3)]
+            interactive = [_take(self.limiter) for _ in range(3)]
+
+        self.assertEqual(batch, ['allowed', 'allowed', 'quota_exhausted'])
+        self.assertEqual(interactive, ['allowed', 'allowed', 'quota_exhausted'])
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis with Lua support is not installed')
+class SharedRateLimiterTests(SimpleTestCase):
+    """The Lua script against an in-memory Redis."""
+
+    def setUp(self):
+        self.cache = RedisCache('redis://localhost:6379/0', {})
+        client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        patcher = mock.patch.object(self.cache._cache, 'get_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('providers.limits.caches', {'default': self.cache})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_workers_share_one_bucket(self):
+        workers = [ProviderRateLimiter(), ProviderRateLimiter()]
+        with _limited(per_minute=1, burst=3):
+            outcomes = [_take(workers[index % 2]) for index in range(4)]
+
+        self.assertEqual(outcomes, ['allowed', 'allowed', 'allowed', 'rate_limited'])
+
+    def test_batch_traffic_leaves_the_reserve_to_interactive_calls(self):
+        limiter = ProviderRateLimiter()
+        with _limited(per_minute=1, burst=4, interactive_reserve=0.5):
+            batch = [_take(limiter, BATCH) for _ in range(3)]
+            interactive = [_take(limiter) for _ in range(3)]
+
+        self.assertEqual(batch, ['allowed', 'allowed', 'rate_limited'])
+        self.assertEqual(interactive, ['allowed', 'allowed', 'rate_limited'])
+
+    def test_monthly_quota(self):
+        limiter = ProviderRateLimiter()
+        with _limited(per_minute=60, burst=100, monthly_quota=2):
+            outcomes = [_take(limiter) for _ in range(3)]
+
+        self.assertEqual(outcomes, ['allowed', 'allowed', 'quota_exhausted'])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PROVIDER_HEALTH={'enabled': True, 'consecutive_failures': 1, 'cooldown': 30}
+)
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        provider_health.reset('exchangerate')
+        self.now = time.time()
+        patcher = mock.patch('providers.health.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _state(self):
+        return provider_health.snapshot(['exchangerate'])[0]['state']
+
+    def _open(self):
+        generation = provider_health.admit('exchangerate')
+        with self.assertLogs('providers.health', 'WARNING'):
+            provider_health.record_failure('exchangerate', 0.1, 'timeout', generation)
+        self.assertEqual(self._state(), OPEN)
+
+    def test_success_admitted_before_the_breaker_opened_is_ignored(self):
+        slow_call = provider_health.admit('exchangerate')
+        self._open()
+
+        provider_health.record_response('exchangerate', 5.0, 200, slow_call)
+        self.assertEqual(self._state(), OPEN)
+
+        self.now += 31
+        probe = provider_health.admit('exchangerate')
+        self.assertIsNotNone(probe)
+        provider_health.record_response('exchangerate', 5.0, 200, slow_call)
+        self.assertEqual(self._state(), HALF_OPEN)
+
+        provider_health.record_response('exchangerate', 0.1, 200, probe)
+        self.assertEqual(self._state(), CLOSED)
+
+    def test_throttled_probe_gives_its_slot_back(self):
+        self._open()
+        self.now += 31
+        limits = {'per_minute': 1, 'burst': 1, 'monthly_quota': 0, 'interactive_reserve': 0}
+        adapter = ExchangeRateAdapter()
+        limiter = ProviderRateLimiter()
+        with override_settings(CURRENCY_PROVIDERS=_providers(limits=limits)), \
+                mock.patch('providers.adapter.rate_limiter', limiter):
+            limiter.acquire('exchangerate')
+            with self.assertRaises(ProviderThrottled) as raised:
+                adapter._get('http://127.0.0.1:1/')
+
+        self.assertEqual(raised.exception.reason, 'rate_limited')
+        self.assertEqual(self._state(), HALF_OPEN)
+        self.assertIsNotNone(provider_health.admit('exchangerate'))
+
+
+class SyntheticRatesTests(SimpleTestCase):
+    # Dates before the epoch, on both sides of a block boundary and far ahead.
+    days = [
+        EPOCH - timedelta(days=700), EPOCH, EPOCH + timedelta(days=255), EPOCH + timedelta(days=256),
+        date(2031, 6, 30),
+    ]
+
+    def _tables(self, generator, days):
+        return {day: generator.rates('EUR', CURRENCY_CODES, day) for day in days}
+
+    def test_same_seed_gives_identical_tables(self):
+        first = self._tables(SyntheticRates(seed=7), self.days)
+        # Walking the blocks in the opposite order must not change any rate.
+        second = self._tables(SyntheticRates(seed=7, cached_blocks=1), reversed(self.days))
+        other_seed = self._tables(SyntheticRates(seed=8), self.days)
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other_seed)
+
+    def test_rates_triangulate_through_usd(self):
+        generator = SyntheticRates(seed=3)
+        for day in self.days:
+            eur = generator.rates('EUR', ['USD', 'GBP'], day)
+            usd = generator.rates('USD', ['GBP'], day)
+            crossed = eur['USD'] * usd['GBP']
+            with self.subTest(day=day):
+                self.assertAlmostEqual(float(eur['GBP']), float(crossed), delta=float(eur['GBP']) * 1e-5)